@@ -0,0 +1,63 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+"""
+Compares the time to change a single env var value in env files of increasing size when the file is rewritten
+atomically and when it is patched in place.
+
+Run from the repository root:
+    python benchmarks/bench_env_patch.py
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from itkconfigurator.changeset import EnvChangeSet
+
+SIZES = [100, 10000, 100000]
+REPEATS = 20
+
+
+def run():
+    print('{:>8} {:>14} {:>14}'.format('vars', 'atomic ms', 'in place ms'))
+
+    for num_vars in SIZES:
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'bench.env'
+
+            with open(path, 'w') as file:
+                file.write('ILP_SECRET=00000000000000000000000000000000\n')
+                for i in range(num_vars):
+                    file.write('VAR_{}=value_{}\n'.format(i, i))
+
+            timings = []
+
+            for in_place in (False, True):
+                start = time.perf_counter()
+
+                for n in range(REPEATS):
+                    change_set = EnvChangeSet([('mc', str(path))])
+                    change_set.set_value('mc', 'ILP_SECRET', '{:032d}'.format(n + 1))
+                    change_set.apply(in_place=in_place)
+
+                timings.append((time.perf_counter() - start) / REPEATS * 1000)
+
+            print('{:>8} {:>14.3f} {:>14.3f}'.format(num_vars, *timings))
+
+
+if __name__ == "__main__":
+    run()
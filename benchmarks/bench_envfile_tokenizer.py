@@ -0,0 +1,67 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+"""
+Measures how long the env file tokenizer takes to stream all records from env files of increasing size.
+
+Run from the repository root:
+    python benchmarks/bench_envfile_tokenizer.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from itkconfigurator.envfile import tokenize_env_bytes
+
+SIZES = [1000, 5000, 20000]
+REPEATS = 5
+
+
+def synthetic_env_bytes(num_vars):
+    lines = []
+
+    for i in range(num_vars):
+        lines.append('# comment for variable {}'.format(i))
+
+        if i % 3 == 0:
+            lines.append('VAR_{}="quoted=value,{}"'.format(i, i))
+        elif i % 3 == 1:
+            lines.append('export VAR_{}=value_{}  # inline comment'.format(i, i))
+        else:
+            lines.append('VAR_{}=http://host/{}#fragment'.format(i, i))
+
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def run():
+    print('{:>8} {:>12}'.format('lines', 'ms'))
+
+    for num_vars in SIZES:
+        data = synthetic_env_bytes(num_vars)
+        best = None
+
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            for _record in tokenize_env_bytes(data):
+                pass
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        print('{:>8} {:>12.3f}'.format(num_vars * 2, best * 1000))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,128 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+"""
+Compares the end-to-end latency of the PKI backends: starting the backend, generating the mTLS artefacts and JWS key
+pair for a DFSP at the paths from the security and non_repudiation schema groups, and shutting the backend down.
+
+The fakevault backend is the vault backend run against FakeVault (see test/fakevault.py) instead of a vault
+container, which shows the cost of PkiTools and its requests without docker. --fake-vault-latency-ms delays each vault
+request to model the round trip to a real vault.
+
+Backends that cannot run here (no docker for vault, no cryptography package for local) are skipped.
+
+Run from the repository root:
+    python benchmarks/bench_pki_backends.py [vault|local|fakevault ...]
+    python benchmarks/bench_pki_backends.py fakevault --fake-vault-latency-ms 2
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# FakeVault is a test helper, not part of the package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'test'))
+
+from fakevault import FakeVault
+from itkconfigurator.configscheme import DEFAULT_SCHEMA_FILENAME, ITKConfigurationScheme
+from itkconfigurator.pkibackend import PKI_BACKENDS, create_pki_backend
+
+ENV_FILENAME = Path(__file__).resolve().parent.parent / 'itkconfigurator' / 'mojaloop-connector.env'
+REPEATS = 3
+FAKE_VAULT_BACKEND = 'fakevault'
+
+
+def create_backend(backend_name, directory, fake_vault):
+    if backend_name == FAKE_VAULT_BACKEND:
+        return fake_vault.create_pki_tools(os.path.join(directory, 'vaultinit.json'))
+
+    return create_pki_backend(backend_name)
+
+
+def provision(backend_name, directory, mtls, jws, fake_vault=None):
+    start = time.perf_counter()
+
+    with create_backend(backend_name, directory, fake_vault) as pki:
+        started = time.perf_counter()
+        paths = [os.path.join(directory, mtls[k]) for k in ('ca_cert_path', 'server_cert_path', 'server_key_path')]
+        pki.create_client_mtls_artefacts(mtls['dfsp_name'], *paths, mtls['dns_names'])
+        pki.create_jws_keypair('bench-jwssigningkey.pem', os.path.join(directory, jws['private_key_path']),
+                               os.path.join(directory, jws['public_key_path']))
+        generated = time.perf_counter()
+
+    stopped = time.perf_counter()
+    return started - start, generated - started, stopped - generated, stopped - start
+
+
+def run(backend_names, fake_vault_latency_secs=0.0):
+    scheme = ITKConfigurationScheme(DEFAULT_SCHEMA_FILENAME, env_files=[('mc', str(ENV_FILENAME))])
+    mtls = scheme.get_mtls_settings()
+    jws = scheme.get_jws_settings()
+    rows = []
+
+    for backend_name in backend_names:
+        directory = tempfile.mkdtemp()
+        fake_vault = None
+
+        for key in ('ca_cert_path', 'server_cert_path', 'server_key_path'):
+            os.makedirs(os.path.dirname(os.path.join(directory, mtls[key])), exist_ok=True)
+        for key in ('private_key_path', 'public_key_path'):
+            os.makedirs(os.path.dirname(os.path.join(directory, jws[key])), exist_ok=True)
+
+        try:
+            if backend_name == FAKE_VAULT_BACKEND:
+                # the sessions after the first find vault initialized, as they would with a vault container
+                fake_vault = FakeVault(latency_secs=fake_vault_latency_secs)
+
+            timings = [provision(backend_name, directory, mtls, jws, fake_vault) for _ in range(REPEATS)]
+            rows.append((backend_name, [sum(t[i] for t in timings) / REPEATS * 1000 for i in range(4)]))
+
+        except Exception as e:
+            print('Skipping {} backend: {}'.format(backend_name, e), file=sys.stderr)
+
+        finally:
+            if fake_vault is not None:
+                fake_vault.close()
+
+            shutil.rmtree(directory)
+
+    print('{:>9} {:>12} {:>12} {:>12} {:>12}'.format('backend', 'start ms', 'generate ms', 'stop ms', 'total ms'))
+
+    for backend_name, timings in rows:
+        print('{:>9} {:>12.1f} {:>12.1f} {:>12.1f} {:>12.1f}'.format(backend_name, *timings))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='PKI backend latency benchmark')
+    parser.add_argument('backends', nargs='*', metavar='backend',
+                        help='{} (default {})'.format(', '.join(PKI_BACKENDS + [FAKE_VAULT_BACKEND]),
+                                                      ' '.join(PKI_BACKENDS)))
+    parser.add_argument('--fake-vault-latency-ms', type=float, default=0.0,
+                        help='delay added to each request to the fake vault')
+    args = parser.parse_args(argv)
+
+    for backend_name in args.backends:
+        if backend_name not in PKI_BACKENDS + [FAKE_VAULT_BACKEND]:
+            parser.error("unknown backend '{}'".format(backend_name))
+
+    run(args.backends or PKI_BACKENDS, args.fake_vault_latency_ms / 1000)
+
+
+if __name__ == "__main__":
+    main()
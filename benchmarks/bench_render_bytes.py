@@ -0,0 +1,187 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+"""
+Counts the bytes the TUI writes to the terminal for each keystroke, which is what makes it lag over slow SSH links.
+
+The TUI is started in a pseudo terminal and driven through a fixed script of keystrokes: moving between the buttons of
+the main window, opening a configuration group, moving between its fields and typing into one. After each keystroke
+everything the TUI writes is read until it has been quiet for a short while and counted.
+
+Run from the repository root:
+    python benchmarks/bench_render_bytes.py
+    python benchmarks/bench_render_bytes.py --max-bytes-per-key 1500
+"""
+
+import argparse
+import fcntl
+import os
+import pty
+import select
+import shutil
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import termios
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+PACKAGE_DIR = REPO_DIR / 'itkconfigurator'
+
+TERMINAL_SIZE = (40, 120)
+START_MARKER = b'Security Tools'
+START_TIMEOUT_SECS = 20
+
+# the TUI has finished drawing once it has written nothing for this long
+QUIET_SECS = 0.25
+
+KEY_DOWN = b'\x1b[B'
+KEY_UP = b'\x1b[A'
+KEY_TAB = b'\t'
+KEY_ENTER = b'\r'
+
+# (scenario name, keystrokes). Scenarios run in order in the one TUI session, each starting where the last left off.
+SCENARIOS = [
+    ('main: next button', [KEY_DOWN] * 6),
+    ('main: previous button', [KEY_UP] * 6),
+    ('main: open group', [KEY_ENTER]),
+    ('group: next field', [KEY_TAB] * 6),
+    ('group: type', [c.encode('ascii') for c in 'abcdefghij']),
+]
+
+
+def get_env(**overrides):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in [str(REPO_DIR), os.environ.get('PYTHONPATH')] if p))
+    env.update(overrides)
+    return env
+
+
+def read_until_quiet(master, quiet_secs=QUIET_SECS):
+    """
+    Reads from master until nothing arrives for quiet_secs. Returns the number of bytes read.
+    """
+    count = 0
+
+    while True:
+        ready, _, _ = select.select([master], [], [], quiet_secs)
+
+        if not ready:
+            return count
+
+        try:
+            data = os.read(master, 65536)
+        except OSError:
+            return count
+
+        if not data:
+            return count
+
+        count += len(data)
+
+
+def wait_for_start(master, proc):
+    output = b''
+    deadline = time.monotonic() + START_TIMEOUT_SECS
+
+    while START_MARKER not in output:
+        if time.monotonic() > deadline or proc.poll() is not None:
+            raise RuntimeError('TUI did not draw its first screen within {} seconds'.format(START_TIMEOUT_SECS))
+
+        ready, _, _ = select.select([master], [], [], 0.05)
+
+        if ready:
+            output += os.read(master, 65536)
+
+    return len(output) + read_until_quiet(master)
+
+
+def measure(scenarios=SCENARIOS):
+    """
+    Runs the TUI through the scenarios. Returns (bytes for the first screen, [(scenario name, [bytes per keystroke])]).
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        env_filename = os.path.join(work_dir, 'mojaloop-connector.env')
+        shutil.copy(PACKAGE_DIR / 'mojaloop-connector.env', env_filename)
+
+        master, slave = pty.openpty()
+        fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack('HHHH', TERMINAL_SIZE[0], TERMINAL_SIZE[1], 0, 0))
+
+        proc = subprocess.Popen([sys.executable, '-c', 'from itkconfigurator.main import main; main()',
+                                 'mc={}'.format(env_filename)],
+                                stdin=slave, stdout=slave, stderr=slave, cwd=work_dir, start_new_session=True,
+                                env=get_env(TERM='xterm-256color', ITK_PKI_BACKEND='vault',
+                                            ITK_SCHEMA_CACHE_DIR=os.path.join(work_dir, 'cache')))
+        os.close(slave)
+
+        try:
+            first_screen = wait_for_start(master, proc)
+            results = []
+
+            for name, keys in scenarios:
+                counts = []
+
+                for key in keys:
+                    os.write(master, key)
+                    counts.append(read_until_quiet(master))
+
+                results.append((name, counts))
+
+        finally:
+            if proc.poll() is None:
+                os.killpg(proc.pid, signal.SIGTERM)
+
+            proc.wait()
+            os.close(master)
+
+    return first_screen, results
+
+
+def run(max_bytes_per_key=None):
+    first_screen, results = measure()
+
+    print('{:<24} {:>8} {:>10} {:>10} {:>10}'.format('scenario', 'keys', 'total', 'mean', 'max'))
+    print('{:<24} {:>8} {:>10}'.format('first screen', '-', first_screen))
+
+    all_counts = []
+
+    for name, counts in results:
+        all_counts.extend(counts)
+        print('{:<24} {:>8} {:>10} {:>10.0f} {:>10}'.format(name, len(counts), sum(counts),
+                                                            sum(counts) / len(counts), max(counts)))
+
+    # opening a form redraws the whole screen, so only count keystrokes that stay on a form
+    per_key = [c for (name, counts) in results if name != 'main: open group' for c in counts]
+    mean = sum(per_key) / len(per_key)
+    print('{:<24} {:>8} {:>10} {:>10.0f}'.format('per keystroke', len(per_key), sum(per_key), mean))
+
+    if max_bytes_per_key is not None and mean > max_bytes_per_key:
+        print('FAIL: {:.0f} bytes per keystroke, over the budget of {}'.format(mean, max_bytes_per_key))
+        return 1
+
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Terminal output per keystroke benchmark for the ITK configurator')
+    parser.add_argument('--max-bytes-per-key', type=float, default=None,
+                        help='exit with 1 if the mean bytes per keystroke is over this')
+    args = parser.parse_args(argv)
+
+    return run(args.max_bytes_per_key)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+"""
+Compares the time taken to load the schema with the pure python YAML loader, with the LibYAML loader, on a cold schema
+cache (parse and write the cache) and on a warm schema cache, for the shipped schema and for synthetic schemas of
+increasing size. Also times constructing an ITKConfigurationScheme, which is what every headless run does, cold and
+warm.
+
+Run from the repository root:
+    python benchmarks/bench_schema_cache.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_schema_index import write_synthetic_files
+from itkconfigurator.configscheme import ITKConfigurationScheme
+from itkconfigurator.schemacache import get_yaml_loader, load_schema
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent / 'itkconfigurator'
+SYNTHETIC_SIZES = [100, 1000, 5000]
+REPEATS = 20
+
+
+def time_ms(func, repeats=REPEATS, setup=None):
+    """
+    Returns the best time of repeats calls of func in milliseconds, calling setup before each one
+    """
+    best = None
+
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best * 1000
+
+
+def bench_schema(label, schema_path, env_path, cache_dir):
+    with open(schema_path, 'rb') as file:
+        data = file.read()
+
+    def clear_cache():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    pure = time_ms(lambda: yaml.load(data, Loader=yaml.SafeLoader), repeats=3)
+    libyaml = time_ms(lambda: yaml.load(data, Loader=get_yaml_loader()))
+    cold = time_ms(lambda: load_schema(schema_path, cache_dir), setup=clear_cache)
+    warm = time_ms(lambda: load_schema(schema_path, cache_dir))
+
+    os.environ['ITK_SCHEMA_CACHE_DIR'] = cache_dir
+    env_files = [('mc', str(env_path))]
+    scheme_cold = time_ms(lambda: ITKConfigurationScheme(schema_path, env_files=env_files), setup=clear_cache)
+    scheme_warm = time_ms(lambda: ITKConfigurationScheme(schema_path, env_files=env_files))
+
+    print('{:<18} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f} {:>14.3f} {:>14.3f}'.format(
+        label, pure, libyaml, cold, warm, scheme_cold, scheme_warm))
+
+
+def run():
+    if get_yaml_loader() is yaml.SafeLoader:
+        print('PyYAML was built without LibYAML; the libyaml column uses the pure python loader')
+
+    print('{:<18} {:>10} {:>10} {:>10} {:>10} {:>14} {:>14}'.format(
+        'schema (ms)', 'pure', 'libyaml', 'cold', 'warm', 'scheme cold', 'scheme warm'))
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache_dir = os.path.join(directory, 'cache')
+        bench_schema('itkschema.yaml', PACKAGE_DIR / 'itkschema.yaml', PACKAGE_DIR / 'mojaloop-connector.env',
+                     cache_dir)
+
+        for num_vars in SYNTHETIC_SIZES:
+            size_dir = os.path.join(directory, str(num_vars))
+            os.mkdir(size_dir)
+            schema_path, env_path = write_synthetic_files(size_dir, num_vars)
+            bench_schema('{} vars'.format(num_vars), schema_path, env_path, cache_dir)
+
+
+if __name__ == "__main__":
+    run()
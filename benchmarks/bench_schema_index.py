@@ -0,0 +1,94 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+"""
+Measures the per-variable cost of loading env files into, and looking values up in, an ITKConfigurationScheme as the
+schema and env files grow. With the schema index in place the per-variable figures should stay roughly flat.
+
+Run from the repository root:
+    python benchmarks/bench_schema_index.py
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from itkconfigurator.configscheme import ITKConfigurationScheme
+
+SIZES = [10, 100, 1000, 5000]
+ITEMS_PER_GROUP = 10
+
+
+def write_synthetic_files(directory, num_vars):
+    groups = []
+
+    for g in range(0, num_vars, ITEMS_PER_GROUP):
+        groups.append({
+            'name': 'Group {}'.format(g),
+            'id': 'group_{}'.format(g),
+            'description': 'Synthetic group',
+            'items': [{
+                'name': 'Item {}'.format(i),
+                'description': 'Synthetic item',
+                'type': 'string',
+                'env_var': {'file': 'mc', 'name': 'VAR_{}'.format(i)},
+                'default': '',
+            } for i in range(g, min(g + ITEMS_PER_GROUP, num_vars))],
+        })
+
+    schema = {'itkconfigschema': {'name': 'Benchmark', 'version': 1.0,
+                                  'configuration': {'envfiles': [{'name': 'mc'}], 'groups': groups}}}
+
+    schema_path = Path(directory) / 'schema.yaml'
+    with open(schema_path, 'w') as file:
+        # the LibYAML dumper keeps generating the largest schemas quick
+        yaml.dump(schema, file, Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper))
+
+    env_path = Path(directory) / 'bench.env'
+    with open(env_path, 'w') as file:
+        for i in range(num_vars):
+            file.write('# synthetic variable {}\nVAR_{}=value_{}\n'.format(i, i, i))
+
+    return schema_path, env_path
+
+
+def run():
+    print('{:>8} {:>16} {:>16}'.format('vars', 'parse us/var', 'lookup us/call'))
+
+    for num_vars in SIZES:
+        with tempfile.TemporaryDirectory() as directory:
+            schema_path, env_path = write_synthetic_files(directory, num_vars)
+
+            scheme = ITKConfigurationScheme(schema_path, env_files=[('mc', str(env_path))])
+
+            start = time.perf_counter()
+            scheme.parse_env_files()
+            parse_elapsed = time.perf_counter() - start
+
+            lookups = [('group_{}'.format(i - i % ITEMS_PER_GROUP), 'Item {}'.format(i)) for i in range(num_vars)]
+            start = time.perf_counter()
+            for group_id, item_name in lookups:
+                scheme.get_config_item_value(group_id, item_name)
+            lookup_elapsed = time.perf_counter() - start
+
+            print('{:>8} {:>16.3f} {:>16.3f}'.format(num_vars, parse_elapsed / num_vars * 1e6,
+                                                     lookup_elapsed / num_vars * 1e6))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,196 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+"""
+Measures startup cost and fails if it goes over budget:
+  - import time of the TUI and headless entry points, taken from python -X importtime in fresh interpreters, and a
+    check that none of the slow, rarely needed modules (docker, hvac, cryptography...) are imported at startup
+  - time from launching the TUI to its first screen being drawn, in a pseudo terminal
+
+Each measurement is the best of --runs fresh processes, so the figures are repeatable on a quiet machine. The exit code
+is 1 if any figure is over budget.
+
+Run from the repository root:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 10 --first-frame-budget-ms 500
+"""
+
+import argparse
+import fcntl
+import os
+import pty
+import select
+import shutil
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import termios
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+PACKAGE_DIR = REPO_DIR / 'itkconfigurator'
+
+# entry point module -> import time budget in milliseconds
+IMPORT_BUDGETS_MS = {
+    'itkconfigurator.main': 150,
+    'itkconfigurator.headless': 80,
+}
+
+# modules that must only be loaded when the operations that need them are used
+DEFERRED_MODULES = ['docker', 'hvac', 'requests', 'cryptography', 'yaml', 'concurrent.futures']
+
+FIRST_FRAME_BUDGET_MS = 300
+
+# text on the first screen the TUI draws
+FIRST_FRAME_MARKER = b'Security Tools'
+FIRST_FRAME_TIMEOUT_SECS = 20
+TERMINAL_SIZE = (40, 120)
+
+
+def get_env(**overrides):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in [str(REPO_DIR), os.environ.get('PYTHONPATH')] if p))
+    env.update(overrides)
+    return env
+
+
+def measure_import(module):
+    """
+    Imports module in a fresh interpreter. Returns (cumulative import time of module in ms, names of all modules the
+    import loaded).
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+                            capture_output=True, text=True, env=get_env(), check=True)
+    elapsed_ms = None
+    imported = set()
+
+    # lines look like "import time:       475 |      73988 |   itkconfigurator.main"
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        _self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        imported.add(name)
+
+        if name == module:
+            elapsed_ms = int(cumulative_us) / 1000
+
+    return elapsed_ms, imported
+
+
+def measure_first_frame(work_dir, env_filename):
+    """
+    Starts the TUI in a pseudo terminal and returns the milliseconds until its first screen has been drawn
+    """
+    master, slave = pty.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack('HHHH', TERMINAL_SIZE[0], TERMINAL_SIZE[1], 0, 0))
+
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', 'from itkconfigurator.main import main; main()',
+                             'mc={}'.format(env_filename)],
+                            stdin=slave, stdout=slave, stderr=slave, cwd=work_dir, start_new_session=True,
+                            env=get_env(TERM='xterm-256color', ITK_SCHEMA_CACHE_DIR=os.path.join(work_dir, 'cache')))
+    os.close(slave)
+
+    output = b''
+    elapsed_ms = None
+
+    try:
+        while time.perf_counter() - start < FIRST_FRAME_TIMEOUT_SECS:
+            ready, _, _ = select.select([master], [], [], 0.05)
+
+            if ready:
+                try:
+                    data = os.read(master, 65536)
+                except OSError:
+                    break
+
+                if not data:
+                    break
+
+                output += data
+
+                if FIRST_FRAME_MARKER in output:
+                    elapsed_ms = (time.perf_counter() - start) * 1000
+                    break
+
+            elif proc.poll() is not None:
+                break
+
+    finally:
+        if proc.poll() is None:
+            os.killpg(proc.pid, signal.SIGTERM)
+
+        proc.wait()
+        os.close(master)
+
+    if elapsed_ms is None:
+        raise RuntimeError('TUI did not draw its first screen within {} seconds'.format(FIRST_FRAME_TIMEOUT_SECS))
+
+    return elapsed_ms
+
+
+def run(runs, import_budgets_ms, first_frame_budget_ms):
+    failures = []
+
+    print('{:<28} {:>10} {:>10}'.format('import', 'best ms', 'budget'))
+
+    for module, budget_ms in import_budgets_ms.items():
+        results = [measure_import(module) for _ in range(runs)]
+        best_ms = min(elapsed_ms for elapsed_ms, _imported in results)
+        print('{:<28} {:>10.1f} {:>10}'.format(module, best_ms, budget_ms))
+
+        if best_ms > budget_ms:
+            failures.append('{} imports in {:.1f}ms, over its {}ms budget'.format(module, best_ms, budget_ms))
+
+        deferred = sorted(m for m in DEFERRED_MODULES if m in results[0][1])
+        if deferred:
+            failures.append('{} imports {} at startup'.format(module, ', '.join(deferred)))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        env_filename = os.path.join(work_dir, 'mojaloop-connector.env')
+        shutil.copy(PACKAGE_DIR / 'mojaloop-connector.env', env_filename)
+
+        # the first launch fills the schema cache; we measure the launches after it
+        measure_first_frame(work_dir, env_filename)
+        best_ms = min(measure_first_frame(work_dir, env_filename) for _ in range(runs))
+
+    print('{:<28} {:>10.1f} {:>10}'.format('TUI first frame', best_ms, first_frame_budget_ms))
+
+    if best_ms > first_frame_budget_ms:
+        failures.append('TUI first frame took {:.1f}ms, over its {}ms budget'.format(best_ms, first_frame_budget_ms))
+
+    for failure in failures:
+        print('FAIL: {}'.format(failure))
+
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Startup time benchmark for the ITK configurator')
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes to measure, the best is reported')
+    parser.add_argument('--main-import-budget-ms', type=float, default=IMPORT_BUDGETS_MS['itkconfigurator.main'])
+    parser.add_argument('--headless-import-budget-ms', type=float,
+                        default=IMPORT_BUDGETS_MS['itkconfigurator.headless'])
+    parser.add_argument('--first-frame-budget-ms', type=float, default=FIRST_FRAME_BUDGET_MS)
+    args = parser.parse_args(argv)
+
+    return run(args.runs, {'itkconfigurator.main': args.main_import_budget_ms,
+                           'itkconfigurator.headless': args.headless_import_budget_ms}, args.first_frame_budget_ms)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
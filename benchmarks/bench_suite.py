@@ -0,0 +1,320 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+"""
+Benchmarks the ITKConfigurationScheme operations the TUI and headless mode depend on, against generated schemas and
+env files of 10 to 100k variables, and compares the results with a stored baseline.
+
+Operations (all times in microseconds, the best of several runs):
+  parse_schema_file_cold   parse the schema with the schema cache turned off
+  parse_schema_file_warm   load the schema from a warm schema cache
+  parse_env_files          read the env files into the scheme
+  has_unsaved_changes      per call, with 1% of the variables edited
+  save_changes             saveChanges() with 1% of the variables edited
+  write_single_env_var     write_single_env_var_value() of one variable, patched in place
+  get_config_item_value    per call, averaged over every variable
+
+Run from the repository root:
+    python benchmarks/bench_suite.py                               # print results
+    python benchmarks/bench_suite.py --save                        # store them as the baseline
+    python benchmarks/bench_suite.py --compare                     # exit 1 if anything regressed on the baseline
+    python benchmarks/bench_suite.py --sizes 10 1000 --compare --threshold 0.5
+
+Every run also times a fixed calibration workload, and when it runs slower than it did for the baseline comparisons
+scale the baseline times up to match, so a busy or throttled machine is not reported as a regression. Sizes with a
+regression are measured again (--confirm-runs) and only regressions that persist are reported. A baseline is still best
+compared on the machine it was recorded on; record a fresh one (--save) before comparing changes on another machine.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_schema_index import ITEMS_PER_GROUP, write_synthetic_files
+from itkconfigurator.configscheme import ITKConfigurationScheme
+
+SIZES = [10, 100, 1000, 10000, 100000]
+
+# each operation runs at least REPEATS times and for at least MIN_RUN_SECS, so that the best run is not taken from a
+# single moment when the machine happened to be busy
+REPEATS = 5
+MIN_RUN_SECS = 0.3
+MAX_REPEATS = 1000
+
+# the generated files go on a memory filesystem where there is one, so that the fsyncs done when env files are saved
+# measure the code rather than the disk
+WORK_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'baselines' / 'bench_suite.json'
+
+# a result is a regression if it is more than THRESHOLD slower than the baseline, and slower by at least
+# MIN_DELTA_US, which keeps timer noise on sub-microsecond operations from being reported
+THRESHOLD = 0.25
+MIN_DELTA_US = 1.0
+
+# sizes with a regression are measured again up to this many times, keeping the best result, before it is reported
+CONFIRM_RUNS = 2
+
+BASELINE_FORMAT = 1
+
+
+def best_us(func, repeats=REPEATS, setup=None, calls=1, min_run_secs=MIN_RUN_SECS):
+    """
+    Returns the best time of at least repeats runs of func in microseconds, divided by calls (the number of operations
+    one run of func performs). Runs continue until min_run_secs have passed. setup is called, untimed, before each run.
+    """
+    best = None
+    count = 0
+    deadline = time.perf_counter() + min_run_secs
+
+    while count < repeats or (time.perf_counter() < deadline and count < MAX_REPEATS):
+        if setup is not None:
+            setup()
+
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        count += 1
+
+    return best / calls * 1000000
+
+
+def calibrate():
+    """
+    Returns the time in microseconds of a fixed workload of the kind the benchmarked operations do (string handling
+    and dictionary lookups), used to allow for the speed of the machine at the time of a run
+    """
+    lines = ['VAR_{}=value_{}'.format(i, i) for i in range(20000)]
+
+    def workload():
+        values = {}
+
+        for line in lines:
+            name, _sep, value = line.partition('=')
+            values[name.strip()] = value.strip()
+
+        return [values['VAR_{}'.format(i)] for i in range(0, 20000, 7)]
+
+    return best_us(workload, repeats=20)
+
+
+def item_key(i):
+    return 'group_{}'.format(i - i % ITEMS_PER_GROUP), 'Item {}'.format(i)
+
+
+def bench_size(num_vars, work_dir):
+    """
+    Returns {operation: microseconds} for a generated schema and env file of num_vars variables
+    """
+    schema_path, env_path = write_synthetic_files(work_dir, num_vars)
+    results = {}
+
+    scheme = ITKConfigurationScheme(schema_path, env_files=[('mc', str(env_path))])
+
+    os.environ['ITK_SCHEMA_CACHE'] = 'off'
+    try:
+        results['parse_schema_file_cold'] = best_us(scheme.parse_schema_file, repeats=3)
+    finally:
+        del os.environ['ITK_SCHEMA_CACHE']
+
+    # the first load fills the cache
+    scheme.parse_schema_file()
+    results['parse_schema_file_warm'] = best_us(scheme.parse_schema_file)
+
+    results['parse_env_files'] = best_us(scheme.parse_env_files)
+
+    # edit 1% of the variables, spread through the schema. Each run saves different values so there is always
+    # something to write.
+    edited = [item_key(i) for i in range(0, num_vars, 100)]
+    run_count = [0]
+
+    def edit_values():
+        run_count[0] += 1
+
+        for group_id, item_name in edited:
+            scheme.config_value_changed(group_id, scheme.config_item_index[(group_id, item_name)],
+                                        'edited_{}'.format(run_count[0]))
+
+    edit_values()
+    calls = 10000
+    results['has_unsaved_changes'] = best_us(lambda: [scheme.has_unsaved_changes() for _ in range(calls)],
+                                             calls=calls)
+
+    results['save_changes'] = best_us(scheme.saveChanges, setup=edit_values)
+
+    var_name = 'VAR_{}'.format(num_vars // 2)
+    results['write_single_env_var'] = best_us(lambda: scheme.write_single_env_var_value(
+        var_name, 'rotated_{}'.format(time.perf_counter_ns())))
+
+    lookups = [item_key(i) for i in range(num_vars)]
+    results['get_config_item_value'] = best_us(
+        lambda: [scheme.get_config_item_value(group_id, item_name) for group_id, item_name in lookups],
+        calls=len(lookups))
+
+    return results
+
+
+def measure(sizes, work_dir=WORK_DIR):
+    """
+    Returns ({operation: {size: microseconds}}, calibration microseconds)
+    """
+    results = {}
+    calibration_us = calibrate()
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as directory:
+        os.environ['ITK_SCHEMA_CACHE_DIR'] = os.path.join(directory, 'cache')
+
+        for num_vars in sizes:
+            size_dir = os.path.join(directory, str(num_vars))
+            os.mkdir(size_dir)
+
+            for operation, elapsed_us in bench_size(num_vars, size_dir).items():
+                results.setdefault(operation, {})[str(num_vars)] = elapsed_us
+
+    # take the faster of the calibrations before and after, as the results are each the best of several runs
+    return results, min(calibration_us, calibrate())
+
+
+def print_results(results, sizes):
+    print('{:<24}'.format('operation (us)') + ''.join('{:>14}'.format(size) for size in sizes))
+
+    for operation, by_size in results.items():
+        print('{:<24}'.format(operation) + ''.join('{:>14.3f}'.format(by_size[str(size)]) for size in sizes))
+
+
+def save_baseline(results, calibration_us, filename):
+    baseline = {
+        'calibration_us': calibration_us,
+        'format': BASELINE_FORMAT,
+        'recorded': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'unit': 'us',
+        'results': results,
+    }
+
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+    with open(filename, 'w') as file:
+        json.dump(baseline, file, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+def load_baseline(filename):
+    with open(filename) as file:
+        baseline = json.load(file)
+
+    if baseline.get('format') != BASELINE_FORMAT:
+        raise ValueError('{} is not a version {} benchmark baseline'.format(filename, BASELINE_FORMAT))
+
+    return baseline
+
+
+def compare(results, baseline_results, threshold=THRESHOLD, min_delta_us=MIN_DELTA_US, speed_factor=1.0):
+    """
+    Returns [(operation, size, baseline us, current us)] for each result that is slower than its baseline by more
+    than threshold (a fraction) and by at least min_delta_us. Baseline times are first multiplied by speed_factor, how
+    much slower the machine is now than when the baseline was recorded. Results missing from the baseline are not
+    compared.
+    """
+    regressions = []
+
+    for operation, by_size in results.items():
+        for size, current_us in by_size.items():
+            baseline_us = baseline_results.get(operation, {}).get(size)
+
+            if baseline_us is None:
+                continue
+
+            baseline_us *= speed_factor
+
+            if current_us > baseline_us * (1 + threshold) and current_us - baseline_us >= min_delta_us:
+                regressions.append((operation, size, baseline_us, current_us))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ITK configuration scheme benchmark suite')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='numbers of variables to benchmark')
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='baseline file to save or compare with')
+    parser.add_argument('--work-dir', default=WORK_DIR,
+                        help='directory to generate the schemas and env files in (default {})'.format(WORK_DIR))
+    parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='exit with 1 if a result regressed on the baseline')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='fraction slower than the baseline that counts as a regression')
+    parser.add_argument('--min-delta-us', type=float, default=MIN_DELTA_US,
+                        help='smallest slowdown in microseconds that counts as a regression')
+    parser.add_argument('--confirm-runs', type=int, default=CONFIRM_RUNS,
+                        help='times to measure a size again before reporting a regression in it')
+    args = parser.parse_args(argv)
+
+    sizes = sorted(args.sizes)
+    results, calibration_us = measure(sizes, args.work_dir)
+    print_results(results, sizes)
+    print('{:<24}{:>14.3f}'.format('calibration', calibration_us))
+
+    if args.save:
+        save_baseline(results, calibration_us, args.baseline)
+        print('Baseline written to {}'.format(args.baseline))
+
+    if args.compare:
+        baseline = load_baseline(args.baseline)
+
+        # only ever allow for the machine being slower than when the baseline was recorded; the calibration is itself
+        # a timing and crediting a fast calibration could turn noise into a reported regression
+        speed_factor = max(calibration_us / baseline['calibration_us'], 1.0)
+        regressions = compare(results, baseline['results'], args.threshold, args.min_delta_us, speed_factor)
+
+        for _ in range(args.confirm_runs):
+            if not regressions:
+                break
+
+            # measure the sizes that regressed again and keep the best of all runs
+            rerun_sizes = sorted({int(size) for _operation, size, _baseline_us, _current_us in regressions})
+            print('Measuring {} vars again to confirm {} regressions'.format(
+                ', '.join(str(size) for size in rerun_sizes), len(regressions)))
+            rerun_results, _calibration_us = measure(rerun_sizes, args.work_dir)
+
+            for operation, by_size in rerun_results.items():
+                for size, elapsed_us in by_size.items():
+                    results[operation][size] = min(results[operation][size], elapsed_us)
+
+            regressions = compare(results, baseline['results'], args.threshold, args.min_delta_us, speed_factor)
+
+        print('Compared with the baseline recorded {} ({}, python {}), baseline times scaled by {:.2f}'.format(
+            baseline['recorded'], baseline['platform'], baseline['python'], speed_factor))
+
+        for operation, size, baseline_us, current_us in regressions:
+            print('REGRESSION: {} with {} vars took {:.3f}us, baseline {:.3f}us adjusted for speed ({:+.0%})'.format(
+                operation, size, current_us, baseline_us, current_us / baseline_us - 1))
+
+        if regressions:
+            return 1
+
+        print('No regressions')
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
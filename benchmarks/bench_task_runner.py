@@ -0,0 +1,69 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+"""
+Compares the per operation overhead of running a PKI or service operation in a new python process, as the
+configurator used to, with running it on the in process task runner. The operation itself does nothing so only the
+overhead is measured: for a subprocess that is interpreter startup and importing the docker and vault clients.
+
+Run from the repository root:
+    python benchmarks/bench_task_runner.py
+"""
+
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from itkconfigurator.taskrunner import TaskRunner
+
+REPEATS = 10
+
+
+class NoopBackend:
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def noop(self):
+        print('done')
+
+
+def run():
+    repo_dir = str(Path(__file__).resolve().parent.parent)
+    command = [sys.executable, '-u', '-c', 'import itkconfigurator.pkitools, itkconfigurator.servicemanager; '
+                                          'print("done")']
+
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        subprocess.run(command, cwd=repo_dir, check=True, stdout=subprocess.PIPE)
+    subprocess_ms = (time.perf_counter() - start) / REPEATS * 1000
+
+    runner = TaskRunner(pki_factory=NoopBackend)
+
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        task = runner.run_pki('noop')
+        list(task.iter_output())
+    runner_ms = (time.perf_counter() - start) / REPEATS * 1000
+
+    runner.close()
+
+    print('{:>12} {:>14}'.format('', 'overhead ms'))
+    print('{:>12} {:>14.3f}'.format('subprocess', subprocess_ms))
+    print('{:>12} {:>14.3f}'.format('task runner', runner_ms))
+
+
+if __name__ == "__main__":
+    run()
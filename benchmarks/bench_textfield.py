@@ -0,0 +1,191 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+"""
+Measures the cost of a keystroke in an ITKTextfield (handling the key, drawing the field and refreshing the form) for
+values of increasing length, typing at the end and in the middle of the value and deleting, and the cost of a paste
+of PASTE_LENGTH characters. A keystroke should cost the same however long the value is; the exit code is 1 if typing
+into the longest value costs more than --max-ratio times typing into the shortest.
+
+The field needs a terminal, so the measurements run in a child process in a pseudo terminal.
+
+Run from the repository root:
+    python benchmarks/bench_textfield.py
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import pty
+import struct
+import subprocess
+import sys
+import tempfile
+import termios
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+VALUE_LENGTHS = [10, 100, 2048, 100000]
+KEYSTROKES = 500
+PASTE_LENGTH = 2048
+MAX_RATIO = 3
+TERMINAL_SIZE = (40, 120)
+
+
+def time_us(func, repeats=KEYSTROKES, setup=None):
+    """
+    Returns the mean time of repeats calls of func in microseconds, calling setup (untimed) before each one
+    """
+    total = 0
+
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+
+        start = time.perf_counter()
+        func()
+        total += time.perf_counter() - start
+
+    return total / repeats * 1000000
+
+
+def measure_in_terminal(screen):
+    import npyscreen
+
+    from itkconfigurator.customclasses import ITKColorTheme, ITKTitleText
+
+    npyscreen.setTheme(ITKColorTheme)
+    form = npyscreen.Form()
+    entry = form.add(ITKTitleText, name='Hub Endpoint').entry_widget
+    entry.editing = True
+    # as after reading an ascii key from the terminal
+    entry._last_get_ch_was_unicode = False
+    paste = ','.join('dns{}.example.com'.format(n) for n in range(PASTE_LENGTH))[:PASTE_LENGTH]
+    results = []
+
+    def keystroke(handler, key):
+        handler(key)
+        entry.update()
+        form.refresh()
+
+    for length in VALUE_LENGTHS:
+        result = {'length': length}
+
+        for name, cursor_position in (('type_end_us', length), ('type_middle_us', length // 2)):
+            entry.value = 'a' * length
+            entry.cursor_position = cursor_position
+            result[name] = time_us(lambda: keystroke(entry.h_addch, ord('b')))
+
+        entry.value = 'a' * length
+        entry.cursor_position = length
+        result['delete_us'] = time_us(lambda: keystroke(entry.h_delete_left, None), repeats=min(KEYSTROKES, length))
+
+        def reset_value():
+            entry.value = 'a' * length
+            entry.cursor_position = length
+
+        result['paste_us'] = time_us(lambda: keystroke(entry.insert_text, paste), repeats=20, setup=reset_value)
+        results.append(result)
+
+    return results
+
+
+def run_child(result_filename):
+    import npyscreen
+
+    results = npyscreen.wrapper_basic(measure_in_terminal)
+
+    with open(result_filename, 'w') as file:
+        json.dump(results, file)
+
+
+def measure():
+    master, slave = pty.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack('HHHH', TERMINAL_SIZE[0], TERMINAL_SIZE[1], 0, 0))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        result_filename = os.path.join(work_dir, 'results.json')
+        env = dict(os.environ, TERM='xterm-256color',
+                   PYTHONPATH=os.pathsep.join(p for p in [str(REPO_DIR), os.environ.get('PYTHONPATH')] if p))
+        proc = subprocess.Popen([sys.executable, __file__, '--child', result_filename], stdin=slave, stdout=slave,
+                                stderr=slave, env=env, start_new_session=True)
+        os.close(slave)
+
+        # keep the terminal drained so the child never blocks writing to it; the tail is kept for error reports
+        output = b''
+
+        while True:
+            try:
+                data = os.read(master, 65536)
+            except OSError:
+                break
+
+            if not data:
+                break
+
+            output = (output + data)[-4096:]
+
+        proc.wait()
+        os.close(master)
+
+        if proc.returncode != 0 or not os.path.exists(result_filename):
+            raise RuntimeError('Textfield benchmark failed with exit code {}:\n{}'.format(
+                proc.returncode, output.decode('utf-8', 'replace')))
+
+        with open(result_filename) as file:
+            return json.load(file)
+
+
+def run(max_ratio):
+    results = measure()
+
+    print('{:>10} {:>14} {:>16} {:>12} {:>14}'.format('length', 'type end us', 'type middle us', 'delete us',
+                                                    'paste {} us'.format(PASTE_LENGTH)))
+
+    for result in results:
+        print('{:>10} {:>14.1f} {:>16.1f} {:>12.1f} {:>14.1f}'.format(result['length'], result['type_end_us'],
+                                                                   result['type_middle_us'], result['delete_us'],
+                                                                   result['paste_us']))
+
+    ratio = max(results[-1]['type_end_us'], results[-1]['type_middle_us']) / \
+        max(results[0]['type_end_us'], results[0]['type_middle_us'])
+    print('longest / shortest keystroke: {:.2f}'.format(ratio))
+
+    if ratio > max_ratio:
+        print('FAIL: keystroke cost grows with value length (ratio {:.2f}, budget {})'.format(ratio, max_ratio))
+        return 1
+
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Keystroke latency benchmark for ITKTextfield')
+    parser.add_argument('--child', metavar='RESULT_FILE', help=argparse.SUPPRESS)
+    parser.add_argument('--max-ratio', type=float, default=MAX_RATIO,
+                        help='exit with 1 if a keystroke in the longest value costs more than this many times one in '
+                             'the shortest')
+    args = parser.parse_args(argv)
+
+    if args.child:
+        sys.path.insert(0, str(REPO_DIR))
+        run_child(args.child)
+        return 0
+
+    return run(args.max_ratio)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import mmap
+import os
+from collections import namedtuple
+
+from itkconfigurator.envfile import EnvFileRecord, find_env_records, decode_env_value, encode_env_value, \
+    splice_bytes, write_file_atomic, patch_file_in_place
+
+# A single pending env var value change.
+#   item: the schema config item the value is bound to, if any. Bound changes are checked against the line the item
+#         was originally read from so we never overwrite edits made to the file by someone else.
+EnvChange = namedtuple('EnvChange', ['env_file_id', 'env_var_name', 'new_value', 'item'])
+
+# A value replaced in an env file: the var assigned, the byte span of the old raw value and the raw value written there
+EnvPatch = namedtuple('EnvPatch', ['env_var_name', 'value_span', 'raw_value'])
+
+
+class ChangeTargetError(Exception):
+    """
+    Raised when a value cannot be matched to one of the loaded env files
+    """
+    pass
+
+
+class EnvChangeSet:
+    """
+    A set of pending env var value changes grouped by the env file they belong to.
+
+    Applying the change set writes each changed file exactly once, atomically, and leaves files without changes
+    untouched. All files are checked for conflicts before any are written.
+
+    This can be used without the TUI e.g.:
+        change_set = EnvChangeSet([('mc', '/path/to/mojaloop-connector.env')])
+        change_set.set_value('mc', 'DFSP_ID', 'mydfsp')
+        change_set.apply()
+    """
+    MISSING_ERROR = 'error'
+    MISSING_IGNORE = 'ignore'
+    MISSING_APPEND = 'append'
+
+    def __init__(self, env_files):
+        # env_files is a list of (env file id, path) tuples
+        self.env_files = list(env_files)
+        self.changes = {}
+
+        # once applied, {env file id: ([EnvPatch, ...], appended bytes)} for each file written, so callers can follow
+        # the changes without re-reading the files
+        self.applied_patches = {}
+
+    def set_value(self, env_file_id, env_var_name, new_value, item=None):
+        if env_file_id not in dict(self.env_files):
+            raise KeyError("Unknown env file '{}'".format(env_file_id))
+
+        self.changes.setdefault(env_file_id, {})[env_var_name] = EnvChange(env_file_id, env_var_name, new_value,
+                                                                            item)
+
+    def __iter__(self):
+        for file_changes in self.changes.values():
+            yield from file_changes.values()
+
+    def __len__(self):
+        return sum(len(file_changes) for file_changes in self.changes.values())
+
+    def changed_files(self):
+        """
+        Returns [(env file id, path), ...] for the env files this change set has changes for
+        """
+        return [env_file for env_file in self.env_files if env_file[0] in self.changes]
+
+    def prepare(self, missing=MISSING_ERROR):
+        """
+        Reads each changed file once and works out its new content. Returns
+        [(env file id, path, new content bytes, [EnvPatch, ...], appended bytes), ...] for the files whose content
+        actually changes.
+
+        missing controls what happens to unbound changes for vars not present in the file: 'error' raises KeyError,
+        'ignore' skips them and 'append' adds a new NAME=value line to the end of the file.
+        """
+        prepared = []
+
+        for env_file_id, path in self.changed_files():
+            with open(path, 'rb') as file:
+                data = file.read()
+
+            patches, appended = self.get_file_patches(path, data, self.changes[env_file_id].values(), missing)
+
+            if patches or appended:
+                prepared.append((env_file_id, path, splice_bytes(data, self.replacements(patches)) + appended,
+                                 patches, appended))
+
+        return prepared
+
+    def apply(self, missing=MISSING_ERROR, in_place=False):
+        """
+        Applies the change set to disk. Returns [(env file id, path), ...] for the files that were written.
+
+        By default each changed file is replaced atomically. With in_place=True files are instead patched in place
+        from the first changed byte onward, which avoids rewriting large files to change a few values.
+        """
+        if in_place:
+            return self.apply_in_place(missing)
+
+        prepared = self.prepare(missing)
+
+        for env_file_id, path, new_data, patches, appended in prepared:
+            write_file_atomic(path, new_data)
+            self.applied_patches[env_file_id] = (patches, appended)
+
+        return [(env_file_id, path) for env_file_id, path, _new_data, _patches, _appended in prepared]
+
+    def apply_in_place(self, missing=MISSING_ERROR):
+        prepared = []
+
+        # check every file for conflicts before patching any of them
+        for env_file_id, path in self.changed_files():
+            with open(path, 'rb') as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    data = b''
+                else:
+                    data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+                try:
+                    patches, appended = self.get_file_patches(path, data, self.changes[env_file_id].values(), missing)
+                finally:
+                    if isinstance(data, mmap.mmap):
+                        data.close()
+
+            if patches or appended:
+                prepared.append((env_file_id, path, patches, appended))
+
+        for env_file_id, path, patches, appended in prepared:
+            patch_file_in_place(path, self.replacements(patches), appended)
+            self.applied_patches[env_file_id] = (patches, appended)
+
+        return [(env_file_id, path) for env_file_id, path, _patches, _appended in prepared]
+
+    def replacements(self, patches):
+        """
+        Returns patches as the ((start, end), new bytes) replacements splice_bytes and patch_file_in_place take
+        """
+        return [(patch.value_span, patch.raw_value.encode('utf-8')) for patch in patches]
+
+    def get_file_patches(self, path, data, changes, missing):
+        """
+        Works out the byte replacements needed to apply changes to an env file whose content is data (bytes or an
+        mmap). Returns ([EnvPatch, ...], appended bytes).
+
+        Changes bound to config items that recorded where their value was read from are checked and patched directly
+        at those offsets; other changes are located by searching the file for their var names.
+        """
+        records_by_name = None
+        unlocated_names = [change.env_var_name for change in changes
+                           if change.item is None or change.item.get('line_span') is None]
+        patches = []
+        appended = []
+
+        for change in changes:
+            item = change.item
+
+            if item is not None and item.get('line_span') is not None:
+                # check the line hasnt changed since we read it
+                start, end = item['line_span']
+
+                if data[start:end] != item['original_line'].encode('utf-8'):
+                    raise self.conflict_error(path, change)
+
+                records = [self.item_record(item)]
+
+            else:
+                if records_by_name is None:
+                    records_by_name = {}
+
+                    for record in find_env_records(data, unlocated_names):
+                        records_by_name.setdefault(record.name, []).append(record)
+
+                records = records_by_name.get(change.env_var_name, [])
+
+                if item is not None and item.get('line_number') is not None:
+                    # check the line hasnt changed since we read it
+                    record = next((r for r in records if r.line_number == item['line_number']), None)
+
+                    if record is None or record.line != item['original_line']:
+                        raise self.conflict_error(path, change)
+
+                    records = [record]
+
+                elif not records:
+                    if missing == self.MISSING_APPEND:
+                        appended.append('{}={}\n'.format(change.env_var_name, encode_env_value(change.new_value)))
+                    elif missing == self.MISSING_ERROR:
+                        raise KeyError("Env var '{}' not found in file '{}'".format(change.env_var_name, path))
+                    continue
+
+            for record in records:
+                new_raw_value = encode_env_value(change.new_value, record.quote)
+
+                if new_raw_value != record.raw_value:
+                    patches.append(EnvPatch(change.env_var_name, record.value_span, new_raw_value))
+
+        appended = ''.join(appended).encode('utf-8')
+
+        if appended and len(data) and data[len(data) - 1:] != b'\n':
+            appended = b'\n' + appended
+
+        return patches, appended
+
+    def item_record(self, item):
+        """
+        Returns the parts of an EnvFileRecord we need for patching from the location info stored on a config item
+        """
+        start, end = item['value_span']
+        raw_value = item['original_line'].encode('utf-8')[start - item['line_span'][0]:end - item['line_span'][0]]
+        raw_value = raw_value.decode('utf-8')
+        _value, quote = decode_env_value(raw_value)
+
+        return EnvFileRecord(item['env_var']['name'], raw_value, item['original_value'], quote, item['line_number'],
+                             item['original_line'], item['line_span'], item['value_span'])
+
+    def conflict_error(self, path, change):
+        return ValueError("Original file '{}' has been modified since it was read. Please restart the utility to "
+                          "re-read changes: {}".format(path, change.env_var_name))
+
+
+# Change sets built from values given as data, shared by the headless CLI (headless.py) and the provisioning
+# orchestrator (orchestrator.py). scheme is an ITKConfigurationScheme with its env files loaded.
+
+def to_env_value(value):
+    """
+    Converts a value from a YAML or JSON patch to the string we write to an env file
+    """
+    if value is None:
+        return ''
+
+    if isinstance(value, bool):
+        return str(value).lower()
+
+    return str(value)
+
+
+def resolve_env_file_id(scheme, env_file_id, env_var_name):
+    """
+    Works out which env file an assignment without an explicit env file id belongs to
+    """
+    loaded_ids = [env_file[0] for env_file in scheme.env_files]
+
+    if env_file_id is not None:
+        if env_file_id not in loaded_ids:
+            raise ChangeTargetError("Env file '{}' was not loaded".format(env_file_id))
+        return env_file_id
+
+    candidates = [i for i in loaded_ids
+                  if (i, env_var_name) in scheme.env_var_index or (i, env_var_name) in scheme.env_values]
+
+    if len(candidates) == 1:
+        return candidates[0]
+
+    if not candidates and len(loaded_ids) == 1:
+        return loaded_ids[0]
+
+    raise ChangeTargetError("Cannot tell which env file '{}' belongs in, use id:{}=value".format(env_var_name,
+                                                                                                 env_var_name))
+
+
+def patch_to_values(scheme, patch):
+    """
+    Converts a patch mapping (see load_patch_file in headless.py) to [(env file id or None, env var name, value), ...]
+    """
+    loaded_ids = [env_file[0] for env_file in scheme.env_files]
+    values = []
+
+    for key, value in patch.items():
+        if key in loaded_ids and isinstance(value, dict):
+            values.extend((key, name, to_env_value(v)) for name, v in value.items())
+        else:
+            values.append((None, key, to_env_value(value)))
+
+    return values
+
+
+def build_change_set_from_values(scheme, values):
+    """
+    Builds a change set from [(env file id or None, env var name, value), ...]
+    """
+    change_set = EnvChangeSet(scheme.env_files)
+
+    for env_file_id, name, value in values:
+        env_file_id = resolve_env_file_id(scheme, env_file_id, name)
+        items = scheme.env_var_index.get((env_file_id, name), [])
+
+        # bind the change to its config item, if it has one, so we detect conflicting edits to the file
+        change_set.set_value(env_file_id, name, value, items[0] if items else None)
+
+    return change_set
+
+
+def describe_changes(scheme, change_set):
+    """
+    Returns the machine readable diff of a change set against the values currently in the env files. Changes that
+    would not alter a value are left out.
+    """
+    paths = dict(scheme.env_files)
+    diff = []
+
+    for change in change_set:
+        key = (change.env_file_id, change.env_var_name)
+        old_value = scheme.env_values.get(key)
+
+        if old_value == change.new_value:
+            continue
+
+        diff.append({
+            'env_file': change.env_file_id,
+            'path': paths[change.env_file_id],
+            'env_var': change.env_var_name,
+            'old_value': old_value,
+            'new_value': change.new_value,
+        })
+
+    return diff
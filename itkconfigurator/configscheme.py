@@ -0,0 +1,474 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import bisect
+import itertools
+import os
+import secrets
+import string
+import sys
+from collections import OrderedDict
+from pathlib import Path
+
+from itkconfigurator.changeset import EnvChangeSet
+from itkconfigurator.envfile import decode_env_value, tokenize_env_file, tokenize_env_bytes, replace_env_line_value
+from itkconfigurator.schemacache import load_schema
+
+DEFAULT_SCHEMA_FILENAME = Path(__file__).resolve().parent / 'itkschema.yaml'
+
+# name of the env var holding the ILP secret
+ILP_SECRET_ENV_VAR = 'ILP_SECRET'
+
+# name of the vault transit key used for JWS signing keys
+JWS_KEY_NAME = 'jwssigningkey.pem'
+
+# how many configuration group forms are kept built at once; the least recently shown are released beyond this
+MAX_CACHED_FORMS = int(os.environ.get('ITK_MAX_CACHED_FORMS', 4))
+
+
+def generate_secret(length=32):
+    """
+    Returns a cryptographically secure random alphanumeric string
+    """
+    characters = string.ascii_letters + string.digits
+    return ''.join(secrets.choice(characters) for _ in range(length))
+
+
+class ITKConfigurationScheme:
+    def __init__(self, scheme_filename=DEFAULT_SCHEMA_FILENAME, env_files=None,
+                 max_cached_forms=MAX_CACHED_FORMS):
+        if env_files is None:
+            # did we get passed an env file on the command line?
+            if len(sys.argv) > 1 and sys.argv[1] is not None:
+                schema_name, file_name = sys.argv[1].split('=')
+
+                if schema_name is None or file_name is None:
+                    raise Exception('First command line argument should be mc={filepath}')
+
+                env_files = [
+                    (schema_name, str(Path.cwd() / file_name)),
+                ]
+
+            else:
+                env_files = [
+                    ('mc', str(Path(__file__).resolve().parent / 'mojaloop-connector.env')),
+                ]
+
+        self.schema = None
+
+        # configuration group forms are built when first shown: group id -> form, least recently shown first
+        self.forms = OrderedDict()
+        self.max_cached_forms = max(max_cached_forms, 1)
+
+        # the dirty set: config values edited on the forms that differ from the saved values, keyed on
+        # (group id, item name). kept up to date by the widgets as they are edited, see config_value_changed().
+        self.pending_changes = {}
+
+        self.scheme_filename = scheme_filename
+        self.env_files = env_files
+
+        # lookup tables built once when the schema is loaded so we dont have to walk every group and item of the
+        # schema for each env file line we parse or each config value we look up.
+        self.env_var_index = {}
+        self.config_item_index = {}
+        self.group_index = {}
+
+        # the value of every env var read from our env files, keyed on (env file id, env var name). this includes
+        # vars that are not bound to a config item in the schema.
+        self.env_values = {}
+
+        # ids of env files written (or whose referenced files, e.g. certificates, were regenerated) since services
+        # were last restarted
+        self.restart_pending_env_files = set()
+
+        self.parse_schema_file()
+        self.parse_env_files()
+
+    def parse_schema_file(self):
+        """
+        Parses the yaml schema file into a dictionary, using the schema cache when the file has not changed
+        """
+        self.schema = load_schema(self.scheme_filename)
+
+        self.build_schema_index()
+
+    def build_schema_index(self):
+        """
+        Builds lookup tables over the schema config items:
+            env_var_index: (env file id, env var name) -> [item, ...]
+            config_item_index: (group id, item name) -> item
+            group_index: group id -> group
+        The items in the tables are the same dictionaries held in the schema so updates made through either are
+        visible in both.
+        """
+        self.env_var_index = {}
+        self.config_item_index = {}
+        self.group_index = {}
+
+        for group in self.schema['itkconfigschema']['configuration']['groups']:
+            self.group_index[group['id']] = group
+
+            for item in group['items']:
+                env_var_key = (item['env_var']['file'], item['env_var']['name'])
+                self.env_var_index.setdefault(env_var_key, []).append(item)
+                self.config_item_index[(group['id'], item['name'])] = item
+
+    def parse_env_files(self):
+        """
+        Parses environment files and updates env var values in the config scheme dictionary
+        """
+        for env_filename in self.env_files:
+            # line numbers in the records are relative to the start of each file
+            for record in tokenize_env_file(env_filename[1]):
+                self.update_env_var_value(env_filename[0], record.name, record.value, record.line_number,
+                                          record.line, value_span=record.value_span, line_span=record.line_span)
+
+    def parse_env_file_line(self, line):
+        """
+        Returns (var_name, var_value) for an env file line, or (None, None) if the line has no assignment on it
+        """
+        record = next(tokenize_env_bytes(line.encode('utf-8')), None)
+
+        if record is None:
+            return None, None
+
+        return record.name, record.value
+
+    def update_env_var_value(self, env_filename, env_var_name, value, line_number, original_line, value_span=None,
+                             line_span=None):
+        self.env_values[(env_filename, env_var_name)] = value
+
+        for item in self.env_var_index.get((env_filename, env_var_name), ()):
+            item['value'] = value
+
+            # remember which line number of the file this entry is on, its original text and the value
+            # we interpreted it as having; we will use this to check we are updating the file correctly
+            # when writing changes back.
+            item['original_value'] = value
+            item['line_number'] = line_number
+            item['original_line'] = original_line
+            item['value_span'] = value_span
+            item['line_span'] = line_span
+
+    def get_env_file_ids(self):
+        """
+        Returns the set of env file ids declared in the schema
+        """
+        return {f['name'] for f in self.schema['itkconfigschema']['configuration']['envfiles']}
+
+    def validate_item_value(self, item, value):
+        """
+        Returns a list of reasons value is not valid for a config item; the list is empty if the value is valid
+        """
+        errors = []
+
+        if item['type'] == 'bool':
+            if value.lower() not in ('true', 'false'):
+                errors.append("Value must be 'true' or 'false'")
+
+        elif item['type'] == 'string':
+            max_length = item.get('max_length')
+
+            if max_length is not None and len(value) > int(max_length):
+                errors.append('Value must be no longer than {} characters'.format(max_length))
+
+        else:
+            errors.append("Unknown config item type '{}'".format(item['type']))
+
+        return errors
+
+    def validate(self, change_set=None):
+        """
+        Validates the config item values read from our env files against the schema. If a change set is given its
+        values are validated in place of those read from the files.
+        Returns a list of {group, item, env_file, env_var, value, error} dicts; the list is empty if all values are
+        valid.
+        """
+        pending = {}
+
+        if change_set is not None:
+            pending = {(change.env_file_id, change.env_var_name): change.new_value for change in change_set}
+
+        env_file_ids = self.get_env_file_ids()
+        errors = []
+
+        for group in self.schema['itkconfigschema']['configuration']['groups']:
+            for item in group['items']:
+                key = (item['env_var']['file'], item['env_var']['name'])
+                value = pending.get(key, item.get('value'))
+
+                if key[0] not in env_file_ids:
+                    messages = ["Env file '{}' is not declared in the schema".format(key[0])]
+                elif value is None:
+                    # not present in any env file we loaded
+                    continue
+                else:
+                    messages = self.validate_item_value(item, value)
+
+                for message in messages:
+                    errors.append({'group': group['id'], 'item': item['name'], 'env_file': key[0], 'env_var': key[1],
+                                   'value': value, 'error': message})
+
+        return errors
+
+    def has_unsaved_changes(self):
+        return bool(self.pending_changes)
+
+    def config_value_changed(self, group_id, item, value):
+        """
+        Called by the config widgets whenever the user edits a value. value is the env file representation of the
+        widget value e.g. 'true' for a ticked checkbox.
+        """
+        key = (group_id, item['name'])
+
+        if value != self.get_item_saved_value(item):
+            self.pending_changes[key] = value
+        else:
+            self.pending_changes.pop(key, None)
+
+    def get_pending_changes(self):
+        """
+        Returns the edited but unsaved config values as
+        [{'group', 'item', 'env_file', 'env_var', 'saved_value', 'value'}, ...] in the order they were first edited
+        """
+        changes = []
+
+        for (group_id, item_name), value in self.pending_changes.items():
+            item = self.config_item_index[(group_id, item_name)]
+            changes.append({'group': group_id, 'item': item_name, 'env_file': item['env_var']['file'],
+                            'env_var': item['env_var']['name'], 'saved_value': self.get_item_saved_value(item),
+                            'value': value})
+
+        return changes
+
+    def is_group_id(self, group_id):
+        return group_id in self.group_index
+
+    def get_form(self, group_id):
+        """
+        Returns the form for a configuration group, building it if it is not cached. Building a form may release the
+        least recently used forms to stay within max_cached_forms; their edited values stay in pending_changes.
+        Returns (form, [ids of released forms]).
+        """
+        if group_id in self.forms:
+            self.forms.move_to_end(group_id)
+            return self.forms[group_id], []
+
+        # the forms need curses; import them here so the scheme can be used headless without loading the TUI
+        from itkconfigurator.customclasses import ITKConfigurationGroupForm
+
+        # show any edits made before the form was last released
+        values = {name: value for (item_group_id, name), value in self.pending_changes.items()
+                  if item_group_id == group_id}
+        self.forms[group_id] = ITKConfigurationGroupForm(self.group_index[group_id], values=values,
+                                                         value_changed_callback=self.config_value_changed)
+
+        released = []
+
+        while len(self.forms) > self.max_cached_forms:
+            released_id, _released_form = self.forms.popitem(last=False)
+            released.append(released_id)
+
+        return self.forms[group_id], released
+
+    def get_form_edit_buttons(self):
+        return [(g['id'], g['name']) for g in self.schema['itkconfigschema']['configuration']['groups']]
+
+    def get_forms(self):
+        """
+        Returns the forms that are currently built as [(id, form), ...]
+        """
+        return list(self.forms.items())
+
+    def get_change_set(self):
+        """
+        Returns an EnvChangeSet containing only the config items whose edited values differ from the values read
+        from the env files
+        """
+        change_set = EnvChangeSet(self.env_files)
+
+        for key, new_value in self.pending_changes.items():
+            item = self.config_item_index[key]
+            change_set.set_value(item['env_var']['file'], item['env_var']['name'], new_value, item)
+
+        return change_set
+
+    def apply_change_set(self, change_set, missing=EnvChangeSet.MISSING_APPEND, in_place=False):
+        """
+        Writes a change set to disk and updates our config items to reflect the new file content. Returns
+        [(env file id, path), ...] for the files that were written.
+        """
+        written = change_set.apply(missing, in_place=in_place)
+        self.restart_pending_env_files.update(env_file[0] for env_file in written)
+
+        for env_file_id, path in written:
+            patches, appended = change_set.applied_patches[env_file_id]
+
+            if appended:
+                # vars were added to the end of the file; re-read it to find where
+                for record in tokenize_env_file(path):
+                    self.update_env_var_value(env_file_id, record.name, record.value, record.line_number,
+                                              record.line, value_span=record.value_span, line_span=record.line_span)
+            else:
+                self.update_patched_env_values(env_file_id, patches)
+
+        # forget edits that are now saved
+        self.pending_changes = {key: value for key, value in self.pending_changes.items()
+                                if value != self.get_item_saved_value(self.config_item_index[key])}
+
+        return written
+
+    def update_patched_env_values(self, env_file_id, patches):
+        """
+        Updates our values and the file positions recorded on config items after values in an env file were replaced
+        by patches (see EnvChangeSet.applied_patches), without re-reading the file. Patched values never contain a
+        newline so line numbers stay the same; items after a patch move by the change in the value's length.
+        """
+        if not patches:
+            return
+
+        patches = sorted(patches, key=lambda patch: patch.value_span[0])
+        starts = [patch.value_span[0] for patch in patches]
+
+        # how far each patch, and those before it, move the bytes after it
+        shifts = list(itertools.accumulate(len(patch.raw_value.encode('utf-8')) - (patch.value_span[1] -
+                                                                                   patch.value_span[0])
+                                           for patch in patches))
+
+        for patch in patches:
+            self.env_values[(env_file_id, patch.env_var_name)] = decode_env_value(patch.raw_value)[0]
+
+        for (item_env_file_id, env_var_name), items in self.env_var_index.items():
+            if item_env_file_id != env_file_id or not items or items[0].get('line_span') is None:
+                continue
+
+            # items for the same env var share their position so update them together
+            item = items[0]
+            line_start, line_end = item['line_span']
+            value_start, value_end = item['value_span']
+            index = bisect.bisect_left(starts, line_start)
+            shift = shifts[index - 1] if index else 0
+
+            if index < len(patches) and starts[index] < line_end:
+                patch = patches[index]
+                raw_value = patch.raw_value.encode('utf-8')
+                line = item['original_line'].encode('utf-8')
+                line = line[:value_start - line_start] + raw_value + line[value_end - line_start:]
+                delta = shifts[index] - shift
+
+                self.update_env_var_value(env_file_id, env_var_name, decode_env_value(patch.raw_value)[0],
+                                          item['line_number'], line.decode('utf-8'),
+                                          value_span=(value_start + shift, value_start + shift + len(raw_value)),
+                                          line_span=(line_start + shift, line_end + shift + delta))
+
+            elif shift:
+                for item in items:
+                    item['line_span'] = (line_start + shift, line_end + shift)
+                    item['value_span'] = (value_start + shift, value_end + shift)
+
+    def get_env_file_services(self):
+        """
+        Returns {env file id: [names of the services that read the env file], ...}
+        """
+        return {f['name']: f.get('services', []) for f in self.schema['itkconfigschema']['configuration']['envfiles']}
+
+    def get_group_env_file_ids(self, group_id):
+        """
+        Returns the ids of the env files the items of a config group are stored in
+        """
+        return {item['env_var']['file'] for (item_group_id, _name), item in self.config_item_index.items()
+                if item_group_id == group_id}
+
+    def mark_restart_needed(self, env_file_ids):
+        self.restart_pending_env_files.update(env_file_ids)
+
+    def get_services_to_restart(self, env_file_ids=None):
+        """
+        Returns the services that read the given env files, by default the env files changed since the last restart
+        """
+        env_file_services = self.get_env_file_services()
+        services = []
+
+        for env_file_id, _path in self.env_files:
+            if env_file_id in (self.restart_pending_env_files if env_file_ids is None else env_file_ids):
+                services.extend(s for s in env_file_services.get(env_file_id, []) if s not in services)
+
+        return services
+
+    def services_restarted(self, services):
+        """
+        Clears the pending restart for env files all of whose services have been restarted
+        """
+        env_file_services = self.get_env_file_services()
+
+        self.restart_pending_env_files = {env_file_id for env_file_id in self.restart_pending_env_files
+                                          if not set(env_file_services.get(env_file_id, [])) <= set(services)}
+
+    def saveChanges(self):
+        return self.apply_change_set(self.get_change_set())
+
+    def update_env_file_line(self, line, var_name, new_value):
+        return replace_env_line_value(line, new_value)
+
+    def get_item_saved_value(self, item):
+        """
+        Returns the value of a config item as last read from its env file, or the value its widget shows when the
+        env var is not present in the file
+        """
+        if 'value' in item:
+            return item['value']
+
+        return 'false' if item['type'] == 'bool' else ''
+
+    def get_config_item_value(self, group_id, item_name):
+        return self.config_item_index[(group_id, item_name)]['value']
+
+    def write_single_env_var_value(self, env_var_name, new_value):
+        # update any lines in any of our env files that have our var in
+        change_set = EnvChangeSet(self.env_files)
+
+        for env_file in self.env_files:
+            change_set.set_value(env_file[0], env_var_name, new_value)
+
+        # this is used for single value rotations (e.g. ILP secret) so patch the files in place rather than rewriting
+        # them
+        self.apply_change_set(change_set, missing=EnvChangeSet.MISSING_IGNORE, in_place=True)
+
+    def rotate_ilp_secret(self, length=32):
+        """
+        Generates a new ILP secret and writes it to our env files. Returns the new secret.
+        """
+        new_secret = generate_secret(length)
+        self.write_single_env_var_value(ILP_SECRET_ENV_VAR, new_secret)
+        return new_secret
+
+    def get_mtls_settings(self):
+        """
+        Returns the config values needed to generate client side mTLS artefacts
+        """
+        return {
+            'dfsp_name': self.get_config_item_value('dfsp_details', 'DFSP ID'),
+            'dns_names': self.get_config_item_value('mojaloop_connector_details', 'DFSP DNS Host Names'),
+            'ca_cert_path': self.get_config_item_value('security', 'Inbound CA Certificate Path'),
+            'server_cert_path': self.get_config_item_value('security', 'Inbound Server Certificate Path'),
+            'server_key_path': self.get_config_item_value('security', 'Inbound Server Certificate Private Key Path'),
+        }
+
+    def get_jws_settings(self):
+        """
+        Returns the config values needed to generate a JWS key pair
+        """
+        return {
+            'private_key_path': self.get_config_item_value('non_repudiation', 'JWS Signing (private) key path'),
+            'public_key_path': self.get_config_item_value('non_repudiation', 'JWS verification (public) key path'),
+        }
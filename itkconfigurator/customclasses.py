@@ -11,37 +11,128 @@
 #       James Bush - jbush@mojaloop.io                                   #
 ##########################################################################
 
+import codecs
+import collections
 import curses
 import npyscreen
+import os
+import queue
+import selectors
 import textwrap
 import subprocess
 import threading
+import time
+from npyscreen import npysGlobalOptions, npyspmfuncs
 from npyscreen.wgtextbox import TextfieldBase
+from npyscreen.wgwidget import EXITED_DOWN
 
+from itkconfigurator.gapbuffer import GapBuffer
+from itkconfigurator.pkievents import PhaseTimings
+from itkconfigurator.taskrunner import LineSink, Task
 
-def run_sub_process(command_args, output_line_callback):
+# how long a cancelled or timed out subprocess gets to exit after SIGTERM before it is killed
+SUB_PROCESS_KILL_GRACE_SECS = 3
+
+# job output views keep at most this many display lines; older lines are dropped (see OutputBuffer log_filename)
+OUTPUT_MAX_LINES = 5000
+
+# job output views redraw at most this often however fast output arrives
+OUTPUT_FRAME_INTERVAL_SECS = 0.1
+
+# the full output of each TUI job is written to <job name>.log in this directory, by default
+# $XDG_CACHE_HOME/itk-configurator/logs (or ~/.cache/itk-configurator/logs)
+JOB_LOG_DIR_ENV_VAR = 'ITK_JOB_LOG_DIR'
+
+
+def get_job_log_filename(job_name):
     """
-    Runs a subprocess and calls back with stdout lines as they are produced.
+    Returns the file to write the full output of job_name to, or None if the log directory cannot be created
+    """
+    log_dir = os.environ.get(JOB_LOG_DIR_ENV_VAR)
+
+    if not log_dir:
+        cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        log_dir = os.path.join(cache_home, 'itk-configurator', 'logs')
+
+    try:
+        os.makedirs(log_dir, mode=0o700, exist_ok=True)
+    except OSError:
+        return None
+
+    return os.path.join(log_dir, '{}.log'.format(job_name))
+
+
+def run_sub_process(command_args, output_line_callback, timeout_secs=None, cancel_event=None):
+    """
+    Runs a subprocess and calls back with stdout and stderr lines, in the order they are produced.
     command_args is a list: ["command", "arg1", "arg2", ...]
-    Calls output_line_callback(line) whenever a stdout line is written by the subprocess
+    Calls output_line_callback(line) whenever a line is written by the subprocess
+
+    The subprocess is terminated if it runs for longer than timeout_secs or if cancel_event (a threading.Event) is
+    set. Returns the subprocess exit code, which is negative if it was terminated by a signal.
     """
     proc = subprocess.Popen(command_args,
+                            stdin=subprocess.DEVNULL,
                             stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE,
-                            universal_newlines=True)
+                            stderr=subprocess.PIPE)
+
+    # read both pipes as data arrives so a chatty stderr can never fill its pipe and block the subprocess
+    selector = selectors.DefaultSelector()
+
+    for pipe in (proc.stdout, proc.stderr):
+        os.set_blocking(pipe.fileno(), False)
+        selector.register(pipe, selectors.EVENT_READ, (codecs.getincrementaldecoder('utf-8')('replace'),
+                                                       LineSink(output_line_callback)))
+
+    deadline = time.monotonic() + timeout_secs if timeout_secs is not None else None
+    terminated_at = None
+
+    try:
+        while selector.get_map():
+            for key, _events in selector.select(timeout=0.1):
+                decoder, sink = key.data
+                data = os.read(key.fd, 65536)
+
+                if data:
+                    sink(decoder.decode(data))
+                else:
+                    sink(decoder.decode(b'', final=True))
+                    sink.flush()
+                    selector.unregister(key.fileobj)
 
-    for stdout_line in iter(proc.stdout.readline, ""):
-        output_line_callback(stdout_line)
+            if terminated_at is None:
+                if cancel_event is not None and cancel_event.is_set():
+                    output_line_callback('Cancelled.')
+                    terminated_at = terminate_sub_process(proc)
 
-    for stderr_line in iter(proc.stderr.readline, ""):
-        output_line_callback(stderr_line)
+                elif deadline is not None and time.monotonic() > deadline:
+                    output_line_callback('Timed out after {} seconds.'.format(timeout_secs))
+                    terminated_at = terminate_sub_process(proc)
+
+            elif time.monotonic() - terminated_at > SUB_PROCESS_KILL_GRACE_SECS:
+                if proc.poll() is None:
+                    proc.kill()
+
+                elif time.monotonic() - terminated_at > SUB_PROCESS_KILL_GRACE_SECS * 2:
+                    # something the subprocess started is holding its output open; stop waiting for it
+                    break
+
+    finally:
+        selector.close()
+        proc.stdout.close()
+        proc.stderr.close()
 
-    proc.stdout.close()
-    proc.stderr.close()
     proc.wait()
     return proc.returncode
 
 
+def terminate_sub_process(proc):
+    if proc.poll() is None:
+        proc.terminate()
+
+    return time.monotonic()
+
+
 class ITKColorTheme(npyscreen.ThemeManager):
     default_colors = {
         'DEFAULT': 'BLACK_WHITE',
@@ -90,47 +181,142 @@ class ITKColorTheme(npyscreen.ThemeManager):
         ('BLUE_BLUE', curses.COLOR_BLUE, curses.COLOR_BLUE),
     )
 
+    def __init__(self, *args, **kwargs):
+        # colour name -> curses attribute. Pairs are fixed once the theme is initialised, so each theme instance can
+        # keep its own cache for as long as it is in use.
+        self.pair_cache = {}
+        super().__init__(*args, **kwargs)
 
-class FilledBackgroundForm(npyscreen.Form):
-    def __init__(self, char=' '):
-        self.backgroundchar = char
-        super(FilledBackgroundForm, self).__init__(color=self.color)
+    def findPair(self, caller, request='DEFAULT'):
+        if request == 'DEFAULT':
+            request = caller.color
+
+        try:
+            return self.pair_cache[request]
+        except KeyError:
+            color_attribute = self.pair_cache[request] = super().findPair(caller, request)
+            return color_attribute
+
+
+class ITKFormRenderer():
+    """
+    Form mixin that redraws only the widgets whose render_state() has changed since they were last drawn, and sends
+    the form (and its shadow) to the terminal in a single update so that only the cells that changed are written
+    """
+    backgroundchar = ' '
+    shadow = False
+    shadow_pad = None
+
+    # (widget id, hidden) for each widget as of the last full redraw, and widget id -> render state when last drawn
+    _render_layout = None
+    _render_states = None
+
+    def invalidate_render_states(self):
+        """
+        Makes the next display redraw every widget
+        """
+        self._render_layout = None
 
-    # we override this function from the base so we can set the background char. this is not normally configurable.
     def display(self, clear=False):
-        super().display(clear)
-        self.curses_pad.bkgdset(self.backgroundchar, self.theme_manager.findPair(self, self.color) | curses.A_NORMAL)
+        widgets = self._widgets__
+        layout = [(id(w), w.hidden) for w in widgets]
+        full = clear or layout != self._render_layout
+
+        if curses.has_colors() and not npysGlobalOptions.DISABLE_ALL_COLORS:
+            color_attribute = self.theme_manager.findPair(self, self.color)
+            self.curses_pad.attrset(0)
+            self.curses_pad.bkgdset(self.backgroundchar, color_attribute)
+            self.curses_pad.attron(color_attribute)
+
+        if full:
+            self._render_layout = layout
+            self._render_states = {}
+            self.curses_pad.erase()
+
+            for w in widgets:
+                if w.hidden:
+                    w.clear()
 
-        self.curses_pad.erase()
         self.draw_form()
-        for w in [wg for wg in self._widgets__ if wg.hidden]:
-            w.clear()
-        for w in [wg for wg in self._widgets__ if not wg.hidden]:
-            w.update(clear=clear)
+
+        for w in widgets:
+            if w.hidden:
+                continue
+
+            # widgets without a render state are always redrawn
+            state = w.render_state() if hasattr(w, 'render_state') else None
+
+            if full:
+                w.update(clear=clear)
+            elif state is None or self._render_states.get(id(w)) != state:
+                w.update(clear=True)
+            else:
+                continue
+
+            self._render_states[id(w)] = state
 
         self.refresh()
 
+    def erase(self):
+        self.invalidate_render_states()
+        super().erase()
 
-class TVButtonPress(npyscreen.ButtonPress):
-    def __init__(self, screen, when_pressed_function=None, *args, **kwargs):
-        super().__init__(screen, when_pressed_function, *args, **kwargs)
-        self.color = "BUTTON"
-        self.cursor_color = "BUTTON_SELECTED"
+    def refresh(self):
+        npyspmfuncs.hide_cursor()
+        _my, _mx = self._max_physical()
+        self.curses_pad.move(0, 0)
+
+        if self.shadow:
+            if self.shadow_pad is None:
+                self.shadow_pad = curses.newpad(self.lines, self.columns)
+                self.shadow_pad.bkgdset(' ', self.theme_manager.findPair(self, 'FORMSHADOW'))
+
+            self.shadow_pad.move(1, 1)
+
+            try:
+                self.shadow_pad.noutrefresh(self.show_from_y, self.show_from_x, self.show_aty + 1,
+                                            self.show_atx + 1, _my, _mx)
+            except curses.error:
+                pass
+
+        try:
+            self.curses_pad.noutrefresh(self.show_from_y, self.show_from_x, self.show_aty, self.show_atx, _my, _mx)
+        except curses.error:
+            pass
+
+        # one write to the terminal for the shadow and the form, containing only what changed since the last one
+        curses.doupdate()
+
+        self.ALL_SHOWN = self.show_from_y == 0 and self.show_from_x == 0 and _my >= self.lines and \
+                         _mx >= self.columns
+
+
+class FilledBackgroundForm(ITKFormRenderer, npyscreen.Form):
+    def __init__(self, char=' '):
+        # the background char is not normally configurable; ITKFormRenderer.display fills the pad with it
+        self.backgroundchar = char
+        super(FilledBackgroundForm, self).__init__(color=self.color)
 
-    def update(self, clear=True):
-        if clear: self.clear()
-        if self.hidden:
-            self.clear()
-            return False
 
-        button_state = curses.A_NORMAL
+class ITKButtonBase():
+    # (render state, label, attribute list) of the label last drawn; rebuilt only when the render state changes
+    _button_label = None
+
+    def render_state(self):
+        return self.name, bool(self.editing), self.rely, self.relx, self.color, self.cursor_color
+
+    def get_button_label(self):
+        state = self.render_state()
+
+        if self._button_label is not None and self._button_label[0] == state:
+            return self._button_label[1], self._button_label[2]
 
         button_name = self.name
 
         if isinstance(button_name, bytes):
             button_name = button_name.decode(self.encoding, 'replace')
 
-        button_name = "<{}>".format(self.name)
+        button_name = "<{}>".format(button_name)
 
         if self.do_colors():
             if self.cursor_color:
@@ -140,23 +326,12 @@ class TVButtonPress(npyscreen.ButtonPress):
                 else:
                     button_attributes = self.parent.theme_manager.findPair(self, self.color)
             else:
-                button_attributes = self.parent.theme_manager.findPair(self, self.color) | button_state
+                button_attributes = self.parent.theme_manager.findPair(self, self.color) | curses.A_NORMAL
         else:
-            button_attributes = button_state
-
-        # print button
-        self.add_line(self.rely, self.relx + 1,
-                      button_name,
-                      self.make_attributes_list(button_name, button_attributes),
-                      len(button_name)
-                      )
+            button_attributes = curses.A_NORMAL
 
-
-class TVButton(npyscreen.MiniButton):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.color = "BUTTON"
-        self.cursor_color = "BUTTON_SELECTED"
+        self._button_label = (state, button_name, self.make_attributes_list(button_name, button_attributes))
+        return self._button_label[1], self._button_label[2]
 
     def update(self, clear=True):
         if clear: self.clear()
@@ -164,111 +339,109 @@ class TVButton(npyscreen.MiniButton):
             self.clear()
             return False
 
-        button_state = curses.A_NORMAL
+        button_name, button_attributes = self.get_button_label()
 
-        button_name = self.name
+        # print button
+        self.add_line(self.rely, self.relx + 1, button_name, button_attributes, len(button_name))
 
-        if isinstance(button_name, bytes):
-            button_name = button_name.decode(self.encoding, 'replace')
 
-        button_name = "<{}>".format(self.name)
+class TVButtonPress(ITKButtonBase, npyscreen.ButtonPress):
+    def __init__(self, screen, when_pressed_function=None, *args, **kwargs):
+        super().__init__(screen, when_pressed_function, *args, **kwargs)
+        self.color = "BUTTON"
+        self.cursor_color = "BUTTON_SELECTED"
 
-        if self.do_colors():
-            if self.cursor_color:
-                if self.editing:
-                    button_attributes = self.parent.theme_manager.findPair(self, self.cursor_color)
-                    button_attributes = button_attributes | curses.A_BOLD
-                else:
-                    button_attributes = self.parent.theme_manager.findPair(self, self.color)
-            else:
-                button_attributes = self.parent.theme_manager.findPair(self, self.color) | button_state
-        else:
-            button_attributes = button_state
 
-        self.add_line(self.rely, self.relx + 1, button_name, self.make_attributes_list(button_name, button_attributes),
-                      len(button_name))
+class TVButton(ITKButtonBase, npyscreen.MiniButton):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.color = "BUTTON"
+        self.cursor_color = "BUTTON_SELECTED"
 
 
 class ITKTextFieldBase():
-    def _print(self):
-        if not self.value:
-            self.print_empty()
-        else:
-            # call the next base class implementation
-            super()._print()
-
-    def print_empty(self):
-        string_to_print = ' ' * (self.maximum_string_length - self.left_margin + 1)
-        width_of_char_to_print = self.find_width_of_char(string_to_print[0])
-
-        column = 0
-        place_in_string = 0
-
+    def get_text_attributes(self):
         if self.do_colors():
             if self.show_bold and self.color == 'DEFAULT':
-                color = self.parent.theme_manager.findPair(self, 'BOLD') | curses.A_BOLD
+                return self.parent.theme_manager.findPair(self, 'BOLD') | curses.A_BOLD
             elif self.show_bold:
-                color = self.parent.theme_manager.findPair(self, self.color) | curses.A_BOLD
+                return self.parent.theme_manager.findPair(self, self.color) | curses.A_BOLD
             elif self.important:
-                color = self.parent.theme_manager.findPair(self, 'IMPORTANT') | curses.A_BOLD
+                return self.parent.theme_manager.findPair(self, 'IMPORTANT') | curses.A_BOLD
             else:
-                color = self.parent.theme_manager.findPair(self)
+                return self.parent.theme_manager.findPair(self)
         else:
             if self.important or self.show_bold:
-                color = curses.A_BOLD
+                return curses.A_BOLD
             else:
-                color = curses.A_NORMAL
+                return curses.A_NORMAL
+
+    def _get_string_to_print(self):
+        # only the part of the value that is on screen
+        return self.display_value(self.buffer.slice(self.begin_at,
+                                                    self.begin_at + self.maximum_string_length - self.left_margin))
+
+    def _print(self):
+        if not len(self.buffer):
+            self.print_empty()
+            return
+
+        string_to_print = self._get_string_to_print()
+
+        if self.highlight_whole_widget:
+            string_to_print = string_to_print.ljust(self.maximum_string_length - self.left_margin + 1)
+
+        self.parent.curses_pad.addstr(self.rely, self.relx + self.left_margin, self._print_unicode_char(string_to_print),
+                                      self.get_text_attributes())
+
+    def print_empty(self):
+        string_to_print = ' ' * (self.maximum_string_length - self.left_margin + 1)
 
         if self.highlight_whole_widget:
             self.parent.curses_pad.addstr(self.rely, self.relx + self.left_margin,
                                           string_to_print,
-                                          color
+                                          self.get_text_attributes()
                                           )
 
-    def update(self, clear=True, cursor=True):
-        if not self.value:
-            self.update_empty(clear, cursor)
+    def print_cursor(self):
+        char_under_cur = self.display_value(self.buffer.slice(self.cursor_position, self.cursor_position + 1)) or ' '
+
+        if self.do_colors():
+            attributes = self.parent.theme_manager.findPair(self, 'CURSOR_INVERSE')
         else:
-            super().update(clear, cursor)
+            attributes = curses.A_STANDOUT
+
+        self.parent.curses_pad.addstr(self.rely, self.cursor_position - self.begin_at + self.relx + self.left_margin,
+                                      char_under_cur, attributes)
 
-    def update_empty(self, clear=True, cursor=True):
+    def scroll_to_cursor(self):
+        """
+        Keeps the cursor within the value and scrolls the field so the cursor is on screen
+        """
+        length = len(self.buffer)
+
+        if self.cursor_position is False or self.cursor_position > length:
+            self.cursor_position = length
+        elif self.cursor_position < 0:
+            self.cursor_position = 0
+
+        visible_length = self.maximum_string_length - self.left_margin
+        self.begin_at = max(min(self.begin_at, self.cursor_position), self.cursor_position - visible_length)
+
+    def update(self, clear=True, cursor=True):
         if clear: self.clear()
 
         if self.hidden:
             return True
 
-        value_to_use_for_calculations = self.value
-
-        if self.ENSURE_STRING_VALUE:
-            if value_to_use_for_calculations in (None, False, True):
-                value_to_use_for_calculations = ''
-                self.value = ''
-
         if self.begin_at < 0: self.begin_at = 0
 
         if self.left_margin >= self.maximum_string_length:
             raise ValueError
 
         if self.editing:
-            if isinstance(self.value, bytes):
-                # use a unicode version of self.value to work out where the cursor is.
-                # not always accurate, but better than the bytes
-                value_to_use_for_calculations = self.display_value(self.value).decode(self.encoding, 'replace')
             if cursor:
-                if self.cursor_position is False:
-                    self.cursor_position = len(value_to_use_for_calculations)
-
-                elif self.cursor_position > len(value_to_use_for_calculations):
-                    self.cursor_position = len(value_to_use_for_calculations)
-
-                elif self.cursor_position < 0:
-                    self.cursor_position = 0
-
-                if self.cursor_position < self.begin_at:
-                    self.begin_at = self.cursor_position
-
-                while self.cursor_position > self.begin_at + self.maximum_string_length - self.left_margin:  # -1:
-                    self.begin_at += 1
+                self.scroll_to_cursor()
             else:
                 if self.do_colors():
                     self.parent.curses_pad.bkgdset(' ', self.parent.theme_manager.findPair(self,
@@ -276,6 +449,23 @@ class ITKTextFieldBase():
                 else:
                     self.parent.curses_pad.bkgdset(' ', curses.A_STANDOUT)
 
+        # an empty field is drawn without highlighting, bold or underline
+        if len(self.buffer):
+            if self.highlight:
+                if self.do_colors():
+                    if self.invert_highlight_color:
+                        attributes = self.parent.theme_manager.findPair(self, self.highlight_color) | curses.A_STANDOUT
+                    else:
+                        attributes = self.parent.theme_manager.findPair(self, self.highlight_color)
+                    self.parent.curses_pad.bkgdset(' ', attributes)
+                else:
+                    self.parent.curses_pad.bkgdset(' ', curses.A_STANDOUT)
+
+            if self.show_bold:
+                self.parent.curses_pad.attron(curses.A_BOLD)
+            if self.important and not self.do_colors():
+                self.parent.curses_pad.attron(curses.A_UNDERLINE)
+
         self._print()
 
         # reset everything to normal
@@ -288,9 +478,24 @@ class ITKTextFieldBase():
 
 
 class ITKTextfield(ITKTextFieldBase, TextfieldBase):
+    # The value is kept in a GapBuffer so that a keystroke costs the same however long the value is: typing and
+    # deleting edit the buffer in place, only the part of the value on screen is drawn, and the scroll position is
+    # computed directly from the cursor.
+
     def __init__(self, *args, **kwargs):
         TextfieldBase.__init__(self, *args, **kwargs)
 
+    @property
+    def value(self):
+        return str(self.buffer)
+
+    @value.setter
+    def value(self, value):
+        if value in (None, False, True):
+            value = ''
+
+        self.buffer = GapBuffer(str(value))
+
     def show_brief_message(self, message):
         curses.beep()
         keep_for_a_moment = self.value
@@ -304,7 +509,7 @@ class ITKTextfield(ITKTextFieldBase, TextfieldBase):
     def edit(self):
         self.editing = 1
         if self.cursor_position is False:
-            self.cursor_position = len(self.value or '')
+            self.cursor_position = len(self.buffer)
         self.parent.curses_pad.keypad(1)
 
         self.old_value = self.value
@@ -315,11 +520,22 @@ class ITKTextfield(ITKTextFieldBase, TextfieldBase):
             self.display()
             self.get_and_use_key_press()
 
+        # value changed handlers run once the user has finished with the field, see when_check_value_changed
+        self.when_check_value_changed()
+
         self.begin_at = 0
         self.display()
         self.cursor_position = False
         return self.how_exited, self.value
 
+    def when_check_value_changed(self):
+        # Checking for a change compares the whole value, and the handlers (see ITKTitleText.when_value_edited) read it,
+        # so we do not check after every keystroke but once when editing ends
+        if self.editing:
+            return False
+
+        return super().when_check_value_changed()
+
     def set_up_handlers(self):
         TextfieldBase.set_up_handlers(self)
 
@@ -351,23 +567,51 @@ class ITKTextfield(ITKTextFieldBase, TextfieldBase):
         else:
             return False
 
+    def get_input_char(self, inp):
+        return inp if self._last_get_ch_was_unicode else chr(inp)
+
     def h_addch(self, inp):
         if self.editable:
-            # workaround for the metamode bug:
-            if self._last_get_ch_was_unicode == True and isinstance(self.value, bytes):
-                # probably dealing with python2.
-                ch_adding = inp
-                self.value = self.value.decode()
-            elif self._last_get_ch_was_unicode == True:
-                ch_adding = inp
-            else:
-                try:
-                    ch_adding = chr(inp)
-                except TypeError:
-                    ch_adding = input
-            self.value = self.value[:self.cursor_position] + ch_adding \
-                         + self.value[self.cursor_position:]
-            self.cursor_position += len(ch_adding)
+            # a paste arrives as a burst of keys; take the rest of it now so it is inserted and drawn once
+            self.insert_text(self.get_input_char(inp) + self.read_pending_text())
+
+    def insert_text(self, text):
+        """
+        Inserts text at the cursor in a single operation and moves the cursor past it
+        """
+        self.cursor_position = self.buffer.clamp(self.cursor_position)
+        self.cursor_position += self.buffer.insert(self.cursor_position, text)
+
+    def read_pending_text(self):
+        """
+        Returns the printable characters that are already waiting to be read, up to the first key that is not one
+        """
+        test_settings = npyscreen.wgwidget.TEST_SETTINGS
+
+        if test_settings['TEST_INPUT'] is not None or test_settings['INPUT_GENERATOR'] is not None:
+            return ''
+
+        chars = []
+        self.parent.curses_pad.nodelay(1)
+
+        try:
+            while True:
+                ch = self._get_ch()
+
+                if ch == -1:
+                    break
+
+                if not self.t_input_isprint(ch):
+                    # leave the key for the edit loop
+                    curses.ungetch(ch)
+                    break
+
+                chars.append(self.get_input_char(ch))
+
+        finally:
+            self.parent.curses_pad.nodelay(0)
+
+        return ''.join(chars)
 
     def h_cursor_left(self, input):
         self.cursor_position -= 1
@@ -377,24 +621,24 @@ class ITKTextfield(ITKTextFieldBase, TextfieldBase):
 
     def h_delete_left(self, input):
         if self.editable and self.cursor_position > 0:
-            self.value = self.value[:self.cursor_position - 1] + self.value[self.cursor_position:]
+            self.buffer.delete(self.cursor_position - 1, self.cursor_position)
 
         self.cursor_position -= 1
         self.begin_at -= 1
 
     def h_delete_right(self, input):
         if self.editable:
-            self.value = self.value[:self.cursor_position] + self.value[self.cursor_position + 1:]
+            self.buffer.delete(self.cursor_position, self.cursor_position + 1)
 
     def h_erase_left(self, input):
         if self.editable:
-            self.value = self.value[self.cursor_position:]
+            self.buffer.delete(0, self.cursor_position)
             self.cursor_position = 0
 
     def h_erase_right(self, input):
         if self.editable:
-            self.value = self.value[:self.cursor_position]
-            self.cursor_position = len(self.value)
+            self.buffer.delete(self.cursor_position, len(self.buffer))
+            self.cursor_position = len(self.buffer)
             self.begin_at = 0
 
     def handle_mouse_event(self, mouse_event):
@@ -406,20 +650,36 @@ class ITKTextfield(ITKTextFieldBase, TextfieldBase):
 class ITKTitleText(npyscreen.TitleText):
     _entry_type = ITKTextfield
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, change_callback=None, **kwargs):
+        # called with this widget whenever the user edits its value
+        self.change_callback = change_callback
         super(ITKTitleText, self).__init__(*args, **kwargs)
         self.entry_widget.highlight_whole_widget = True
 
+    def get_config_value(self):
+        """
+        Returns the value as it is written to an env file
+        """
+        return self.value
+
+    def render_state(self):
+        entry = self.entry_widget
+        return self.value, bool(self.editing), self.name, bool(entry.editing), entry.cursor_position, entry.begin_at
+
+    def when_value_edited(self):
+        if self.change_callback is not None:
+            self.change_callback(self)
 
-class ITKAppForm(npyscreen.FormMultiPage):
+
+class ITKAppForm(ITKFormRenderer, npyscreen.FormMultiPage):
     OK_BUTTON_BR_OFFSET = (2, 7)
     OKBUTTON_TYPE = TVButton
     OK_BUTTON_TEXT = "Done"
     BLANK_COLUMNS_RIGHT = 5
     FIX_MINIMUM_SIZE_WHEN_CREATED = False
+    shadow = True
 
     def __init__(self, border_width=2, *args, **kwargs):
-        self.shadow_pad = None
         self.border_width = border_width
         self.framed = True
 
@@ -452,21 +712,6 @@ class ITKAppForm(npyscreen.FormMultiPage):
     def ok_button_click(self):
         self.editing = False
 
-    def refresh(self):
-        if self.shadow_pad is None:
-            self.shadow_pad = curses.newpad(self.lines, self.columns)
-            self.shadow_pad.bkgdset(' ', self.theme_manager.findPair(self, 'FORMSHADOW'))
-
-        _my, _mx = self._max_physical()
-        self.shadow_pad.move(1, 1)
-
-        try:
-            self.shadow_pad.refresh(self.show_from_y, self.show_from_x, self.show_aty + 1, self.show_atx + 1, _my, _mx)
-        except curses.error:
-            pass
-
-        super().refresh()
-
     def draw_title_and_help(self):
         try:
             if self.name:
@@ -502,15 +747,30 @@ class ITKAppForm(npyscreen.FormMultiPage):
 
 
 class ITKCheckBox(npyscreen.Checkbox):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, change_callback=None, **kwargs):
         lc = kwargs.get('labelColor')
         if lc:
             self.labelColor = lc
         else:
             self.labelColor = 'FORMDEFAULT'
 
+        # called with this widget whenever the user edits its value
+        self.change_callback = change_callback
         super().__init__(*args, **kwargs)
 
+    def get_config_value(self):
+        """
+        Returns the value as it is written to an env file
+        """
+        return str(self.value).lower()
+
+    def render_state(self):
+        return self.value, bool(self.editing), self.name, self.labelColor
+
+    def when_value_edited(self):
+        if self.change_callback is not None:
+            self.change_callback(self)
+
     def update(self, clear=True):
         if clear: self.clear()
         if self.hidden:
@@ -564,42 +824,36 @@ def itk_notify_yes_no_cancel(parentApp, message, title="Confirm", editw=0):
     return F.value
 
 
-def itk_run_subprocess_form(parentApp, message, title="Confirm", proc_args=None, editw=0):
+def itk_run_subprocess_form(parentApp, message, title="Confirm", proc_args=None, editw=0, timeout_secs=None,
+                            log_filename=None):
     if proc_args is None:
         proc_args = []
 
-    F = ITKRunSubprocessForm(parentApp=parentApp, title=title, message=message, sub_process_args=proc_args)
+    F = ITKRunSubprocessForm(parentApp=parentApp, title=title, message=message, sub_process_args=proc_args,
+                             timeout_secs=timeout_secs, log_filename=log_filename)
     F.edit()
     ret = F.value
     return F.value
 
 
-class ItkNotifyForm(npyscreen.Form):
+def itk_run_task_form(parentApp, message, title, task, editw=0, log_filename=None):
+    """
+    Shows the output of a TaskRunner task while it runs. Returns 0 if the task succeeded, otherwise 1.
+    If log_filename is given the full output is also written to that file.
+    """
+    F = ITKRunTaskForm(parentApp=parentApp, title=title, message=message, task=task, log_filename=log_filename)
+    F.edit()
+    return F.value
+
+
+class ItkNotifyForm(ITKFormRenderer, npyscreen.Form):
     DEFAULT_LINES = 8
     DEFAULT_COLUMNS = 60
     SHOW_ATX = 10
     SHOW_ATY = 2
     OK_BUTTON_BR_OFFSET = (2, 7)
     OKBUTTON_TYPE = TVButton
-
-    def __init__(self, *args, **kwargs):
-        self.shadow_pad = None
-        super().__init__(*args, **kwargs)
-
-    def refresh(self):
-        if self.shadow_pad is None:
-            self.shadow_pad = curses.newpad(self.lines, self.columns)
-            self.shadow_pad.bkgdset(' ', self.theme_manager.findPair(self, 'FORMSHADOW'))
-
-        _my, _mx = self._max_physical()
-        self.shadow_pad.move(1, 1)
-
-        try:
-            self.shadow_pad.refresh(self.show_from_y, self.show_from_x, self.show_aty + 1, self.show_atx + 1, _my, _mx)
-        except curses.error:
-            pass
-
-        super().refresh()
+    shadow = True
 
     def draw_title_and_help(self):
         try:
@@ -633,49 +887,273 @@ def itk_notify_confirm(message, title="Message", editw=0):
     F.edit()
 
 
+class OutputBuffer:
+    """
+    A bounded ring buffer of wrapped output lines. Each line is wrapped once, as it is added, and once the buffer
+    holds max_lines display lines the oldest are dropped. If log_filename is given every line is also written to that
+    file so the full output is kept on disk.
+    """
+
+    def __init__(self, width, max_lines=OUTPUT_MAX_LINES, log_filename=None):
+        self.width = max(width, 1)
+        self.lines = collections.deque(maxlen=max_lines)
+        self.dropped_lines = 0
+        self.log_filename = log_filename
+        self.log_file = open(log_filename, 'w', encoding='utf-8') if log_filename is not None else None
+
+    def add_lines(self, lines):
+        """
+        Wraps and appends lines. Returns how many display lines were dropped from the start to make room.
+        """
+        dropped = 0
+
+        for line in lines:
+            if self.log_file is not None:
+                self.log_file.write(line + '\n')
+
+            for wrapped_line in self.wrap_line(line):
+                if len(self.lines) == self.lines.maxlen:
+                    dropped += 1
+
+                self.lines.append(wrapped_line)
+
+        if self.log_file is not None:
+            self.log_file.flush()
+
+        self.dropped_lines += dropped
+        return dropped
+
+    def wrap_line(self, line):
+        line = line.rstrip()
+
+        if not line:
+            return ['']
+
+        return textwrap.wrap(line, self.width) or ['']
+
+    def close(self):
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+
+
+class ITKOutputPager(npyscreen.Pager):
+    """
+    A pager for job output that can grow without limit. Lines go into an OutputBuffer, so only new lines are wrapped
+    and memory is bounded, and redraws are limited to one per OUTPUT_FRAME_INTERVAL_SECS. While the view is scrolled
+    to the end it follows new output.
+    """
+
+    def __init__(self, screen, max_lines=OUTPUT_MAX_LINES, log_filename=None, **keywords):
+        # we wrap lines as they are added; autowrap would rewrap everything on every update
+        keywords['autowrap'] = False
+        super().__init__(screen, **keywords)
+
+        self.buffer = OutputBuffer(self.width - 1, max_lines=max_lines, log_filename=log_filename)
+        self.values = self.buffer.lines
+        self.pending_redraw = False
+        self.last_redraw = 0.0
+
+    def add_lines(self, lines):
+        display_length = len(self._my_widgets)
+        following = self.start_display_at >= len(self.values) - display_length
+
+        dropped = self.buffer.add_lines(lines)
+
+        if following:
+            self.start_display_at = max(len(self.values) - display_length, 0)
+        else:
+            # keep the same lines in view as older ones are dropped
+            self.start_display_at = max(self.start_display_at - dropped, 0)
+
+        self.pending_redraw = True
+
+    def display_if_due(self, force=False):
+        """
+        Redraws if lines have been added and the last redraw was at least a frame ago (or force is set)
+        """
+        now = time.monotonic()
+
+        if self.pending_redraw and (force or now - self.last_redraw >= OUTPUT_FRAME_INTERVAL_SECS):
+            self.pending_redraw = False
+            self.last_redraw = now
+            self.display()
+
+    def destroy(self):
+        self.buffer.close()
+        super().destroy()
+
+
+class ITKPhaseProgress(npyscreen.Pager):
+    """
+    Shows the phase timing events of a job (see pkievents.py) as a progress bar with the phase that is running, and
+    the time taken by each phase so far
+    """
+
+    # room kept after the bar for the running phase, so the bar does not change length from phase to phase
+    PHASE_LABEL_WIDTH = 20
+
+    def __init__(self, screen, phase_timings=None, **keywords):
+        keywords['autowrap'] = False
+        super().__init__(screen, **keywords)
+        self.phase_timings = phase_timings
+        self.values = []
+
+    def update_progress(self):
+        width = self.width - 1
+        current_phase = self.phase_timings.current_phase()
+        label = '  {}...'.format(current_phase) if current_phase is not None else ''
+        durations = textwrap.wrap(self.phase_timings.format_durations(), width)
+
+        # the durations of the latest phases if they do not all fit
+        self.values = [self.phase_timings.format_bar(width - self.PHASE_LABEL_WIDTH) + label] + \
+            durations[max(len(durations) - (self.height - 1), 0):]
+
+
 class ITKRunSubprocessForm(ITKAppForm):
+    """
+    Runs a subprocess in the background, showing its output as it arrives. The form stays responsive while the
+    subprocess runs: the output can be scrolled and the Cancel button stops the subprocess.
+
+    Phase timing events (dictionaries, see pkievents.py) added to the output queue are shown as a progress bar above
+    the output when SHOW_PHASE_PROGRESS is set.
+    """
     OK_BUTTON_TEXT = "Close"
+    CANCEL_BUTTON_TEXT = "Cancel"
+    SHOW_PHASE_PROGRESS = False
+
+    # how often, in tenths of a second, we check for new output while waiting for key presses
+    OUTPUT_POLL_INTERVAL = 1
 
-    def __init__(self, parentApp, title, message, sub_process_args, *args, **kwargs):
+    def __init__(self, parentApp, title, message, sub_process_args, timeout_secs=None, log_filename=None, *args,
+                 **kwargs):
         self.intro = None
         self.background_thread = None
         self.sub_process_output_widget = None
+        self.phase_progress_widget = None
+        self.phase_timings = PhaseTimings() if self.SHOW_PHASE_PROGRESS else None
         self.sub_process_args = sub_process_args
+        self.timeout_secs = timeout_secs
+        self.log_filename = log_filename
         self.parentApp = parentApp
         self.title = title
         self.message = message
         self.value = None
 
+        # output lines from the background thread, shown by the UI thread
+        self.output_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.running = False
+
         super().__init__(name=title, *args, **kwargs)
+        self.keypress_timeout = self.OUTPUT_POLL_INTERVAL
 
         # after we have inited, we leave a mess on the screen so we have to redraw the background form.
         # note that calling edit on this form will show it in the correct place
         self.parentApp._Forms["MAIN"].display()
 
     def pre_edit_loop(self):
-        self.ok_button.hidden = True
+        self.running = True
+        self.set_ok_button_text(self.CANCEL_BUTTON_TEXT)
         self.display()
-        self.background_thread = threading.Thread(target=self.run_sub_process)
+
+        self.background_thread = threading.Thread(target=self.run_background, daemon=True)
         self.background_thread.start()
-        self.background_thread.join()
-        self.sub_process_done()
+
+    def run_background(self):
+        try:
+            self.run_sub_process()
+
+        except Exception as e:
+            self.add_subprocess_output_line('Error: {}'.format(e))
+
+        finally:
+            self.output_queue.put(Task.DONE)
 
     def run_sub_process(self):
-        self.value = run_sub_process(self.sub_process_args, self.add_subprocess_output_line)
+        self.value = run_sub_process(self.sub_process_args, self.add_subprocess_output_line,
+                                     timeout_secs=self.timeout_secs, cancel_event=self.cancel_event)
 
     def add_subprocess_output_line(self, line):
-        self.sub_process_output_widget.values.append(line)
-        self.sub_process_output_widget.display()
+        # called on the background thread; curses is only touched from the UI thread in while_waiting
+        self.output_queue.put(line)
+
+    def while_waiting(self):
+        self.show_pending_output()
+
+    def show_pending_output(self):
+        new_lines = []
+        new_events = False
+        done = False
+
+        while True:
+            try:
+                line = self.output_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if line is Task.DONE:
+                done = True
+            elif isinstance(line, dict):
+                if self.phase_timings is not None:
+                    self.phase_timings.add_event(line)
+                    new_events = True
+            else:
+                new_lines.append(line)
+
+        if new_lines:
+            self.sub_process_output_widget.add_lines(new_lines)
+
+        if new_events:
+            self.phase_progress_widget.update_progress()
+            self.phase_progress_widget.display()
+
+        if done:
+            if self.phase_timings is not None and self.phase_timings.completed:
+                self.sub_process_output_widget.add_lines(['Phase timings: {}'.format(
+                    self.phase_timings.format_durations())])
+
+            if self.log_filename is not None:
+                self.sub_process_output_widget.add_lines(['Full output written to {}'.format(self.log_filename)])
+
+            self.sub_process_output_widget.display_if_due(force=True)
+            self.sub_process_done()
+        else:
+            self.sub_process_output_widget.display_if_due()
 
     def sub_process_done(self):
-        self.ok_button.hidden = False
-        self.editw = 2
+        self.running = False
+        self.set_ok_button_text(self.OK_BUTTON_TEXT)
+
+        # move the cursor from the output to the close button
+        self.sub_process_output_widget.editing = False
+        self.sub_process_output_widget.how_exited = EXITED_DOWN
         self.display()
 
+    def set_ok_button_text(self, text):
+        _my, mx = self.curses_pad.getmaxyx()
+        self.ok_button.clear()
+        self.ok_button.name = text
+        self.ok_button.relx = mx - len(text) - self.__class__.OK_BUTTON_BR_OFFSET[1]
+        self.ok_button.update()
+
+    def ok_button_click(self):
+        if self.running:
+            self.cancel()
+        else:
+            self.editing = False
+
+    def cancel(self):
+        self.cancel_event.set()
+
     def afterEditing(self):
         self.intro.destroy()
         del self.intro
 
+        if self.phase_progress_widget is not None:
+            self.phase_progress_widget.destroy()
+            self.phase_progress_widget = None
+
         self.sub_process_output_widget.destroy()
         del self.sub_process_output_widget
 
@@ -686,7 +1164,56 @@ class ITKRunSubprocessForm(ITKAppForm):
         self.intro = self.add(npyscreen.Pager, name="Intro", values=wrapped_text, autowrap=True, max_height=5,
                               editable=False)
 
-        self.sub_process_output_widget = self.add(npyscreen.Pager, name="Output", autowrap=True, editable=True)
+        if self.phase_timings is not None:
+            self.phase_progress_widget = self.add(ITKPhaseProgress, name="Progress", phase_timings=self.phase_timings,
+                                                  max_height=3, editable=False)
+            self.phase_progress_widget.update_progress()
+
+        self.sub_process_output_widget = self.add(ITKOutputPager, name="Output", log_filename=self.log_filename,
+                                                  editable=True)
+
+
+class ITKRunTaskForm(ITKRunSubprocessForm):
+    """
+    As ITKRunSubprocessForm but shows the output of an in process TaskRunner task rather than a subprocess, with the
+    progress of its phases
+    """
+    SHOW_PHASE_PROGRESS = True
+
+    def __init__(self, parentApp, title, message, task, log_filename=None, *args, **kwargs):
+        self.task = task
+        super().__init__(parentApp, title, message, None, log_filename=log_filename, *args, **kwargs)
+
+    def run_sub_process(self):
+        while True:
+            self.forward_task_events()
+
+            try:
+                line = self.task.output.get(timeout=0.1)
+
+            except queue.Empty:
+                if self.cancel_event.is_set():
+                    # tasks cannot be interrupted; stop showing this one and let it finish in the background
+                    self.add_subprocess_output_line('Cancelled. The operation will finish in the background.')
+                    return
+
+                continue
+
+            if line is Task.DONE:
+                break
+
+            self.add_subprocess_output_line(line)
+
+        self.forward_task_events()
+        self.value = 0 if self.task.ok else 1
+
+    def forward_task_events(self):
+        # events go through the output queue so that only the UI thread touches the progress widget
+        while True:
+            try:
+                self.output_queue.put(self.task.events.get_nowait())
+            except queue.Empty:
+                return
 
 
 class ITKConfirmForm(ITKAppForm):
@@ -742,9 +1269,15 @@ class ITKConfirmForm(ITKAppForm):
 
 
 class ITKConfigurationGroupForm(ITKAppForm):
-    def __init__(self, config_group, *args, **kwargs):
+    def __init__(self, config_group, values=None, value_changed_callback=None, *args, **kwargs):
         self.config_group = config_group
         self.config_widgets = []
+
+        # values to show instead of the saved ones, as {item name: value}, e.g. edits made before the form was released
+        self.initial_values = values or {}
+
+        # called as value_changed_callback(group id, item, value) whenever the user edits a config value
+        self.value_changed_callback = value_changed_callback
         super().__init__(name=self.config_group['name'], *args, **kwargs)
 
     def afterEditing(self):
@@ -758,26 +1291,39 @@ class ITKConfigurationGroupForm(ITKAppForm):
         for item in self.config_group['items']:
             value = ""
             w = None
+            item_value = self.initial_values.get(item['name'], item.get('value'))
 
             if item['type'] == 'string':
-                if 'value' in item:
-                    value = item['value']
+                if item_value is not None:
+                    value = item_value
 
                 w = self.add_widget_intelligent(ITKTitleText, name=item['name'], value=value, labelColor="FORMDEFAULT",
-                                                color="INPUT", highlight_whole_widget=True)
+                                                color="INPUT", highlight_whole_widget=True,
+                                                change_callback=self.get_change_callback(item))
 
             elif item['type'] == 'bool':
-                if 'value' in item:
-                    if item['value'].lower() == 'true':
+                if item_value is not None:
+                    if item_value.lower() == 'true':
                         value = True
                     else:
                         value = False
 
                 w = self.add_widget_intelligent(ITKCheckBox, name=item['name'], value=value, labelColor="FORMDEFAULT",
-                                                color="FORMDEFAULT")
+                                                color="FORMDEFAULT", change_callback=self.get_change_callback(item))
 
             self.config_widgets.append((item, w))
 
             self.nextrely += 1  # add a space between the widgets
 
         super().create()
+
+    def get_change_callback(self, item):
+        """
+        Returns a closure over the config item that passes the item's edited value to value_changed_callback
+        """
+
+        def change_callback(widget):
+            if self.value_changed_callback is not None:
+                self.value_changed_callback(self.config_group['id'], item, widget.get_config_value())
+
+        return change_callback
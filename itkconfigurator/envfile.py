@@ -0,0 +1,256 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import mmap
+import os
+import re
+import stat
+import tempfile
+from collections import namedtuple
+
+# A single NAME=value assignment found in an env file.
+#   name: the env var name
+#   raw_value: the value exactly as written in the file, including any quotes
+#   value: the decoded value i.e. quotes removed and escapes interpreted
+#   quote: the quote character used in the file ('"', "'") or '' for an unquoted value
+#   line_number: 1 based line number within the file
+#   line: the full original line text, including its line terminator
+#   line_span: (start, end) byte offsets of the full line within the file
+#   value_span: (start, end) byte offsets of raw_value within the file
+EnvFileRecord = namedtuple('EnvFileRecord', ['name', 'raw_value', 'value', 'quote', 'line_number', 'line',
+                                             'line_span', 'value_span'])
+
+# matches one assignment line. an inline comment must be preceded by whitespace (or start the value) so '#' characters
+# inside a value such as a URL fragment are kept.
+_ENV_LINE_RE = re.compile(
+    rb'^[ \t]*(?:export[ \t]+)?'
+    rb'(?P<name>[A-Za-z_][A-Za-z0-9_.]*)[ \t]*=[ \t]*'
+    rb'(?P<value>"(?:[^"\\\r\n]|\\.)*"'
+    rb'|\'[^\'\r\n]*\''
+    rb'|(?:[^\s#]\S*(?:[ \t]+[^\s#]\S*)*)?)'
+    rb'[ \t]*(?:#[^\r\n]*)?\r?(?:\n|\Z)',
+    re.MULTILINE)
+
+# what may come before the var name on an assignment line
+_ENV_PREFIX_RE = re.compile(rb'[ \t]*(?:export[ \t]+)?')
+
+_DOUBLE_QUOTE_ESCAPE_RE = re.compile(r'\\(.)')
+_DOUBLE_QUOTE_ESCAPES = {'n': '\n', 'r': '\r', 't': '\t'}
+
+# values matching this need to be quoted to survive a round trip through the tokenizer
+_NEEDS_QUOTING_RE = re.compile(r'^[\s#"\']|\s$|\s#|[\r\n]')
+
+
+def decode_env_value(raw_value):
+    """
+    Returns (value, quote) for a raw value as written in an env file
+    """
+    if len(raw_value) >= 2 and raw_value[0] == raw_value[-1] == '"':
+        return _DOUBLE_QUOTE_ESCAPE_RE.sub(lambda m: _DOUBLE_QUOTE_ESCAPES.get(m[1], m[1]), raw_value[1:-1]), '"'
+
+    if len(raw_value) >= 2 and raw_value[0] == raw_value[-1] == "'":
+        return raw_value[1:-1], "'"
+
+    return raw_value, ''
+
+
+def encode_env_value(value, quote=''):
+    """
+    Returns value formatted for writing to an env file. The given quote style (normally the one the value was
+    originally written with) is kept where possible; values that cannot be written unquoted are double quoted.
+    """
+    if quote == "'" and "'" not in value and '\n' not in value:
+        return "'" + value + "'"
+
+    if quote or _NEEDS_QUOTING_RE.search(value):
+        escaped = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+        return '"' + escaped + '"'
+
+    return value
+
+
+def tokenize_env_bytes(data, encoding='utf-8'):
+    """
+    Generator yielding an EnvFileRecord for every assignment in the env file content given as bytes (or any other
+    buffer such as an mmap). Comment lines, blank lines and lines we cannot interpret are skipped.
+    """
+    return _records_from_matches(data, _ENV_LINE_RE.finditer(data), encoding)
+
+
+def find_env_records(data, names, encoding='utf-8'):
+    """
+    Returns a list of EnvFileRecords for every assignment to one of the given env var names in the env file content
+    given as bytes (or an mmap). Candidate lines are located with a plain substring search so this is much cheaper than
+    tokenizing the whole file when only a few vars are wanted.
+    """
+    line_starts = set()
+
+    for name in set(names):
+        name_bytes = name.encode(encoding)
+        position = data.find(name_bytes)
+
+        while position >= 0:
+            line_start = data.rfind(b'\n', 0, position) + 1
+
+            if _ENV_PREFIX_RE.fullmatch(data[line_start:position]):
+                line_starts.add(line_start)
+
+            position = data.find(name_bytes, position + len(name_bytes))
+
+    matches = [_ENV_LINE_RE.match(data, line_start) for line_start in sorted(line_starts)]
+    return [record for record in _records_from_matches(data, (m for m in matches if m is not None), encoding)
+            if record.name in names]
+
+
+def _records_from_matches(data, matches, encoding):
+    line_number = 1
+    counted_to = 0
+
+    for match in matches:
+        start = match.start()
+        line_number += data[counted_to:start].count(b'\n')
+        counted_to = start
+
+        raw_value = match['value'].decode(encoding)
+        value, quote = decode_env_value(raw_value)
+
+        yield EnvFileRecord(match['name'].decode(encoding), raw_value, value, quote, line_number,
+                            match[0].decode(encoding), match.span(), match.span('value'))
+
+
+def tokenize_env_file(filename, encoding='utf-8'):
+    """
+    Returns a list of EnvFileRecords for all the assignments in the named env file
+    """
+    with open(filename, 'rb') as file:
+        data = file.read()
+
+    return list(tokenize_env_bytes(data, encoding))
+
+
+def replace_env_line_value(line, new_value, encoding='utf-8'):
+    """
+    Returns the env file line with its value replaced by new_value, keeping everything else on the line (export
+    prefix, spacing, quote style, inline comment and line terminator) as it was. Lines without an assignment are
+    returned unchanged.
+    """
+    data = line.encode(encoding)
+    record = next(tokenize_env_bytes(data, encoding), None)
+
+    if record is None:
+        return line
+
+    value_start, value_end = record.value_span
+    return (data[:value_start].decode(encoding) + encode_env_value(new_value, record.quote)
+            + data[value_end:].decode(encoding))
+
+
+
+def splice_bytes(data, replacements):
+    """
+    Returns data with each ((start, end), new_bytes) replacement applied. Spans must not overlap.
+    """
+    parts = []
+    position = 0
+
+    for (start, end), new_bytes in sorted(replacements, key=lambda r: r[0]):
+        parts.append(data[position:start])
+        parts.append(new_bytes)
+        position = end
+
+    parts.append(data[position:])
+    return b''.join(parts)
+
+
+def write_file_atomic(filename, data):
+    """
+    Replaces the content of filename with data such that readers (and a crash part way through) see either the old
+    or the new content, never a partially written file. The data is written to a temporary file in the same directory,
+    flushed to disk and renamed over the original. Symlinks are followed and the original file mode is kept.
+    """
+    filename = os.path.realpath(filename)
+    directory = os.path.dirname(filename)
+
+    fd, tmp_filename = tempfile.mkstemp(dir=directory, prefix='.{}.'.format(os.path.basename(filename)),
+                                        suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+
+        try:
+            os.chmod(tmp_filename, stat.S_IMODE(os.stat(filename).st_mode))
+        except FileNotFoundError:
+            pass
+
+        os.replace(tmp_filename, filename)
+
+    except BaseException:
+        try:
+            os.unlink(tmp_filename)
+        except FileNotFoundError:
+            pass
+        raise
+
+    # make sure the rename itself is durable
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def patch_file_in_place(filename, replacements, appended=b''):
+    """
+    Applies ((start, end), new_bytes) replacements to a file in place using memory mapped I/O and appends any
+    appended bytes to the end. Only the bytes from the first change onward are rewritten; when every replacement is
+    the same length as the bytes it replaces only those bytes are written.
+    Returns the offset of the first changed byte, or None if there was nothing to change.
+
+    Unlike write_file_atomic this does not protect against a crash part way through a write that changes the file
+    length, but it avoids reading and rewriting the whole of a large file to change a single value.
+    """
+    if not replacements and not appended:
+        return None
+
+    with open(filename, 'r+b') as file:
+        size = os.fstat(file.fileno()).st_size
+        first_changed = min([span[0] for span, _new_bytes in replacements] + [size])
+
+        if size == 0 or first_changed == size:
+            # nothing to map, only appending
+            file.seek(size)
+            file.write(appended)
+
+        else:
+            with mmap.mmap(file.fileno(), 0) as mapped:
+                if not appended and all(end - start == len(new_bytes) for (start, end), new_bytes in replacements):
+                    for (start, end), new_bytes in replacements:
+                        mapped[start:end] = new_bytes
+
+                    mapped.flush()
+                    return first_changed
+
+                tail = splice_bytes(mapped[first_changed:], [((start - first_changed, end - first_changed), new_bytes)
+                                                             for (start, end), new_bytes in replacements]) + appended
+
+            file.seek(first_changed)
+            file.write(tail)
+            file.truncate()
+
+        file.flush()
+        os.fsync(file.fileno())
+
+    return first_changed
@@ -0,0 +1,106 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+# A gap buffer keeps text as a list of characters with an unused gap at the position of the last edit. Typing and
+# deleting happen at the gap so they cost the same however long the text is; editing somewhere else first moves the gap
+# there, which costs the distance moved. The text is only joined into a str when it is asked for, and a slice (for
+# example the part of a field that is on screen) costs only its own length.
+
+MIN_GAP_SIZE = 64
+
+
+class GapBuffer:
+    def __init__(self, text=''):
+        self.chars = list(text) + [None] * MIN_GAP_SIZE
+        self.gap_start = len(text)
+        self.gap_end = len(self.chars)
+
+        # the whole text as a str, or None if it has been edited since it was last asked for
+        self.text = text
+
+    def __len__(self):
+        return len(self.chars) - (self.gap_end - self.gap_start)
+
+    def __str__(self):
+        if self.text is None:
+            self.text = ''.join(self.chars[:self.gap_start]) + ''.join(self.chars[self.gap_end:])
+
+        return self.text
+
+    def clamp(self, position):
+        return min(max(position, 0), len(self))
+
+    def move_gap(self, position):
+        if position < self.gap_start:
+            count = self.gap_start - position
+            self.chars[self.gap_end - count:self.gap_end] = self.chars[position:self.gap_start]
+            self.gap_start -= count
+            self.gap_end -= count
+
+        elif position > self.gap_start:
+            count = position - self.gap_start
+            self.chars[self.gap_start:self.gap_start + count] = self.chars[self.gap_end:self.gap_end + count]
+            self.gap_start += count
+            self.gap_end += count
+
+    def insert(self, position, text):
+        """
+        Inserts text at position (clamped to the text). Returns the number of characters inserted.
+        """
+        if not text:
+            return 0
+
+        gap_size = self.gap_end - self.gap_start
+
+        # grow the gap in proportion to the text so that a run of inserts is not a run of reallocations
+        if len(text) > gap_size:
+            grow_by = len(text) + max(MIN_GAP_SIZE, len(self))
+            self.chars[self.gap_start:self.gap_start] = [None] * grow_by
+            self.gap_end += grow_by
+
+        self.move_gap(self.clamp(position))
+        self.chars[self.gap_start:self.gap_start + len(text)] = text
+        self.gap_start += len(text)
+        self.text = None
+        return len(text)
+
+    def delete(self, start, end):
+        """
+        Deletes the text from start up to end (both clamped to the text). Returns the number of characters deleted.
+        """
+        start = self.clamp(start)
+        end = self.clamp(end)
+
+        if start >= end:
+            return 0
+
+        self.move_gap(start)
+        self.gap_end += end - start
+        self.text = None
+        return end - start
+
+    def slice(self, start, end):
+        """
+        Returns the text from start up to end (both clamped to the text)
+        """
+        start = self.clamp(start)
+        end = self.clamp(end)
+        gap_size = self.gap_end - self.gap_start
+
+        if end <= self.gap_start:
+            return ''.join(self.chars[start:end])
+
+        if start >= self.gap_start:
+            return ''.join(self.chars[start + gap_size:end + gap_size])
+
+        return ''.join(self.chars[start:self.gap_start]) + ''.join(self.chars[self.gap_end:end + gap_size])
@@ -0,0 +1,246 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import argparse
+import contextlib
+import json
+import sys
+from pathlib import Path
+
+from itkconfigurator.changeset import ChangeTargetError, EnvChangeSet, build_change_set_from_values, describe_changes, \
+    patch_to_values
+from itkconfigurator.configscheme import DEFAULT_SCHEMA_FILENAME, ITKConfigurationScheme
+from itkconfigurator.pkibackend import PKI_BACKENDS, create_pki_backend
+from itkconfigurator.schemacache import SchemaError
+
+# Headless, non-interactive entry point for applying configuration from scripts and CI pipelines. Nothing in here
+# imports curses or npyscreen so it starts quickly.
+#
+# e.g.
+#   itkconfigurator-cli apply --env mc=./mojaloop-connector.env DFSP_ID=mydfsp PEER_ENDPOINT=hub.example.com:443
+#   itkconfigurator-cli apply --env mc=./mojaloop-connector.env --patch tenant.yaml --dry-run
+#   itkconfigurator-cli validate --env mc=./mojaloop-connector.env
+#   itkconfigurator-cli provision ./tenants.yaml --workers 8
+#
+# Results are written to stdout as JSON. The exit code is 0 on success, 1 if validation or applying changes failed and
+# 2 for usage errors.
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+
+class HeadlessUsageError(Exception):
+    pass
+
+
+def parse_env_file_args(env_args):
+    """
+    Converts ['id=path', ...] command line args to [(id, absolute path), ...]
+    """
+    env_files = []
+
+    for env_arg in env_args:
+        env_file_id, sep, file_name = env_arg.partition('=')
+
+        if not sep or not env_file_id or not file_name:
+            raise HeadlessUsageError("Env files should be given as id=path e.g. mc=./mojaloop-connector.env, got '{}'"
+                                     .format(env_arg))
+
+        env_files.append((env_file_id, str(Path.cwd() / file_name)))
+
+    return env_files
+
+
+def load_patch_file(filename):
+    """
+    Loads a YAML or JSON patch file. The file is either a flat mapping of env var names to values, or a mapping of env
+    file ids to such mappings e.g.
+        mc:
+          DFSP_ID: mydfsp
+    """
+    with open(filename, 'r') as file:
+        if str(filename).endswith('.json'):
+            try:
+                patch = json.load(file)
+            except ValueError as e:
+                raise HeadlessUsageError("Patch file '{}' is not valid JSON: {}".format(filename, e))
+        else:
+            import yaml
+
+            try:
+                patch = yaml.safe_load(file)
+            except yaml.YAMLError as e:
+                raise HeadlessUsageError("Patch file '{}' is not valid YAML: {}".format(filename, e))
+
+    if patch is None:
+        return {}
+
+    if not isinstance(patch, dict):
+        raise HeadlessUsageError("Patch file '{}' must contain a mapping".format(filename))
+
+    return patch
+
+
+def build_change_set(scheme, assignments, patch_filenames):
+    """
+    Builds a change set from '[id:]NAME=value' assignments and patch files. Later values override earlier ones;
+    assignments are applied after patch files.
+    """
+    values = []
+
+    for patch_filename in patch_filenames:
+        values.extend(patch_to_values(scheme, load_patch_file(patch_filename)))
+
+    for assignment in assignments:
+        target, sep, value = assignment.partition('=')
+
+        if not sep or not target:
+            raise HeadlessUsageError("Assignments should be given as [id:]NAME=value, got '{}'".format(assignment))
+
+        env_file_id, _, name = target.rpartition(':')
+        values.append((env_file_id or None, name, value))
+
+    return build_change_set_from_values(scheme, values)
+
+
+def load_scheme(args):
+    return ITKConfigurationScheme(args.schema, env_files=parse_env_file_args(args.env))
+
+
+def command_apply(args):
+    scheme = load_scheme(args)
+    result = {'command': 'apply', 'dry_run': args.dry_run, 'changes': [], 'written': [], 'restart_services': [],
+              'errors': []}
+
+    change_set = build_change_set(scheme, args.assignments, args.patch or [])
+    result['changes'] = describe_changes(scheme, change_set)
+    result['errors'] = scheme.validate(change_set)
+
+    if result['errors']:
+        return EXIT_FAILED, result
+
+    if not args.dry_run:
+        try:
+            written = scheme.apply_change_set(change_set, missing=args.missing, in_place=args.in_place)
+        except (KeyError, ValueError) as e:
+            result['errors'].append({'error': str(e.args[0]) if e.args else str(e)})
+            return EXIT_FAILED, result
+
+        result['written'] = [path for _env_file_id, path in written]
+        result['restart_services'] = scheme.get_services_to_restart()
+
+    return EXIT_OK, result
+
+
+def command_validate(args):
+    errors = load_scheme(args).validate()
+    return (EXIT_FAILED if errors else EXIT_OK), {'command': 'validate', 'errors': errors}
+
+
+def command_provision(args):
+    # imported here as the orchestrator and yaml are only needed to provision
+    from itkconfigurator.orchestrator import ProvisioningOrchestrator, load_manifest
+
+    try:
+        settings, tenants = load_manifest(args.manifest)
+    except ValueError as e:
+        raise HeadlessUsageError(str(e))
+
+    pki_backend = args.pki_backend or settings.get('pki_backend')
+    orchestrator = ProvisioningOrchestrator(tenants, schema_filename=args.schema or settings.get('schema',
+                                                                                              DEFAULT_SCHEMA_FILENAME),
+                                            workers=args.workers or settings.get('workers'))
+
+    if pki_backend is not None:
+        orchestrator.pki_factory = lambda: create_pki_backend(pki_backend)
+
+    # PKI operations report progress on stdout; keep stdout for our JSON result
+    with contextlib.redirect_stdout(sys.stderr):
+        summary = orchestrator.run()
+
+    if args.timing_report:
+        orchestrator.phase_timings.write_report(args.timing_report)
+
+    return (EXIT_FAILED if summary['failed'] else EXIT_OK), {'command': 'provision', **summary}
+
+
+def create_arg_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--schema', default=str(DEFAULT_SCHEMA_FILENAME), help='ITK configuration schema file')
+    common.add_argument('--env', action='append', required=True, metavar='ID=PATH',
+                        help='env file to operate on e.g. mc=./mojaloop-connector.env. May be given more than once.')
+
+    parser = argparse.ArgumentParser(prog='itkconfigurator-cli',
+                                     description='Non-interactive Mojaloop ITK configuration tool')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    apply_parser = subparsers.add_parser('apply', parents=[common],
+                                         help='apply values to env files and print the changes as JSON')
+    apply_parser.add_argument('assignments', nargs='*', metavar='[ID:]NAME=VALUE', help='env var values to set')
+    apply_parser.add_argument('--patch', action='append', metavar='FILE',
+                              help='YAML or JSON file of env var values to set. May be given more than once.')
+    apply_parser.add_argument('--dry-run', action='store_true', help='validate and print changes without writing')
+    apply_parser.add_argument('--missing', default=EnvChangeSet.MISSING_ERROR,
+                              choices=[EnvChangeSet.MISSING_ERROR, EnvChangeSet.MISSING_IGNORE,
+                                       EnvChangeSet.MISSING_APPEND],
+                              help='what to do with vars that are not in the env file (default: error)')
+    apply_parser.add_argument('--in-place', action='store_true',
+                              help='patch env files in place rather than replacing them atomically')
+    apply_parser.set_defaults(func=command_apply)
+
+    validate_parser = subparsers.add_parser('validate', parents=[common],
+                                            help='validate env file values against the schema')
+    validate_parser.set_defaults(func=command_validate)
+
+    provision_parser = subparsers.add_parser('provision',
+                                             help='provision many tenant deployments from a manifest in parallel')
+    provision_parser.add_argument('manifest', help='YAML manifest listing the tenant directories to provision')
+    provision_parser.add_argument('--schema', help='ITK configuration schema file')
+    provision_parser.add_argument('--workers', type=int, help='number of tenants to provision concurrently '
+                                                              '(default: number of CPUs)')
+    provision_parser.add_argument('--pki-backend', choices=PKI_BACKENDS,
+                                  help='PKI backend for mTLS and JWS generation (default: $ITK_PKI_BACKEND or vault)')
+    provision_parser.add_argument('--timing-report', metavar='FILE',
+                                  help='write the time spent in each PKI phase, and the timing events, to FILE as JSON')
+    provision_parser.set_defaults(func=command_provision)
+
+    return parser
+
+
+def run(argv=None, out=sys.stdout):
+    """
+    Runs a headless command. Returns (exit code, result dictionary) and writes the result to out as JSON.
+    """
+    args = create_arg_parser().parse_args(argv)
+
+    try:
+        exit_code, result = args.func(args)
+
+    except (HeadlessUsageError, ChangeTargetError, SchemaError, OSError) as e:
+        exit_code, result = EXIT_USAGE, {'command': args.command, 'errors': [{'error': str(e)}]}
+
+    if out is not None:
+        json.dump(result, out, indent=2)
+        out.write('\n')
+
+    return exit_code, result
+
+
+def main():
+    exit_code, _result = run()
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import multiprocessing
+import os
+import secrets
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
+except ImportError:
+    serialization = None
+
+# A pool of pre-generated private keys so key and certificate generation does not wait on key generation, which for
+# 4096 bit RSA keys takes seconds.
+#
+# Keys are generated in a pool of low priority worker processes and stored encrypted (PKCS#8, with a passphrase from
+# ITK_KEY_POOL_PASSPHRASE or a generated passphrase file kept outside the pool directory) one key per file:
+#   <pool dir>/<key spec>/<id>.pem
+# Taking a key claims its file with an atomic rename, so several processes can share a pool.
+#
+# Key specs are rsa-<bits> or ec-<curve> e.g. rsa-4096, rsa-2048, ec-p256. ITK_KEY_POOL sets the watermark (number of
+# keys to keep ready) for each spec e.g. 'rsa-4096:2,rsa-2048:6', or 'off' to disable the pool.
+
+KEY_POOL_ENV_VAR = 'ITK_KEY_POOL'
+KEY_POOL_PASSPHRASE_ENV_VAR = 'ITK_KEY_POOL_PASSPHRASE'
+DEFAULT_POOL_DIR = './keypool'
+DEFAULT_WATERMARKS = {'rsa-4096': 2, 'rsa-2048': 6}
+REFILL_INTERVAL_SECS = 60
+
+EC_CURVES = {
+    'p256': 'SECP256R1',
+    'p384': 'SECP384R1',
+    'p521': 'SECP521R1',
+}
+
+
+def parse_watermarks(setting):
+    """
+    Parses 'spec:count,...' into {spec: count}. Returns None if the pool is turned off.
+    """
+    if setting.strip().lower() in ('off', '0', 'false', 'no'):
+        return None
+
+    watermarks = {}
+
+    for entry in setting.split(','):
+        spec, _, count = entry.strip().partition(':')
+        parse_key_spec(spec)
+        watermarks[spec] = int(count) if count else 1
+
+    return watermarks
+
+
+def parse_key_spec(spec):
+    """
+    Returns ('rsa', bits) or ('ec', curve class name) for a key spec
+    """
+    key_type, _, size = spec.partition('-')
+
+    if key_type == 'rsa' and size.isdigit():
+        return key_type, int(size)
+
+    if key_type == 'ec' and size in EC_CURVES:
+        return key_type, EC_CURVES[size]
+
+    raise ValueError("Unknown key spec '{}', expected e.g. rsa-2048 or ec-p256".format(spec))
+
+
+def generate_private_key(spec):
+    key_type, size = parse_key_spec(spec)
+
+    if key_type == 'rsa':
+        return rsa.generate_private_key(public_exponent=65537, key_size=size)
+
+    return ec.generate_private_key(getattr(ec, size)())
+
+
+def generate_encrypted_key_pem(spec, passphrase):
+    # runs in a pool worker process
+    key = generate_private_key(spec)
+    return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                             serialization.BestAvailableEncryption(passphrase))
+
+
+def lower_worker_priority():
+    # pool workers should not slow down anything interactive
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+
+
+class KeyPool:
+    """
+    Pre-generated, encrypted at rest private keys. take(spec) returns a pooled key, or None if the pool is empty, and
+    refill() tops each key spec up to its watermark.
+    """
+
+    def __init__(self, pool_dir=DEFAULT_POOL_DIR, watermarks=None, passphrase=None, workers=None):
+        if serialization is None:
+            raise ImportError('The key pool needs the cryptography package: pip install cryptography')
+
+        self.pool_dir = pool_dir
+        self.watermarks = dict(watermarks or DEFAULT_WATERMARKS)
+        self.passphrase = passphrase
+        self.workers = workers or max((os.cpu_count() or 2) - 1, 1)
+
+        self.refill_lock = threading.Lock()
+        self.refill_needed = threading.Event()
+        self.stopping = threading.Event()
+        self.refill_thread = None
+        self.executor = None
+
+        # the error the last background refill failed with, or None; the refill thread must not print over the UI
+        self.last_refill_error = None
+
+    @classmethod
+    def from_environment(cls, pool_dir=DEFAULT_POOL_DIR):
+        """
+        Returns a KeyPool configured from ITK_KEY_POOL, or None if the pool is turned off or cannot be used here
+        """
+        setting = os.environ.get(KEY_POOL_ENV_VAR)
+        watermarks = parse_watermarks(setting) if setting else DEFAULT_WATERMARKS
+
+        if watermarks is None or serialization is None:
+            return None
+
+        return cls(pool_dir, watermarks)
+
+    def get_passphrase(self):
+        if self.passphrase is None:
+            passphrase = os.environ.get(KEY_POOL_PASSPHRASE_ENV_VAR)
+
+            if passphrase is None:
+                passphrase = self.read_or_create_passphrase_file()
+
+            self.passphrase = passphrase.encode('utf-8')
+
+        return self.passphrase
+
+    def read_or_create_passphrase_file(self):
+        # kept next to, not in, the pool directory so a copy of the pool alone is no use to anyone
+        passphrase_path = os.path.normpath(self.pool_dir) + '.key'
+
+        try:
+            fd = os.open(passphrase_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            with open(passphrase_path, 'r') as file:
+                return file.read().strip()
+
+        passphrase = secrets.token_urlsafe(32)
+
+        with open(fd, 'w') as file:
+            file.write(passphrase)
+
+        return passphrase
+
+    def spec_dir(self, spec):
+        return os.path.join(self.pool_dir, spec)
+
+    def pooled_key_files(self, spec):
+        try:
+            return sorted(f for f in os.listdir(self.spec_dir(spec)) if f.endswith('.pem'))
+        except FileNotFoundError:
+            return []
+
+    def available(self, spec):
+        return len(self.pooled_key_files(spec))
+
+    def take(self, spec):
+        """
+        Removes a key from the pool and returns it, or returns None if there are no pooled keys of this spec
+        """
+        try:
+            for filename in self.pooled_key_files(spec):
+                path = os.path.join(self.spec_dir(spec), filename)
+                claimed_path = '{}.claimed-{}'.format(path, uuid.uuid4().hex)
+
+                try:
+                    os.rename(path, claimed_path)
+                except FileNotFoundError:
+                    # another process took this one
+                    continue
+
+                try:
+                    # these are keys we generated, so skip the (slow, for large RSA keys) consistency checks
+                    with open(claimed_path, 'rb') as file:
+                        return serialization.load_pem_private_key(file.read(), password=self.get_passphrase(),
+                                                                  unsafe_skip_rsa_key_validation=True)
+                finally:
+                    os.unlink(claimed_path)
+
+            return None
+
+        finally:
+            self.refill_needed.set()
+
+    def store(self, spec, key_pem):
+        directory = self.spec_dir(spec)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+        # write under a name take() ignores, then rename so a key is never taken half written
+        key_id = uuid.uuid4().hex
+        tmp_path = os.path.join(directory, '{}.tmp'.format(key_id))
+
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as file:
+            file.write(key_pem)
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(tmp_path, os.path.join(directory, '{}.pem'.format(key_id)))
+
+    def refill(self):
+        """
+        Generates keys until every spec is at its watermark, storing each as soon as it is ready. Returns the number
+        of keys generated. Only one refill runs at a time in a process; if one is already running this returns 0.
+        """
+        if not self.refill_lock.acquire(blocking=False):
+            return 0
+
+        try:
+            needed = [spec for spec, watermark in self.watermarks.items()
+                      for _ in range(max(watermark - self.available(spec), 0))]
+
+            if not needed or self.stopping.is_set():
+                return 0
+
+            passphrase = self.get_passphrase()
+            generated = 0
+            self.executor = ProcessPoolExecutor(max_workers=min(self.workers, len(needed)),
+                                                mp_context=multiprocessing.get_context('spawn'),
+                                                initializer=lower_worker_priority)
+
+            try:
+                futures = {self.executor.submit(generate_encrypted_key_pem, spec, passphrase): spec
+                           for spec in needed}
+
+                for future in as_completed(futures):
+                    if future.cancelled() or self.stopping.is_set():
+                        continue
+
+                    self.store(futures[future], future.result())
+                    generated += 1
+
+            finally:
+                self.executor.shutdown(wait=True, cancel_futures=True)
+                self.executor = None
+
+            return generated
+
+        finally:
+            self.refill_lock.release()
+
+    def start_background_refill(self, interval_secs=REFILL_INTERVAL_SECS):
+        """
+        Starts a thread that refills the pool now, whenever a key is taken and at least every interval_secs
+        """
+        if self.refill_thread is not None:
+            return self.refill_thread
+
+        def refill_loop():
+            while not self.stopping.is_set():
+                self.refill_needed.clear()
+
+                try:
+                    self.refill()
+                    self.last_refill_error = None
+                except Exception as e:
+                    self.last_refill_error = '{}: {}'.format(type(e).__name__, e)
+
+                self.refill_needed.wait(interval_secs)
+
+        self.refill_thread = threading.Thread(target=refill_loop, name='key-pool-refill', daemon=True)
+        self.refill_thread.start()
+        return self.refill_thread
+
+    def stop(self):
+        """
+        Stops background refilling, abandoning keys that have not started generating yet
+        """
+        self.stopping.set()
+        self.refill_needed.set()
+
+        executor = self.executor
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
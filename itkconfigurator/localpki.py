@@ -0,0 +1,241 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import datetime
+import os
+import threading
+
+from itkconfigurator import pkievents
+from itkconfigurator.pkibackend import PkiBackend
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+except ImportError:
+    x509 = None
+
+
+class LocalPkiBackend(PkiBackend):
+    """
+    Performs PKI operations in process with the cryptography package, for hosts where we cannot run docker or do not
+    want to pay the vault startup cost.
+
+    Produces the same artefacts as the vault backend: a 4096 bit RSA self-signed root CA, 2048 bit RSA server
+    certificates issued by it and 2048 bit RSA JWS key pairs, all PEM encoded with keys in PKCS#1 and public keys in
+    SubjectPublicKeyInfo format.
+
+    Each PKI mount's root CA is kept under local_pki_dir so later server certificates can be issued from it, as vault
+    keeps them in its storage.
+
+    With a key pool (see keypool.py) keys are taken from the pool where possible rather than generated on demand.
+    """
+    name = 'local'
+    local_pki_dir = './localpki'
+    ca_key_bits = 4096
+    key_bits = 2048
+    ca_ttl = datetime.timedelta(hours=8760)
+    cert_ttl = datetime.timedelta(hours=4380)
+
+    def __init__(self, key_pool=None, owns_key_pool=False):
+        if x509 is None:
+            raise ImportError('The local PKI backend needs the cryptography package: pip install cryptography')
+
+        super().__init__()
+        self.key_pool = key_pool
+
+        # only a pool made for this backend is stopped with it; a pool passed in belongs to the caller
+        self.owns_key_pool = owns_key_pool
+        self.ca_lock = threading.Lock()
+        self.cas = {}
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.key_pool is not None and self.owns_key_pool:
+            self.key_pool.stop()
+
+    def start_background_work(self):
+        if self.key_pool is not None:
+            self.key_pool.start_background_refill()
+
+    def generate_rsa_key(self, key_bits):
+        if self.key_pool is not None:
+            key = self.key_pool.take('rsa-{}'.format(key_bits))
+
+            if key is not None:
+                return key
+
+        return rsa.generate_private_key(public_exponent=65537, key_size=key_bits)
+
+    def private_key_pem(self, key):
+        return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                 serialization.NoEncryption()).decode('ascii')
+
+    def public_key_pem(self, key):
+        return key.public_key().public_bytes(serialization.Encoding.PEM,
+                                             serialization.PublicFormat.SubjectPublicKeyInfo).decode('ascii')
+
+    def certificate_pem(self, cert):
+        return cert.public_bytes(serialization.Encoding.PEM).decode('ascii')
+
+    def write_private_key(self, path, key):
+        """
+        Writes a private key readable by us only, whatever the umask or the mode of a file it replaces
+        """
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)
+
+        with open(fd, 'w') as file:
+            file.write(self.private_key_pem(key))
+
+    def ca_paths(self, mount_point):
+        directory = os.path.join(self.local_pki_dir, mount_point)
+        return os.path.join(directory, 'ca.pem'), os.path.join(directory, 'ca-key.pem')
+
+    def save_ca(self, mount_point, ca_cert, ca_key):
+        ca_cert_path, ca_key_path = self.ca_paths(mount_point)
+        os.makedirs(os.path.dirname(ca_cert_path), mode=0o700, exist_ok=True)
+
+        with open(ca_cert_path, 'w') as file:
+            file.write(self.certificate_pem(ca_cert))
+
+        self.write_private_key(ca_key_path, ca_key)
+
+        self.cas[mount_point] = (ca_cert, ca_key)
+
+    def load_ca(self, mount_point):
+        with self.ca_lock:
+            if mount_point not in self.cas:
+                ca_cert_path, ca_key_path = self.ca_paths(mount_point)
+
+                try:
+                    with open(ca_cert_path, 'rb') as file:
+                        ca_cert = x509.load_pem_x509_certificate(file.read())
+
+                    with open(ca_key_path, 'rb') as file:
+                        ca_key = serialization.load_pem_private_key(file.read(), password=None)
+
+                except FileNotFoundError:
+                    raise Exception("No root CA on PKI mount '{}'".format(mount_point))
+
+                self.cas[mount_point] = (ca_cert, ca_key)
+
+            return self.cas[mount_point]
+
+    def create_root_ca(self, dfsp_name):
+        key = self.generate_rsa_key(self.ca_key_bits)
+        name = x509.Name([
+            x509.NameAttribute(NameOID.ORGANIZATION_NAME, dfsp_name),
+            x509.NameAttribute(NameOID.COMMON_NAME, '{} Root CA'.format(dfsp_name)),
+        ])
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        cert = x509.CertificateBuilder() \
+            .subject_name(name) \
+            .issuer_name(name) \
+            .public_key(key.public_key()) \
+            .serial_number(x509.random_serial_number()) \
+            .not_valid_before(now - datetime.timedelta(seconds=30)) \
+            .not_valid_after(now + self.ca_ttl) \
+            .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True) \
+            .add_extension(x509.KeyUsage(digital_signature=False, content_commitment=False, key_encipherment=False,
+                                         data_encipherment=False, key_agreement=False, key_cert_sign=True,
+                                         crl_sign=True, encipher_only=False, decipher_only=False), critical=True) \
+            .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False) \
+            .sign(key, hashes.SHA256())
+
+        return cert, key
+
+    def create_server_cert(self, common_name, alt_names, ca_cert, ca_key):
+        key = self.generate_rsa_key(self.key_bits)
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        # like vault, the common name is always included in the subject alternative names
+        dns_names = [common_name] + [n.strip() for n in (alt_names or '').split(',') if n.strip()]
+        dns_names = list(dict.fromkeys(dns_names))
+
+        cert = x509.CertificateBuilder() \
+            .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])) \
+            .issuer_name(ca_cert.subject) \
+            .public_key(key.public_key()) \
+            .serial_number(x509.random_serial_number()) \
+            .not_valid_before(now - datetime.timedelta(seconds=30)) \
+            .not_valid_after(min(now + self.cert_ttl, ca_cert.not_valid_after_utc)) \
+            .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True) \
+            .add_extension(x509.KeyUsage(digital_signature=True, content_commitment=False, key_encipherment=True,
+                                         data_encipherment=False, key_agreement=True, key_cert_sign=False,
+                                         crl_sign=False, encipher_only=False, decipher_only=False), critical=True) \
+            .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH, ExtendedKeyUsageOID.CLIENT_AUTH]),
+                           critical=False) \
+            .add_extension(x509.SubjectAlternativeName([x509.DNSName(n) for n in dns_names]), critical=False) \
+            .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(ca_key.public_key()), critical=False) \
+            .sign(ca_key, hashes.SHA256())
+
+        return cert, key
+
+    def create_client_mtls_artefacts(self, dfsp_name, root_ca_cert_path, server_cert_path, server_cert_key_path,
+                                     alt_names, mount_point='pki'):
+        print('Generating client mTLS artifacts...')
+        pkievents.plan('root_ca', 'file_write', 'cert_issue', 'file_write')
+
+        # always create a new root CA certificate (issuer)
+        print('Creating new root CA issuer...')
+        with pkievents.phase('root_ca', mount_point=mount_point):
+            ca_cert, ca_key = self.create_root_ca(dfsp_name)
+
+            with self.ca_lock:
+                self.save_ca(mount_point, ca_cert, ca_key)
+
+        with pkievents.phase('file_write'):
+            with open(root_ca_cert_path, 'w') as file:
+                file.write(self.certificate_pem(ca_cert))
+
+        print('Generating server certificate...')
+        self.write_server_cert('{}.com'.format(dfsp_name), alt_names, server_cert_path, server_cert_key_path,
+                               ca_cert, ca_key)
+
+        print('New client mTLS artifacts successfully generated and written to disk.')
+
+    def issue_server_cert(self, common_name, alt_names, server_cert_path, server_cert_key_path, mount_point='pki'):
+        pkievents.plan('cert_issue', 'file_write')
+        ca_cert, ca_key = self.load_ca(mount_point)
+        self.write_server_cert(common_name, alt_names, server_cert_path, server_cert_key_path, ca_cert, ca_key)
+
+        print('Server certificate for {} written to disk.'.format(common_name))
+
+    def write_server_cert(self, common_name, alt_names, server_cert_path, server_cert_key_path, ca_cert, ca_key):
+        with pkievents.phase('cert_issue'):
+            cert, key = self.create_server_cert(common_name, alt_names, ca_cert, ca_key)
+
+        with pkievents.phase('file_write'):
+            with open(server_cert_path, 'w') as file:
+                file.write(self.certificate_pem(cert))
+
+            self.write_private_key(server_cert_key_path, key)
+
+    def create_jws_keypair(self, key_name, private_key_path, public_key_path):
+        print('Creating new JWS keypair...')
+        pkievents.plan('key_create', 'file_write')
+
+        with pkievents.phase('key_create', key_name=key_name):
+            key = self.generate_rsa_key(self.key_bits)
+
+        print('Writing keys to disk...')
+
+        with pkievents.phase('file_write'):
+            with open(public_key_path, 'w') as file:
+                file.write(self.public_key_pem(key))
+
+            self.write_private_key(private_key_path, key)
+
+        print('New JWS keypair successfully generated and written to disk.')
@@ -11,23 +11,20 @@
 #       James Bush - jbush@mojaloop.io                                   #
 ##########################################################################
 
-import sys
-import re
-import yaml
-import string
-import secrets
-from pathlib import Path
+import textwrap
 
-from itkconfigurator.customclasses import *
+import npyscreen
 
-
-def find_item_in_dictionary_array(array, prop_name, value):
-    return next((i for i in array if i.get(prop_name) == value), None)
+from itkconfigurator.customclasses import ITKColorTheme, FilledBackgroundForm, ITKAppForm, TVButtonPress, \
+    itk_notify_confirm, itk_notify_yes_no_cancel, itk_run_task_form, get_job_log_filename
+from itkconfigurator.configscheme import ITKConfigurationScheme, JWS_KEY_NAME
 
 
 class MojaloopITKConfigurator(npyscreen.NPSAppManaged):
     def __init__(self):
         self.schema_config = None
+        self.key_pool = None
+        self.task_runner = None
         super().__init__()
 
     def onStart(self):
@@ -39,8 +36,53 @@ class MojaloopITKConfigurator(npyscreen.NPSAppManaged):
         self.registerForm("BASIC", MainForm(self.schema_config))
         self.registerForm("PKI", SecurityToolsForm())
 
-        for f in self.schema_config.get_forms():
-            self.registerForm(f[0], f[1])
+        self.start_key_pool()
+
+    def get_task_runner(self):
+        """
+        Returns the runner for PKI and service operations, creating it on first use so that starting the app does not
+        wait on it
+        """
+        if self.task_runner is None:
+            # PKI and service operations run in this process, keeping vault and the docker client between operations
+            from itkconfigurator.pkibackend import create_pki_backend
+            from itkconfigurator.taskrunner import TaskRunner
+            self.task_runner = TaskRunner(pki_factory=lambda: create_pki_backend(key_pool=self.key_pool))
+
+        return self.task_runner
+
+    def setNextForm(self, fmid):
+        # configuration group forms are built the first time they are shown rather than all at startup
+        if self.schema_config is not None and self.schema_config.is_group_id(fmid):
+            form, released = self.schema_config.get_form(fmid)
+
+            for released_id in released:
+                self.removeForm(released_id)
+
+            if fmid not in self._Forms:
+                self.registerForm(fmid, form)
+
+        super().setNextForm(fmid)
+
+    def start_key_pool(self):
+        # pre-generate keys for the local PKI backend while the user is busy with the config screens
+        from itkconfigurator.pkibackend import get_pki_backend_name, LOCAL_BACKEND
+
+        if get_pki_backend_name() != LOCAL_BACKEND:
+            return
+
+        from itkconfigurator.keypool import KeyPool
+        self.key_pool = KeyPool.from_environment()
+
+        if self.key_pool is not None:
+            self.key_pool.start_background_refill()
+
+    def onCleanExit(self):
+        if self.task_runner is not None:
+            self.task_runner.close()
+
+        if self.key_pool is not None:
+            self.key_pool.stop()
 
 
 class BackgroundForm(FilledBackgroundForm):
@@ -103,7 +145,16 @@ class MainForm(ITKAppForm):
 
     def save_and_restart_services(self):
         self.schema_config.saveChanges()
-        self.restart_services()
+
+        # only restart the services whose env files (or certificates and keys) have changed
+        services = self.schema_config.get_services_to_restart()
+
+        if not services:
+            itk_notify_confirm('There are no changes to save and no services need restarting.',
+                               title='No Restart Needed')
+            return
+
+        self.restart_services(services)
 
     def get_edit_form_func(self, form_id):
         """
@@ -115,13 +166,13 @@ class MainForm(ITKAppForm):
 
         return edit_form_func
 
-    def restart_services(self):
-        ret = itk_run_subprocess_form(self.parentApp, 'Please wait while services are restarted...',
-                                      'Restarting Services', ['./venv/bin/python3', '-u', './servicemanager.py',
-                                                              'restart_all'])
+    def restart_services(self, services):
+        task = self.parentApp.get_task_runner().run_services('restart', services)
+        itk_run_task_form(self.parentApp, 'Please wait while services are restarted...', 'Restarting Services', task,
+                          log_filename=get_job_log_filename('restart-services'))
 
-        if ret != 0:
-            pass
+        if task.ok:
+            self.schema_config.services_restarted([r['service'] for r in task.result if r['ok']])
 
     def afterEditing(self):
         # this gets called once the user clicks the exit button
@@ -148,199 +199,6 @@ class MainForm(ITKAppForm):
             self.parentApp.switchFormNow()
 
 
-class ITKConfigurationScheme:
-    def __init__(self, scheme_filename=Path(__file__).resolve().parent / 'itkschema.yaml', env_files=None):
-        if env_files is None:
-            # did we get passed an env file on the command line?
-            if len(sys.argv) > 1 and sys.argv[1] is not None:
-                schema_name, file_name = sys.argv[1].split('=')
-
-                if schema_name is None or file_name is None:
-                    raise Exception('First command line argument should be mc={filepath}')
-
-                env_files = [
-                    (schema_name, str(Path.cwd() / file_name)),
-                ]
-
-            else:
-                env_files = [
-                    ('mc', str(Path(__file__).resolve().parent / 'mojaloop-connector.env')),
-                ]
-
-        self.schema = None
-        self.forms = []
-        self.scheme_filename = scheme_filename
-        self.env_files = env_files
-        self.parse_schema_file()
-        self.parse_env_files()
-        self.create_forms()
-
-    def parse_schema_file(self):
-        """
-        Parses the yaml schema file into a dictionary
-        """
-        with open(self.scheme_filename, "r") as file:
-            self.schema = yaml.safe_load(file)
-
-    def parse_env_files(self):
-        """
-        Parses environment files and updates env var values in the config scheme dictionary
-        """
-        line_number = 0
-
-        for env_filename in self.env_files:
-            with open(env_filename[1], "r") as file:
-                for line in file:
-                    # keep track of which line in the file we are looking at
-                    line_number += 1
-                    original_line = line
-
-                    var_name, var_value = self.parse_env_file_line(line)
-
-                    if var_name is None or var_value is None:
-                        continue
-
-                    self.update_env_var_value(env_filename[0], var_name, var_value, line_number, original_line)
-
-    def parse_env_file_line(self, line):
-        # remove any comments from the line
-        l = re.sub("#.*", "", line)
-
-        # remove whitespace from start and end of the line
-        l = l.strip()
-
-        # extract var name and value
-        groups = re.search("(.*)=(.*)", l)
-
-        # no match in this line, ignore
-        if not groups:
-            return None, None
-
-        # we need two match groups (and the original string) to work with
-        if len(groups.regs) != 3:
-            return None, None
-
-        # we need a var name to work with
-        if len(groups[1]) <= 0:
-            return None, None
-
-        # return the var_name and var_value
-        return groups[1], groups[2]
-
-    def update_env_var_value(self, env_filename, env_var_name, value, line_number, original_line):
-        for group in self.schema['itkconfigschema']['configuration']['groups']:
-            for item in group['items']:
-                if item['env_var']['file'] == env_filename and item['env_var']['name'] == env_var_name:
-                    item['value'] = value
-
-                    # remember which line number of the file this entry is on, its original text and the value
-                    # we interpreted it as having; we will use this to check we are updating the file correctly
-                    # when writing changes back.
-                    item['original_value'] = value
-                    item['line_number'] = line_number
-                    item['original_line'] = original_line
-
-    def has_unsaved_changes(self):
-        for form in self.forms:
-            for config_widget in form.config_widgets:
-                if self.get_config_widget_value(config_widget[1]) != config_widget[0]['value']:
-                    return True
-
-        return False
-
-    def get_config_widget_value(self, widget):
-        widget_type = type(widget.__repr__.__self__).__name__
-
-        if widget_type == "ITKTitleText":
-            return widget.value
-
-        elif widget_type == "ITKCheckBox":
-            return str(widget.value).lower()
-
-        else:
-            raise ValueError("Unknown config widget type: {}".format(widget_type))
-
-    def create_forms(self):
-        self.forms = []
-
-        for group in self.schema['itkconfigschema']['configuration']['groups']:
-            form = ITKConfigurationGroupForm(group)
-            self.forms.append(form)
-
-    def get_form_edit_buttons(self):
-        return [(f.config_group['id'], f.config_group['name']) for f in self.forms]
-
-    def get_forms(self):
-        """
-        Returns a list of form objects as [(id, form), ...]
-        """
-        return [(f.config_group['id'], f) for f in self.forms]
-
-    def saveChanges(self):
-        for env_file in self.env_files:
-            # read the entire file into a lines array
-            with open(env_file[1], "r") as file:
-                lines = file.readlines()
-
-                # iterate our config widgets and update any values in the file that correspond
-                for form in self.forms:
-                    for widget in form.config_widgets:
-                        var_name = widget[0]['env_var']['name']
-                        new_value = self.get_config_widget_value(widget[1])
-
-                        if new_value != widget[0]['value']:
-                            # this value has changed.
-
-                            if widget[0]['env_var']['file'] != env_file[0]:
-                                # this value is not in this file; ignore.
-                                continue
-
-                            # check the line hasnt changed since we read it
-                            line = lines[widget[0]['line_number'] - 1]
-
-                            if line != widget[0]['original_line']:
-                                raise ValueError("Original file '{}' has been modified since it was read. Please "
-                                                 "restart the utility to re-read changes: {}"
-                                                 .format(env_file[1], var_name))
-
-                            lines[widget[0]['line_number'] - 1] = self.update_env_file_line(line, var_name, new_value)
-
-                            print("writing config var {} new value {}".format(var_name, new_value))
-
-            with open(env_file[1], "w") as file:
-                file.writelines(lines)
-
-    def update_env_file_line(self, line, var_name, new_value):
-        sub_re = "(\\s*" + var_name + "=)(.*)"
-        repl_re = "\\1" + new_value
-        return re.sub(sub_re, repl_re, line)
-
-    def get_config_item_value(self, group_id, item_name):
-        group = find_item_in_dictionary_array(self.schema['itkconfigschema']['configuration']['groups'], 'id', group_id)
-        item = find_item_in_dictionary_array(group['items'], 'name', item_name)
-        return item['value']
-
-    def write_single_env_var_value(self, env_var_name, new_value):
-        # iterate all env files and update any lines that have our var in
-        for env_file in self.env_files:
-            changes = False
-            # read the entire file into a lines array
-            with open(env_file[1], "r") as file:
-                lines = file.readlines()
-
-                for idx, line in enumerate(lines):
-                    var_name, var_value = self.parse_env_file_line(line)
-
-                    if var_name == env_var_name:
-                        # this line has our env var on so update it
-                        lines[idx] = self.update_env_file_line(line, env_var_name, new_value)
-                        changes = True
-
-            if changes:
-                with open(env_file[1], "w") as file:
-                    file.writelines(lines)
-
-
 class SecurityToolsForm(ITKAppForm):
     def __init__(self, *args, **kwargs):
         self.valueText = "Use the functions here to generate the digital keys and certificates required for securely " \
@@ -374,55 +232,39 @@ class SecurityToolsForm(ITKAppForm):
 
     def generate_client_side_mTLS_artefacts(self):
         # find where we are configured to store PKI artifacts
-        dfsp_name = self.parentApp.schema_config.get_config_item_value('dfsp_details', 'DFSP ID')
-        dns_names = self.parentApp.schema_config.get_config_item_value('mojaloop_connector_details', 'DFSP DNS Host Names')
-        in_ca_cert_path = self.parentApp.schema_config.get_config_item_value('security', 'Inbound CA Certificate Path')
-        in_server_key_path = self.parentApp.schema_config.get_config_item_value('security', 'Inbound Server Certificate Private Key Path')
-        in_server_cert_path = self.parentApp.schema_config.get_config_item_value('security', 'Inbound Server Certificate Path')
-
-        # run a subprocess to generate the artifacts
-        ret = itk_run_subprocess_form(self.parentApp, 'Please wait while PKI artifacts are generated...',
-                                      'Generating PKI Artifacts',
-                                      [
-                                          'python3',
-                                          '-u',
-                                          str(Path(__file__).resolve().parent / './pkitools.py'),
-                                          'generate_client_side_mtls',
-                                           dfsp_name,
-                                           in_ca_cert_path,
-                                           in_server_cert_path,
-                                           in_server_key_path,
-                                           dns_names
-                                      ])
-
-        if ret != 0:
-            pass
+        mtls_settings = self.parentApp.schema_config.get_mtls_settings()
+
+        task = self.parentApp.get_task_runner().run_pki('create_client_mtls_artefacts',
+                                                        mtls_settings['dfsp_name'],
+                                                        mtls_settings['ca_cert_path'],
+                                                        mtls_settings['server_cert_path'],
+                                                        mtls_settings['server_key_path'],
+                                                        mtls_settings['dns_names'])
+        ret = itk_run_task_form(self.parentApp, 'Please wait while PKI artifacts are generated...',
+                                'Generating PKI Artifacts', task,
+                                log_filename=get_job_log_filename('generate-mtls'))
+
+        if ret == 0:
+            # services using the new certificates need restarting to pick them up
+            self.parentApp.schema_config.mark_restart_needed(
+                self.parentApp.schema_config.get_group_env_file_ids('security'))
 
     def generate_jws_keypair(self):
-        jws_signing_path = self.parentApp.schema_config.get_config_item_value('non_repudiation', 'JWS Signing (private) key path')
-        jws_verification_path = self.parentApp.schema_config.get_config_item_value('non_repudiation', 'JWS verification (public) key path')
-        key_name = 'jwssigningkey.pem'
-
-        # run a subprocess to generate the artifacts
-        ret = itk_run_subprocess_form(self.parentApp, 'Please wait while a new JWS key pair is generated...',
-                                      'Generating JWS Keypair',
-                                      [
-                                          'python3',
-                                          '-u',
-                                          str(Path(__file__).resolve().parent / 'pkitools.py'),
-                                          'generate_jws_keypair',
-                                          key_name,
-                                          jws_signing_path,
-                                          jws_verification_path,
-                                      ])
+        jws_settings = self.parentApp.schema_config.get_jws_settings()
+
+        task = self.parentApp.get_task_runner().run_pki('create_jws_keypair', JWS_KEY_NAME,
+                                                        jws_settings['private_key_path'],
+                                                        jws_settings['public_key_path'])
+        ret = itk_run_task_form(self.parentApp, 'Please wait while a new JWS key pair is generated...',
+                                'Generating JWS Keypair', task,
+                                log_filename=get_job_log_filename('generate-jws-keypair'))
+
+        if ret == 0:
+            self.parentApp.schema_config.mark_restart_needed(
+                self.parentApp.schema_config.get_group_env_file_ids('non_repudiation'))
 
     def generate_ilp_secret(self, length=32):
-        # Use secrets.choice to generate a secure random string
-        characters = string.ascii_letters + string.digits
-        new_secret = ''.join(secrets.choice(characters) for _ in range(length))
-        # note that we assume the env var for ILP secret is called "ILP_SECRET"
-        # possibly factor this out to a constant if we use it in multiple places in future
-        self.parentApp.schema_config.write_single_env_var_value('ILP_SECRET', new_secret)
+        self.parentApp.schema_config.rotate_ilp_secret(length)
         itk_notify_confirm('New ILP secret generated and written to disk', title='New ILP Secret')
 
     def afterEditing(self):
@@ -0,0 +1,295 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import os
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import yaml
+
+from itkconfigurator import pkievents
+from itkconfigurator.changeset import patch_to_values, build_change_set_from_values, describe_changes
+from itkconfigurator.configscheme import DEFAULT_SCHEMA_FILENAME, ITKConfigurationScheme, JWS_KEY_NAME
+
+# One DFSP deployment to provision.
+#   env_files: [(env file id, absolute path), ...]
+#   values: patch mapping of env var values to apply, as in headless patch files (see changeset.patch_to_values)
+TenantSpec = namedtuple('TenantSpec', ['id', 'directory', 'env_files', 'values', 'generate_mtls', 'generate_jws',
+                                       'rotate_ilp_secret'])
+
+DEFAULT_ENV_FILES = {'mc': 'mojaloop-connector.env'}
+
+
+def merge_values(defaults, overrides):
+    """
+    Merges two patch mappings; values for the same env file are merged rather than replaced
+    """
+    merged = dict(defaults or {})
+
+    for key, value in (overrides or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = {**merged[key], **value}
+        else:
+            merged[key] = value
+
+    return merged
+
+
+def safe_name(name):
+    """
+    Returns name with characters other than letters, digits, _ and - replaced, for vault mount points and key names
+    """
+    return re.sub('[^A-Za-z0-9_-]', '-', name)
+
+
+def load_manifest(filename):
+    """
+    Loads a provisioning manifest. Returns (settings, [TenantSpec, ...]). e.g.
+
+        workers: 8
+        pki_backend: local      # optional, see pkibackend.py
+        defaults:
+          env_files:
+            mc: mojaloop-connector.env
+          values:
+            mc:
+              JWS_SIGN: true
+          generate_mtls: true
+          generate_jws: true
+          rotate_ilp_secret: true
+        tenants:
+          - id: dfsp1
+            dir: ./tenants/dfsp1
+            values:
+              mc:
+                DFSP_ID: dfsp1
+
+    Tenant settings override the defaults. Relative paths are relative to the manifest file for tenant directories
+    and relative to the tenant directory for env files. A tenant's id defaults to its directory name. Each tenant's
+    PKI mount and JWS key are named after its id, so ids must stay distinct once made safe for vault (see safe_name).
+    """
+    with open(filename, 'r') as file:
+        try:
+            manifest = yaml.safe_load(file) or {}
+        except yaml.YAMLError as e:
+            raise ValueError('Manifest {} is not valid YAML: {}'.format(filename, e))
+
+    base_dir = Path(filename).resolve().parent
+    defaults = manifest.get('defaults', {})
+    tenants = []
+
+    for index, tenant in enumerate(manifest.get('tenants', [])):
+        if 'dir' not in tenant:
+            raise ValueError('Tenant {} in manifest {} has no dir'.format(index, filename))
+
+        directory = base_dir / tenant['dir']
+        tenant_id = str(tenant.get('id', Path(tenant['dir']).name))
+
+        # tenants sharing a name would share a PKI mount and JWS key, and overwrite each other's CA mid run
+        clashing = [t.id for t in tenants if safe_name(t.id) == safe_name(tenant_id)]
+        if clashing:
+            raise ValueError("Tenant '{}' in manifest {} clashes with tenant '{}'; give each tenant a distinct id"
+                             .format(tenant_id, filename, clashing[0]))
+        env_files = {**DEFAULT_ENV_FILES, **defaults.get('env_files', {}), **tenant.get('env_files', {})}
+
+        tenants.append(TenantSpec(
+            id=tenant_id,
+            directory=str(directory),
+            env_files=[(env_file_id, str(directory / path)) for env_file_id, path in env_files.items()],
+            values=merge_values(defaults.get('values'), tenant.get('values')),
+            generate_mtls=tenant.get('generate_mtls', defaults.get('generate_mtls', False)),
+            generate_jws=tenant.get('generate_jws', defaults.get('generate_jws', False)),
+            rotate_ilp_secret=tenant.get('rotate_ilp_secret', defaults.get('rotate_ilp_secret', False)),
+        ))
+
+    return {k: v for k, v in manifest.items() if k not in ('defaults', 'tenants')}, tenants
+
+
+def default_pki_factory():
+    # only pull in PKI backend support if we actually need to do PKI work
+    from itkconfigurator.pkibackend import create_pki_backend
+    return create_pki_backend()
+
+
+class ProvisioningOrchestrator:
+    """
+    Provisions many DFSP tenant deployments concurrently with a bounded pool of worker threads.
+
+    For each tenant we apply configuration values to its env files, generate mTLS and JWS artefacts and rotate its
+    ILP secret, as requested in its TenantSpec. All tenants share a single PKI backend (one vault), with each tenant's
+    CA kept on its own PKI mount. A failure in one tenant does not stop the others; results and failures are reported
+    per tenant.
+
+    The phase timing events of the PKI work (see pkievents.py), tagged with the tenant and step they belong to, are
+    collected in phase_timings and summarised in the run's summary.
+    """
+
+    def __init__(self, tenants, schema_filename=DEFAULT_SCHEMA_FILENAME, workers=None, pki_factory=default_pki_factory):
+        self.tenants = list(tenants)
+        self.schema_filename = schema_filename
+        self.workers = workers or os.cpu_count() or 1
+        self.pki_factory = pki_factory
+        self.pki = None
+        self.pki_error = None
+        self.phase_timings = pkievents.PhaseTimings()
+
+    def run(self):
+        """
+        Provisions all tenants. Returns a summary dictionary including a result for each tenant.
+        """
+        start = time.perf_counter()
+        self.pki = None
+        self.pki_error = None
+        self.phase_timings = pkievents.PhaseTimings()
+        pki_startup = None
+
+        # starting and closing the backend happen on this thread
+        previous_listener = pkievents.set_listener(self.phase_timings)
+
+        if any(t.generate_mtls or t.generate_jws for t in self.tenants):
+            try:
+                self.pki = self.pki_factory()
+            except Exception as e:
+                # tenants that need PKI will report this as their failure
+                self.pki_error = 'PKI backend unavailable: {}'.format(e)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(self.provision_tenant, self.tenants))
+        finally:
+            if self.pki is not None:
+                get_timings = getattr(self.pki, 'get_startup_timings', None)
+                pki_startup = get_timings() if get_timings is not None else None
+                self.pki.__exit__(None, None, None)
+                self.pki = None
+
+            pkievents.set_listener(previous_listener)
+
+        elapsed = time.perf_counter() - start
+        failed = [r['tenant'] for r in results if not r['ok']]
+
+        return {
+            'tenants': len(results),
+            'succeeded': len(results) - len(failed),
+            'failed': failed,
+            'workers': self.workers,
+            'elapsed_secs': round(elapsed, 3),
+            'tenants_per_minute': round(len(results) / elapsed * 60, 1) if elapsed > 0 else None,
+            'pki_startup': pki_startup,
+            'pki_timings': self.phase_timings.as_dict(),
+            'results': results,
+        }
+
+    def provision_tenant(self, tenant):
+        start = time.perf_counter()
+        result = {'tenant': tenant.id, 'dir': tenant.directory, 'ok': True, 'steps': []}
+
+        try:
+            scheme = self.run_step(result, 'config', self.apply_config, tenant)
+        except Exception:
+            scheme = None
+
+        if scheme is not None:
+            steps = [
+                ('mtls', tenant.generate_mtls, self.generate_mtls),
+                ('jws', tenant.generate_jws, self.generate_jws),
+                ('ilp_secret', tenant.rotate_ilp_secret, self.rotate_ilp_secret),
+            ]
+
+            for name, wanted, func in steps:
+                if not wanted:
+                    continue
+
+                try:
+                    self.run_step(result, name, func, tenant, scheme)
+
+                except Exception:
+                    # recorded in the step result; carry on with the other steps for this tenant
+                    pass
+
+        result['elapsed_secs'] = round(time.perf_counter() - start, 3)
+        return result
+
+    def run_step(self, result, name, func, *args):
+        step = {'step': name, 'ok': True}
+        result['steps'].append(step)
+        previous_listener = pkievents.set_listener(
+            lambda event: self.phase_timings.add_event(dict(event, tenant=result['tenant'], step=name)))
+        start = time.perf_counter()
+
+        try:
+            return func(step, *args)
+
+        except Exception as e:
+            step['ok'] = False
+            step['error'] = str(e)
+            result['ok'] = False
+            raise
+
+        finally:
+            pkievents.set_listener(previous_listener)
+            step['elapsed_secs'] = round(time.perf_counter() - start, 3)
+
+    def apply_config(self, step, tenant):
+        scheme = ITKConfigurationScheme(self.schema_filename, env_files=tenant.env_files)
+        change_set = build_change_set_from_values(scheme, patch_to_values(scheme, tenant.values))
+
+        step['changes'] = describe_changes(scheme, change_set)
+        errors = scheme.validate(change_set)
+
+        if errors:
+            step['validation_errors'] = errors
+            raise ValueError('{} configuration value(s) failed validation'.format(len(errors)))
+
+        scheme.apply_change_set(change_set)
+        return scheme
+
+    def get_pki(self):
+        if self.pki is None:
+            raise RuntimeError(self.pki_error or 'No PKI backend')
+
+        return self.pki
+
+    def generate_mtls(self, step, tenant, scheme):
+        pki = self.get_pki()
+        settings = scheme.get_mtls_settings()
+        paths = [self.tenant_path(tenant, settings[k]) for k in ('ca_cert_path', 'server_cert_path',
+                                                                  'server_key_path')]
+
+        pki.create_client_mtls_artefacts(settings['dfsp_name'], *paths, settings['dns_names'],
+                                         mount_point='pki-{}'.format(safe_name(tenant.id)))
+        step['files'] = paths
+
+    def generate_jws(self, step, tenant, scheme):
+        pki = self.get_pki()
+        settings = scheme.get_jws_settings()
+        private_key_path = self.tenant_path(tenant, settings['private_key_path'])
+        public_key_path = self.tenant_path(tenant, settings['public_key_path'])
+
+        pki.create_jws_keypair('{}-{}'.format(safe_name(tenant.id), JWS_KEY_NAME), private_key_path,
+                               public_key_path)
+        step['files'] = [private_key_path, public_key_path]
+
+    def rotate_ilp_secret(self, step, tenant, scheme):
+        scheme.rotate_ilp_secret()
+
+    def tenant_path(self, tenant, path):
+        """
+        Resolves a path from a tenant's config relative to the tenant directory, making sure its directory exists
+        """
+        resolved = Path(tenant.directory) / path
+        resolved.parent.mkdir(parents=True, exist_ok=True)
+        return str(resolved)
@@ -0,0 +1,248 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import abc
+import contextvars
+import json
+import os
+import threading
+import time
+
+# PKI backends generate the root CA, server certificates and JWS key pairs the ITK needs and write them to disk:
+#   vault: PkiTools in pkitools.py, using hashicorp vault in a docker container
+#   local: LocalPkiBackend in localpki.py, in process using the cryptography package (pip install cryptography)
+#
+# The backend is chosen with the ITK_PKI_BACKEND environment variable (default vault) so subprocesses and the PKI
+# daemon pick up the same choice.
+
+PKI_BACKEND_ENV_VAR = 'ITK_PKI_BACKEND'
+VAULT_BACKEND = 'vault'
+LOCAL_BACKEND = 'local'
+PKI_BACKENDS = [VAULT_BACKEND, LOCAL_BACKEND]
+
+
+class PkiBackend(abc.ABC):
+    """
+    Base class for PKI backends. Backends must implement create_client_mtls_artefacts, issue_server_cert and
+    create_jws_keypair, each writing its results to the given paths; the batch operations here are built on those.
+
+    Backends are context managers; __exit__ releases whatever the backend holds (e.g. stops the vault container).
+    """
+    name = None
+    batch_max_workers = 8
+
+    def __init__(self):
+        # per resource (PKI mount or JWS key) locks so concurrent batch jobs touching the same resource run in turn
+        self.resource_locks = {}
+        self.resource_locks_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def start_background_work(self):
+        """
+        Starts any work the backend does in the background while idle. Only called by long running processes such as
+        the PKI daemon.
+        """
+        pass
+
+    def get_startup_timings(self):
+        """
+        Returns how long each phase of starting the backend took, or None if the backend has no startup phases
+        """
+        return None
+
+    @abc.abstractmethod
+    def create_client_mtls_artefacts(self, dfsp_name, root_ca_cert_path, server_cert_path, server_cert_key_path,
+                                     alt_names, mount_point='pki'):
+        """
+        Creates a new root CA on mount_point and a server certificate issued by it, writing the CA certificate, server
+        certificate and server private key to disk. alt_names is a comma separated list of DNS names.
+        """
+
+    @abc.abstractmethod
+    def issue_server_cert(self, common_name, alt_names, server_cert_path, server_cert_key_path, mount_point='pki'):
+        """
+        Issues a server certificate from the existing root CA on mount_point and writes it and its key to disk
+        """
+
+    @abc.abstractmethod
+    def create_jws_keypair(self, key_name, private_key_path, public_key_path):
+        """
+        Creates an RSA key pair for JWS signing and writes both keys to disk in PEM format
+        """
+
+    def get_resource_lock(self, resource):
+        with self.resource_locks_lock:
+            return self.resource_locks.setdefault(resource, threading.Lock())
+
+    def load_batch_job_file(self, job_filename):
+        """
+        Loads a YAML or JSON batch job file and returns a list of jobs. File paths in the job file are relative to
+        the job file. e.g.
+
+            mtls:                   # new root CA plus server certificate, as create_client_mtls_artefacts
+              - dfsp_name: dfsp1
+                ca_cert_path: dfsp1/secrets/cacert.pem
+                server_cert_path: dfsp1/secrets/servercert.pem
+                server_key_path: dfsp1/secrets/serverkey.pem
+                dns_names: dfsp1.example.com
+                mount_point: pki-dfsp1          # optional, defaults to pki
+            server_certs:           # additional server certificates from an existing root CA
+              - common_name: api.dfsp1.example.com
+                dns_names: api.dfsp1.example.com,api2.dfsp1.example.com
+                server_cert_path: dfsp1/secrets/apicert.pem
+                server_key_path: dfsp1/secrets/apikey.pem
+                mount_point: pki-dfsp1
+            jws_keypairs:
+              - key_name: dfsp1-jwssigningkey.pem
+                private_key_path: dfsp1/secrets/jwsSigningKey.pem
+                public_key_path: dfsp1/secrets/jwsPublicKey.pem
+        """
+        with open(job_filename, 'r') as file:
+            if str(job_filename).endswith('.json'):
+                job_file = json.load(file)
+            else:
+                import yaml
+                job_file = yaml.safe_load(file) or {}
+
+        base_dir = os.path.dirname(os.path.abspath(job_filename))
+        path_keys = ('ca_cert_path', 'server_cert_path', 'server_key_path', 'private_key_path', 'public_key_path')
+        jobs = []
+
+        for job_type in ('mtls', 'server_certs', 'jws_keypairs'):
+            for job in job_file.get(job_type, []):
+                job = {k: os.path.join(base_dir, v) if k in path_keys else v for k, v in job.items()}
+                job['type'] = job_type
+                jobs.append(job)
+
+        return jobs
+
+    def run_batch_job(self, job):
+        match job['type']:
+            case 'mtls':
+                mount_point = job.get('mount_point', 'pki')
+                with self.get_resource_lock('pki/' + mount_point):
+                    self.create_client_mtls_artefacts(job['dfsp_name'], job['ca_cert_path'], job['server_cert_path'],
+                                                      job['server_key_path'], job.get('dns_names'),
+                                                      mount_point=mount_point)
+                return [job['ca_cert_path'], job['server_cert_path'], job['server_key_path']]
+
+            case 'server_certs':
+                mount_point = job.get('mount_point', 'pki')
+                self.issue_server_cert(job['common_name'], job.get('dns_names'), job['server_cert_path'],
+                                       job['server_key_path'], mount_point=mount_point)
+                return [job['server_cert_path'], job['server_key_path']]
+
+            case 'jws_keypairs':
+                with self.get_resource_lock('transit/' + job['key_name']):
+                    self.create_jws_keypair(job['key_name'], job['private_key_path'], job['public_key_path'])
+                return [job['private_key_path'], job['public_key_path']]
+
+        raise ValueError("Unknown batch job type '{}'".format(job['type']))
+
+    def issue_batch(self, jobs, max_workers=None, result_callback=None):
+        """
+        Runs a batch of jobs (see load_batch_job_file) in this vault session. Independent jobs run concurrently and
+        each job writes its files as soon as it completes. Root CA (mtls) jobs all complete before any server_certs
+        jobs start, as those are issued from the root CAs.
+
+        result_callback(result) is called as each job finishes. Returns the list of results, one per job, in job
+        order: {job, type, ok, error, files, elapsed_secs}.
+        """
+        results = [None] * len(jobs)
+        phases = [
+            [i for i, job in enumerate(jobs) if job['type'] == 'mtls'],
+            [i for i, job in enumerate(jobs) if job['type'] != 'mtls'],
+        ]
+
+        def run(index):
+            start = time.perf_counter()
+            result = {'job': index, 'type': jobs[index]['type'], 'ok': True, 'error': None, 'files': []}
+
+            try:
+                result['files'] = self.run_batch_job(jobs[index])
+            except Exception as e:
+                result['ok'] = False
+                result['error'] = '{}: {}'.format(type(e).__name__, e)
+
+            result['elapsed_secs'] = round(time.perf_counter() - start, 3)
+            return result
+
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        with ThreadPoolExecutor(max_workers=max_workers or self.batch_max_workers) as executor:
+            for phase in phases:
+                # each job runs in a copy of the caller's context, so its output and phase events go wherever the
+                # caller's do (see ThreadOutputRouter in taskrunner.py and pkievents.py)
+                futures = [executor.submit(contextvars.copy_context().run, run, index) for index in phase]
+
+                for future in as_completed(futures):
+                    result = future.result()
+                    results[result['job']] = result
+
+                    if result_callback is not None:
+                        result_callback(result)
+
+        return results
+
+    def issue_batch_from_file(self, job_filename, max_workers=None):
+        """
+        Loads and runs a batch job file, printing a line for each job as it completes and a JSON summary at the end.
+        Raises an exception if any job failed.
+        """
+        jobs = self.load_batch_job_file(job_filename)
+        print('Issuing {} batch jobs...'.format(len(jobs)))
+
+        def report(result):
+            status = 'done' if result['ok'] else 'FAILED: {}'.format(result['error'])
+            print('Job {} ({}) {} in {}s'.format(result['job'], result['type'], status, result['elapsed_secs']))
+
+        results = self.issue_batch(jobs, max_workers, result_callback=report)
+        failed = [r for r in results if not r['ok']]
+        print(json.dumps({'jobs': len(results), 'failed': len(failed), 'results': results}))
+
+        if failed:
+            raise Exception('{} of {} batch jobs failed'.format(len(failed), len(results)))
+
+
+def get_pki_backend_name():
+    return os.environ.get(PKI_BACKEND_ENV_VAR, VAULT_BACKEND)
+
+
+def create_pki_backend(name=None, key_pool=None):
+    """
+    Creates and starts the named PKI backend, by default the one selected by ITK_PKI_BACKEND. The local backend
+    uses key_pool if given, and leaves stopping it to the caller, otherwise a key pool configured from the environment
+    that is stopped with the backend.
+    """
+    name = name or get_pki_backend_name()
+
+    # backends are imported here so only the dependencies of the chosen backend are loaded
+    match name:
+        case 'vault':
+            from itkconfigurator.pkitools import PkiTools
+            return PkiTools()
+
+        case 'local':
+            from itkconfigurator.keypool import KeyPool
+            from itkconfigurator.localpki import LocalPkiBackend
+            if key_pool is not None:
+                return LocalPkiBackend(key_pool=key_pool)
+
+            return LocalPkiBackend(key_pool=KeyPool.from_environment(), owns_key_pool=True)
+
+    raise ValueError("Unknown PKI backend '{}', expected one of {}".format(name, ', '.join(PKI_BACKENDS)))
@@ -0,0 +1,394 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from itkconfigurator import pkievents
+from itkconfigurator.taskrunner import ThreadOutputRouter, LineSink
+
+# The PKI daemon keeps a PkiTools instance (and so a started, unsealed vault and an authenticated vault client) warm
+# between operations and accepts jobs over a local unix socket. This removes the vault container start, init, unseal,
+# seal and stop from every key or certificate request. The daemon shuts itself down (sealing and stopping vault) after
+# it has been idle for a configurable time.
+#
+# The daemon serves the command line only ('pkitools.py --daemon <command>'). The configurator screens do not use it:
+# they run PKI operations in process on a TaskRunner (see taskrunner.py), which keeps its own backend warm.
+#
+# The protocol is newline delimited JSON. A request is {"op": name, "args": [...]} and the daemon replies with any
+# number of {"output": line} and {"event": phase timing event} (see pkievents.py) messages followed by
+# {"done": true, "ok": bool, "error": message or null}.
+#
+# This module only imports the docker and vault clients in the daemon process itself so clients start quickly.
+#
+# Anyone who can connect to the socket can have keys written wherever the daemon's user can write, so by default the
+# socket and the daemon's log live in a directory only the current user can use: $XDG_RUNTIME_DIR, or else a 0700
+# directory of their own under the temp directory. The socket and log are also created readable by the user only.
+
+DEFAULT_SOCKET_DIR = os.environ.get('XDG_RUNTIME_DIR') or os.path.join(tempfile.gettempdir(),
+                                                                       'itk-pki-daemon-{}'.format(os.getuid()))
+DEFAULT_SOCKET_PATH = os.environ.get('ITK_PKI_DAEMON_SOCKET', os.path.join(DEFAULT_SOCKET_DIR, 'itk-pki-daemon.sock'))
+DEFAULT_IDLE_TIMEOUT_SECS = int(os.environ.get('ITK_PKI_DAEMON_IDLE_TIMEOUT', 600))
+DAEMON_START_TIMEOUT_SECS = 120
+
+# ops we accept: op name -> (PkiTools method name, indexes of args that are file paths)
+DAEMON_OPS = {
+    'generate_client_side_mtls': ('create_client_mtls_artefacts', (1, 2, 3)),
+    'generate_jws_keypair': ('create_jws_keypair', (1, 2)),
+    'issue_batch': ('issue_batch_from_file', (0,)),
+}
+
+
+class PkiDaemonError(Exception):
+    pass
+
+
+class PkiDaemonRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for raw_request in self.rfile:
+            try:
+                request = json.loads(raw_request)
+            except ValueError:
+                self.send({'done': True, 'ok': False, 'error': 'Invalid request'})
+                continue
+
+            self.server.pki_daemon.handle_request(request, self.send)
+
+    def send(self, message):
+        self.wfile.write((json.dumps(message) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+
+class PkiDaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class PkiDaemon:
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, idle_timeout_secs=DEFAULT_IDLE_TIMEOUT_SECS,
+                 pki_factory=None):
+        self.socket_path = socket_path
+        self.idle_timeout_secs = idle_timeout_secs
+        self.pki_factory = pki_factory
+        self.pki = None
+        self.server = None
+        self.output_router = None
+
+        # jobs run one at a time against the shared vault
+        self.job_lock = threading.Lock()
+        self.activity_lock = threading.Lock()
+        self.active_requests = 0
+        self.last_activity = time.monotonic()
+
+    def serve(self):
+        """
+        Warms up the PKI backend, then serves requests until shut down or idle for longer than the idle timeout
+        """
+        if self.pki_factory is None:
+            from itkconfigurator.pkibackend import create_pki_backend
+            self.pki_factory = create_pki_backend
+
+        ensure_socket_dir(self.socket_path)
+        remove_stale_socket(self.socket_path)
+
+        print('Warming up PKI backend...')
+        self.pki = self.pki_factory()
+
+        start_background_work = getattr(self.pki, 'start_background_work', None)
+        if start_background_work is not None:
+            start_background_work()
+
+        self.output_router = ThreadOutputRouter(sys.stdout)
+        sys.stdout = self.output_router
+
+        try:
+            # created without group or other permissions, so nobody else can connect even for a moment
+            previous_umask = os.umask(0o077)
+
+            try:
+                self.server = PkiDaemonServer(self.socket_path, PkiDaemonRequestHandler)
+            finally:
+                os.umask(previous_umask)
+
+            self.server.pki_daemon = self
+
+            threading.Thread(target=self.idle_watchdog, daemon=True).start()
+            print('PKI daemon listening on {}'.format(self.socket_path))
+            self.server.serve_forever(poll_interval=0.5)
+
+        finally:
+            if self.server is not None:
+                self.server.server_close()
+
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+
+            sys.stdout = self.output_router.default
+            print('PKI daemon shutting down...')
+            self.pki.__exit__(None, None, None)
+
+    def shutdown(self):
+        # serve_forever must be stopped from another thread
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    def idle_watchdog(self):
+        while True:
+            time.sleep(min(1.0, max(self.idle_timeout_secs / 4, 0.05)))
+
+            with self.activity_lock:
+                idle = self.active_requests == 0 and \
+                       time.monotonic() - self.last_activity > self.idle_timeout_secs
+
+            if idle:
+                print('PKI daemon idle for {} seconds'.format(self.idle_timeout_secs))
+                self.shutdown()
+                return
+
+    def handle_request(self, request, send):
+        with self.activity_lock:
+            self.active_requests += 1
+
+        try:
+            op = request.get('op')
+
+            if op == 'ping':
+                send({'done': True, 'ok': True, 'error': None, 'startup_timings': self.get_startup_timings()})
+
+            elif op == 'shutdown':
+                send({'done': True, 'ok': True, 'error': None})
+                self.shutdown()
+
+            elif op in DAEMON_OPS:
+                self.run_job(DAEMON_OPS[op][0], request.get('args', []), send)
+
+            else:
+                send({'done': True, 'ok': False, 'error': "Unknown op '{}'".format(op)})
+
+        finally:
+            with self.activity_lock:
+                self.active_requests -= 1
+
+                # only jobs keep the daemon alive, not status checks
+                if op in DAEMON_OPS:
+                    self.last_activity = time.monotonic()
+
+    def get_startup_timings(self):
+        get_timings = getattr(self.pki, 'get_startup_timings', None)
+        return get_timings() if get_timings is not None else None
+
+    def run_job(self, method_name, args, send):
+        # forward complete lines to the client as they are printed
+        sink = LineSink(lambda line: send({'output': line}))
+
+        with self.job_lock:
+            self.output_router.set_sink(sink)
+            pkievents.set_listener(lambda event: send({'event': event}))
+
+            try:
+                getattr(self.pki, method_name)(*args)
+                error = None
+
+            except Exception as e:
+                error = '{}: {}'.format(type(e).__name__, e)
+
+            finally:
+                self.output_router.set_sink(None)
+                pkievents.set_listener(None)
+
+        sink.flush()
+        send({'done': True, 'ok': error is None, 'error': error})
+
+
+def ensure_socket_dir(socket_path):
+    """
+    Creates the default socket directory if socket_path is in it, and checks that only the current user can use it.
+    Sockets elsewhere (--socket or ITK_PKI_DAEMON_SOCKET) are left to whoever chose them.
+    """
+    directory = os.path.dirname(os.path.abspath(socket_path))
+
+    if directory != os.path.abspath(DEFAULT_SOCKET_DIR):
+        return
+
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.lstat(directory)
+
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) & 0o077:
+        raise PkiDaemonError('{} must be a directory owned by the current user with mode 0700'.format(directory))
+
+
+def remove_stale_socket(socket_path):
+    """
+    Removes a socket file left behind by a daemon that is no longer running
+    """
+    if not os.path.exists(socket_path):
+        return
+
+    if PkiDaemonClient(socket_path).is_running():
+        raise PkiDaemonError('A PKI daemon is already listening on {}'.format(socket_path))
+
+    os.unlink(socket_path)
+
+
+class PkiDaemonClient:
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, timeout=None):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def request(self, op, args=(), output_line_callback=None, event_callback=None):
+        """
+        Sends a request to the daemon, calling output_line_callback(line) for each line of output the job produces and
+        event_callback(event) for each phase timing event. Returns (ok, error message).
+        """
+        response = self.send_request(op, args, output_line_callback, event_callback)
+        return response['ok'], response.get('error')
+
+    def send_request(self, op, args=(), output_line_callback=None, event_callback=None):
+        """
+        As request() but returns the daemon's final response message
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            sock.sendall((json.dumps({'op': op, 'args': list(args)}) + '\n').encode('utf-8'))
+
+            with sock.makefile('r', encoding='utf-8') as responses:
+                for raw_response in responses:
+                    response = json.loads(raw_response)
+
+                    if response.get('done'):
+                        return response
+
+                    if 'event' in response:
+                        if event_callback is not None:
+                            event_callback(response['event'])
+
+                    elif output_line_callback is not None:
+                        output_line_callback(response.get('output', ''))
+
+        raise PkiDaemonError('PKI daemon closed the connection before the job completed')
+
+    def is_running(self):
+        try:
+            ok, _error = PkiDaemonClient(self.socket_path, timeout=2).request('ping')
+            return ok
+        except (OSError, ValueError, PkiDaemonError):
+            return False
+
+    def get_startup_timings(self):
+        """
+        Returns how long each phase of starting the daemon's vault took, or None if the daemon has no such timings
+        """
+        return self.send_request('ping').get('startup_timings')
+
+    def submit(self, op, args, output_line_callback=None, event_callback=None):
+        """
+        Submits a PKI job. File path arguments are made absolute as the daemon may have a different working directory.
+        """
+        if op not in DAEMON_OPS:
+            raise PkiDaemonError("Unknown op '{}'".format(op))
+
+        path_indexes = DAEMON_OPS[op][1]
+        args = [os.path.abspath(a) if i in path_indexes else a for i, a in enumerate(args)]
+        return self.request(op, args, output_line_callback, event_callback)
+
+
+def ensure_daemon_running(socket_path=DEFAULT_SOCKET_PATH, idle_timeout_secs=DEFAULT_IDLE_TIMEOUT_SECS,
+                          start_timeout_secs=DAEMON_START_TIMEOUT_SECS):
+    """
+    Starts a PKI daemon in the background if one is not already listening on socket_path and waits for it to be ready.
+    The daemon runs in the current working directory so it uses the same vault data as a PkiTools run from here.
+    """
+    client = PkiDaemonClient(socket_path)
+
+    if client.is_running():
+        return client
+
+    ensure_socket_dir(socket_path)
+    print('Starting PKI daemon...')
+    package_parent = str(Path(__file__).resolve().parent.parent)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in [package_parent, os.environ.get('PYTHONPATH')] if p))
+
+    with open(os.open(socket_path + '.log', os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600), 'a') as log_file:
+        subprocess.Popen([sys.executable, '-u', '-m', 'itkconfigurator.pkidaemon', 'serve', '--socket', socket_path,
+                          '--idle-timeout', str(idle_timeout_secs)],
+                         stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT, env=env,
+                         start_new_session=True)
+
+    deadline = time.monotonic() + start_timeout_secs
+
+    while time.monotonic() < deadline:
+        if client.is_running():
+            return client
+
+        time.sleep(0.1)
+
+    raise PkiDaemonError('PKI daemon did not start within {} seconds, see {}.log'.format(start_timeout_secs,
+                                                                                         socket_path))
+
+
+def run_client_command(argv, socket_path=DEFAULT_SOCKET_PATH):
+    """
+    Runs a pkitools command line (e.g. ['generate_jws_keypair', key_name, private_path, public_path]) through the
+    daemon, starting it if needed, and prints the job output. The job's phase timing events are passed on to this
+    process's listener, if it has one. Returns a process exit code.
+    """
+    client = ensure_daemon_running(socket_path)
+    ok, error = client.submit(argv[0], argv[1:], output_line_callback=print, event_callback=pkievents.forward)
+
+    if not ok:
+        print(error)
+        return 1
+
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='itk-pki-daemon', description='Warm PKI daemon for the ITK configurator')
+    parser.add_argument('command', choices=['serve', 'status', 'stop'])
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH, help='unix socket path to listen or connect on')
+    parser.add_argument('--idle-timeout', type=int, default=DEFAULT_IDLE_TIMEOUT_SECS,
+                        help='seconds without requests after which the daemon shuts down')
+    args = parser.parse_args(argv)
+
+    match args.command:
+        case 'serve':
+            PkiDaemon(args.socket, args.idle_timeout).serve()
+
+        case 'status':
+            running = PkiDaemonClient(args.socket).is_running()
+            print('running' if running else 'not running')
+
+            if running:
+                print('vault startup: {}'.format(json.dumps(PkiDaemonClient(args.socket).get_startup_timings())))
+            return 0 if running else 1
+
+        case 'stop':
+            if PkiDaemonClient(args.socket).is_running():
+                PkiDaemonClient(args.socket).request('shutdown')
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
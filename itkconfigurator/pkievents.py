@@ -0,0 +1,229 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+# PKI backends time each phase of their work (container_start, health_wait, init, unseal, engine_setup, root_ca, role,
+# cert_issue, key_create, key_export, file_write, seal, container_stop) and report it as machine readable events,
+# alongside the progress text they print:
+#   {"event": "plan", "phases": ["root_ca", "role", ...], "time": 1700000000.0}    phases an operation is about to run
+#   {"event": "phase_start", "phase": "root_ca", "time": 1700000000.0}
+#   {"event": "phase_end", "phase": "root_ca", "time": 1700000001.5, "duration_secs": 1.5, "ok": true}
+#
+# Events go to the listener set for the current thread (TaskRunner and the PKI daemon set one for each job), or else to
+# the process wide default listener. The listener is held in a context variable, so work handed to other threads with
+# executor.submit(contextvars.copy_context().run, func, ...) reports to it too. A process started with
+# ITK_PKI_EVENTS_FILE set writes events to that file as JSON lines, so whoever started it can follow them.
+#
+# e.g.
+#   with pkievents.phase('root_ca', mount_point=mount_point):
+#       generate_root_ca()
+
+PKI_EVENTS_FILE_ENV_VAR = 'ITK_PKI_EVENTS_FILE'
+
+current_listener = contextvars.ContextVar('itk_pki_events_listener', default=None)
+default_listener = None
+
+
+def set_listener(listener):
+    """
+    Sends events emitted on the current thread to listener(event), or to the default listener if listener is None.
+    Returns the listener this replaces.
+    """
+    previous = current_listener.get()
+    current_listener.set(listener)
+    return previous
+
+
+def set_default_listener(listener):
+    """
+    Sends events emitted on threads without a listener of their own to listener(event)
+    """
+    global default_listener
+    default_listener = listener
+
+
+def forward(event):
+    """
+    Passes an event on to the current listener, e.g. one received from the PKI daemon
+    """
+    listener = current_listener.get() or default_listener
+
+    if listener is not None:
+        listener(event)
+
+
+def emit(event_type, **fields):
+    if current_listener.get() is None and default_listener is None:
+        return
+
+    forward({'event': event_type, 'time': round(time.time(), 6), **fields})
+
+
+def plan(*phases):
+    emit('plan', phases=list(phases))
+
+
+@contextlib.contextmanager
+def phase(name, **fields):
+    """
+    Emits phase_start and phase_end events around the body of the with statement
+    """
+    emit('phase_start', phase=name, **fields)
+    start = time.perf_counter()
+    ok = False
+
+    try:
+        yield
+        ok = True
+
+    finally:
+        emit('phase_end', phase=name, duration_secs=round(time.perf_counter() - start, 6), ok=ok, **fields)
+
+
+class EventFileWriter:
+    """
+    A listener that appends events to a file as JSON lines, flushing each one so a reader sees it straight away
+    """
+
+    def __init__(self, filename):
+        self.file = open(filename, 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        with self.lock:
+            self.file.write(json.dumps(event) + '\n')
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def install_events_file_from_environment():
+    """
+    Makes an EventFileWriter for the file named by ITK_PKI_EVENTS_FILE the default listener. Returns the writer, or
+    None if the variable is not set.
+    """
+    filename = os.environ.get(PKI_EVENTS_FILE_ENV_VAR)
+
+    if not filename:
+        return None
+
+    writer = EventFileWriter(filename)
+    set_default_listener(writer)
+    return writer
+
+
+class PhaseTimings:
+    """
+    A listener that collects phase events into progress (phases done out of those planned) and the time spent in each
+    phase. Events may arrive from several threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.planned = 0
+        self.running = []
+
+        # (phase, duration_secs, ok) in the order the phases ended
+        self.completed = []
+
+    def __call__(self, event):
+        self.add_event(event)
+
+    def add_event(self, event):
+        with self.lock:
+            self.events.append(event)
+
+            match event.get('event'):
+                case 'plan':
+                    self.planned += len(event['phases'])
+
+                case 'phase_start':
+                    self.running.append(event['phase'])
+
+                case 'phase_end':
+                    if event['phase'] in self.running:
+                        self.running.remove(event['phase'])
+
+                    self.completed.append((event['phase'], event['duration_secs'], event['ok']))
+
+    def progress(self):
+        """
+        Returns (phases done, phases planned). Phases that ran without being planned count towards both.
+        """
+        with self.lock:
+            return len(self.completed), max(self.planned, len(self.completed) + len(self.running))
+
+    def current_phase(self):
+        with self.lock:
+            return self.running[-1] if self.running else None
+
+    def durations(self):
+        """
+        Returns {phase: (times run, total seconds, times failed)} in the order the phases first ended
+        """
+        totals = {}
+
+        with self.lock:
+            for phase_name, duration_secs, ok in self.completed:
+                count, total_secs, failed = totals.get(phase_name, (0, 0.0, 0))
+                totals[phase_name] = (count + 1, total_secs + duration_secs, failed + (0 if ok else 1))
+
+        return totals
+
+    def as_dict(self):
+        with self.lock:
+            times = [event['time'] for event in self.events]
+
+        return {
+            'elapsed_secs': round(max(times) - min(times), 3) if times else 0.0,
+            'phases': [{'phase': phase_name, 'count': count, 'total_secs': round(total_secs, 3), 'failed': failed}
+                       for phase_name, (count, total_secs, failed) in self.durations().items()],
+        }
+
+    def write_report(self, filename):
+        """
+        Writes the time spent in each phase, and every event, to filename as JSON
+        """
+        report = self.as_dict()
+
+        with self.lock:
+            report['events'] = list(self.events)
+
+        with open(filename, 'w') as file:
+            json.dump(report, file, indent=2)
+            file.write('\n')
+
+    def format_bar(self, width):
+        """
+        Returns a progress bar of about width characters e.g. '[#######.......]  4/8'
+        """
+        done, planned = self.progress()
+        count = ' {}/{}'.format(done, planned)
+        bar_width = max(width - len(count) - 2, 1)
+        filled = bar_width * done // planned if planned else 0
+        return '[{}{}]{}'.format('#' * filled, '.' * (bar_width - filled), count)
+
+    def format_durations(self):
+        """
+        Returns the time spent in each phase e.g. 'container_start 1.20s, health_wait 3.41s'
+        """
+        return ', '.join('{} {:.2f}s'.format(phase_name, total_secs) + (' (failed)' if failed else '')
+                         for phase_name, (_count, total_secs, failed) in self.durations().items())
@@ -14,21 +14,25 @@
 import json
 import os
 import sys
-import time
-import docker
-import hvac
+import threading
 
-from docker.errors import NotFound
-from hvac.exceptions import InvalidRequest
+if __name__ == "__main__" and not __package__:
+    # run as a script from a source checkout (python3 pkitools.py ...), so make the package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from itkconfigurator import pkievents
+from itkconfigurator.pkibackend import PkiBackend, create_pki_backend
+from itkconfigurator.vaultreadiness import StartupTimings, wait_for_vault_ready
 
-class PkiTools:
+
+class PkiTools(PkiBackend):
     """
     We use hashicorp vault running as a docker container to perform PKI operations.
     Note that hvac is a python client wrapper around the vault HTTP API.
 
     We use the python docker client to manipulate the vault container.
     """
+    name = 'vault'
     vault_container_name = 'itk-configurator-vault'
     vault_root_token = None
     container_start_timeout_secs = 60
@@ -52,27 +56,73 @@ path "pki*" {
 }
 '''
 
-    def __init__(self):
-        # use the local docker install
-        self.dockerClient = docker.from_env()
+    def __init__(self, docker_client=None, vault_url=None, vault_init_file=None):
+        """
+        By default vault runs in a container on the local docker install. docker_client and vault_url replace them,
+        e.g. with a FakeVault's (see test/fakevault.py); vault_init_file is where the unseal key and root token are
+        kept.
+        """
+        super().__init__()
+
+        if vault_url is not None:
+            self.vault_url = vault_url
+
+        if vault_init_file is not None:
+            self.vault_init_file = vault_init_file
+
+        # how long each phase of getting vault up took, see get_startup_timings()
+        self.startup_timings = StartupTimings()
+
+        # guards enabling of PKI mounts when one instance is shared between threads
+        self.mount_lock = threading.Lock()
+
+        # the docker and vault clients are slow to import so we only load them when a vault backend is created, not
+        # when this module is imported e.g. to send a job to the PKI daemon
+        import hvac
+
+        if docker_client is None:
+            import docker
+
+            # use the local docker install
+            docker_client = docker.from_env()
+
+        self.dockerClient = docker_client
+        pkievents.plan('container_start', 'health_wait', 'init', 'unseal')
+
+        with pkievents.phase('container_start'):
+            self.start_vault_container()
 
-        self.start_vault_container()
         self.vaultClient = hvac.Client(url=self.vault_url)
 
-        if not self.wait_for_vault_container_healthy():
+        with pkievents.phase('health_wait'):
+            healthy = self.wait_for_vault_container_healthy()
+
+        if not healthy:
             raise TimeoutError('Vault container did not reach healthy status within timeout of {} seconds'
                                .format(self.container_start_timeout_secs))
 
         self.initialize_vault()
+        print('Vault ready in {:.3f}s ({})'.format(self.startup_timings.elapsed(), self.startup_timings))
 
-    def __enter__(self):
-        return self
+    def get_startup_timings(self):
+        """
+        Returns the time taken by each phase of vault startup: container_start, container_running, port_open,
+        api_ready and unsealed
+        """
+        return self.startup_timings.as_dict()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.seal_vault()
-        self.stop_vault_container()
+        pkievents.plan('seal', 'container_stop')
+
+        with pkievents.phase('seal'):
+            self.seal_vault()
+
+        with pkievents.phase('container_stop'):
+            self.stop_vault_container()
 
     def start_vault_container(self):
+        from docker.errors import NotFound
+
         print('Starting vault container...')
         # does the container exist already?
         try:
@@ -105,7 +155,11 @@ path "pki*" {
                 }
             )
 
+        self.startup_timings.mark('container_start')
+
     def stop_vault_container(self):
+        from docker.errors import NotFound
+
         # does the container exist already?
         print('Stopping vault container...')
         try:
@@ -122,26 +176,38 @@ path "pki*" {
         print('Vault container stopped.')
 
     def initialize_vault(self):
+        from hvac.exceptions import InvalidRequest
+
         # try to init the vault, ignore error if already initialized
         print('Initializing vault...')
-        try:
-            result = self.vaultClient.sys.initialize(1, 1)
+        initialized = False
 
-            with open(self.vault_init_file, 'w') as file:
-                json.dump(result, file, indent=2)
+        with pkievents.phase('init'):
+            try:
+                result = self.vaultClient.sys.initialize(1, 1)
+
+                with open(self.vault_init_file, 'w') as file:
+                    json.dump(result, file, indent=2)
+
+                initialized = True
 
+            except InvalidRequest as e:
+                if not str(e).startswith('Vault is already initialized'):
+                    raise e
+
+        with pkievents.phase('unseal'):
             self.create_client()
             self.unseal_vault()
-            self.enable_vault_pki()
-            self.enable_vault_transit()
-            return
 
-        except InvalidRequest as e:
-            if not str(e).startswith('Vault is already initialized'):
-                raise e
+        self.startup_timings.mark('unsealed')
+
+        # a new vault needs its secrets engines
+        if initialized:
+            pkievents.plan('engine_setup')
 
-        self.create_client()
-        self.unseal_vault()
+            with pkievents.phase('engine_setup'):
+                self.enable_vault_pki()
+                self.enable_vault_transit()
 
     def unseal_vault(self):
         print('Unsealing vault...')
@@ -156,6 +222,8 @@ path "pki*" {
             self.vaultClient.sys.seal()
 
     def create_client(self):
+        import hvac
+
         with open(self.vault_init_file, 'r') as file:
             init_data = json.load(file)
 
@@ -165,20 +233,14 @@ path "pki*" {
 
     def wait_for_vault_container_healthy(self):
         print('Waiting for vault container to be healthy...')
-        # Check health status in a loop
-        start_time = time.time()
-        while time.time() - start_time < self.container_start_timeout_secs:
-            try:
-                # check we can connect to the vault container by trying to read the seal status
-                result = self.vaultClient.sys.read_seal_status()
-                return True
-            except Exception as e:
-                # probably an error try to connect meaning the container is not fully healthy yet. try again.
-                time.sleep(2)
+        health = wait_for_vault_ready(self.dockerClient, self.vault_container_name, self.vault_url,
+                                      self.container_start_timeout_secs, self.startup_timings)
+
+        if health is None:
+            print('Timeout waiting for vault container to become healthy.')
+            return False
 
-        # Timeout case
-        print('Timeout waiting for vault container to become healthy.')
-        return False
+        return True
 
     def enable_vault_pki(self):
         print('Enabling vault PKI secrets engine...')
@@ -188,11 +250,26 @@ path "pki*" {
         result = self.vaultClient.sys.create_or_update_policy('default', policy=updated_policy)
 
         # enable PKI secrets engine
-        result = self.vaultClient.sys.enable_secrets_engine(backend_type='pki', path='pki', config={
+        self.enable_pki_mount('pki')
+
+    def enable_pki_mount(self, mount_point):
+        result = self.vaultClient.sys.enable_secrets_engine(backend_type='pki', path=mount_point, config={
             'default_lease_ttl': '8760h',
             'max_lease_ttl': '87600h'
         })
 
+    def ensure_pki_mount(self, mount_point):
+        """
+        Enables a PKI secrets engine at mount_point if there is not one already. Separate mount points let several
+        DFSPs keep their own root CA in a single vault.
+        """
+        with self.mount_lock:
+            mounts = self.vaultClient.sys.list_mounted_secrets_engines()['data']
+
+            if '{}/'.format(mount_point) not in mounts:
+                print('Enabling vault PKI secrets engine at {}...'.format(mount_point))
+                self.enable_pki_mount(mount_point)
+
     def enable_vault_transit(self):
         print('Enabling vault Transit secrets engine...')
         # enable transit secrets engine
@@ -201,7 +278,7 @@ path "pki*" {
             'max_lease_ttl': '87600h'
         })
 
-    def create_cert_role_if_not_exists(self):
+    def create_cert_role_if_not_exists(self, mount_point='pki'):
         print('Setting certificate issuer role parameters...')
         role_params = {
             'allowed_domains': '*',
@@ -211,9 +288,11 @@ path "pki*" {
             'max_ttl': '4380h'
         }
 
-        result = self.vaultClient.secrets.pki.create_or_update_role(self.vault_cert_role_name, role_params)
+        with pkievents.phase('role', mount_point=mount_point):
+            result = self.vaultClient.secrets.pki.create_or_update_role(self.vault_cert_role_name, role_params,
+                                                                        mount_point=mount_point)
 
-    def generate_server_cert(self, common_name, alt_names=None):
+    def generate_server_cert(self, common_name, alt_names=None, mount_point='pki'):
         print('Generating server certificate...')
         cert_params = {
             'ttl': '4380h',
@@ -223,57 +302,73 @@ path "pki*" {
         if alt_names is not None:
             cert_params['alt_names'] = alt_names
 
-        return self.vaultClient.secrets.pki.generate_certificate(
-            name=self.vault_cert_role_name,
-            common_name=common_name,
-            extra_params=cert_params,
-        )
+        with pkievents.phase('cert_issue', mount_point=mount_point):
+            return self.vaultClient.secrets.pki.generate_certificate(
+                name=self.vault_cert_role_name,
+                common_name=common_name,
+                extra_params=cert_params,
+                mount_point=mount_point,
+            )
 
-    def create_client_mtls_artefacts(self, dfsp_name, root_ca_cert_path, server_cert_path, server_cert_key_path, alt_names):
+    def create_client_mtls_artefacts(self, dfsp_name, root_ca_cert_path, server_cert_path, server_cert_key_path, alt_names,
+                                     mount_point='pki'):
         print('Generating client mTLS artifacts...')
-        # always create a new root CA certificate (issuer)
+        if mount_point != 'pki':
+            pkievents.plan('engine_setup')
 
-        # delete any existing issuer
-        print('Deleting any existing issuer...')
-        try:
-            issuers = self.vaultClient.secrets.pki.list_issuers()
-            delete_result = self.vaultClient.secrets.pki.delete_issuer(issuers['data']['keys'][0])
-        except Exception as e:
-            print('Error deleting existing issuer: {}'.format(e))
-
-        # generate a new self-signed root certificate authority
-        print('Creating new root CA issuer...')
-        result = self.vaultClient.secrets.pki.generate_root(
-            type='internal',
-            common_name='{} Root CA'.format(dfsp_name),
-            extra_params={
-                'issuer_name': dfsp_name,
-                'key_bits': 4096,
-                'organization': dfsp_name,
-                'ttl': '8760h'
-            }
-        )
+            with pkievents.phase('engine_setup', mount_point=mount_point):
+                self.ensure_pki_mount(mount_point)
+
+        pkievents.plan('root_ca', 'role', 'file_write', 'cert_issue', 'file_write')
+
+        # always create a new root CA certificate (issuer)
+        with pkievents.phase('root_ca', mount_point=mount_point):
+            # delete any existing issuer
+            print('Deleting any existing issuer...')
+            try:
+                issuers = self.vaultClient.secrets.pki.list_issuers(mount_point=mount_point)
+                delete_result = self.vaultClient.secrets.pki.delete_issuer(issuers['data']['keys'][0],
+                                                                           mount_point=mount_point)
+            except Exception as e:
+                print('Error deleting existing issuer: {}'.format(e))
+
+            # generate a new self-signed root certificate authority
+            print('Creating new root CA issuer...')
+            result = self.vaultClient.secrets.pki.generate_root(
+                type='internal',
+                common_name='{} Root CA'.format(dfsp_name),
+                extra_params={
+                    'issuer_name': dfsp_name,
+                    'key_bits': 4096,
+                    'organization': dfsp_name,
+                    'ttl': '8760h'
+                },
+                mount_point=mount_point,
+            )
 
         # make sure we have created a vault "role" for our server certs
-        self.create_cert_role_if_not_exists()
+        self.create_cert_role_if_not_exists(mount_point)
 
         # write the root CA cert to disk
         root_cert = result['data']['certificate']
-        with open(root_ca_cert_path, 'w') as file:
-            file.write(root_cert)
+        with pkievents.phase('file_write'):
+            with open(root_ca_cert_path, 'w') as file:
+                file.write(root_cert)
 
         # request a signed server cert
-        server_cert_data = self.generate_server_cert('{}.com'.format(dfsp_name), alt_names=alt_names)
+        server_cert_data = self.generate_server_cert('{}.com'.format(dfsp_name), alt_names=alt_names,
+                                                     mount_point=mount_point)
         server_cert = server_cert_data['data']['certificate']
         server_cert_key = server_cert_data['data']['private_key']
 
-        # write the cert to disk
-        with open(server_cert_path, 'w') as file:
-            file.write(server_cert)
+        with pkievents.phase('file_write'):
+            # write the cert to disk
+            with open(server_cert_path, 'w') as file:
+                file.write(server_cert)
 
-        # write the cert private key to disk
-        with open(server_cert_key_path, 'w') as file:
-            file.write(server_cert_key)
+            # write the cert private key to disk
+            with open(server_cert_key_path, 'w') as file:
+                file.write(server_cert_key)
 
         print('New client mTLS artifacts successfully generated and written to disk.')
 
@@ -281,30 +376,61 @@ path "pki*" {
         # Note that creating a key with the same name as an existing key will create
         # a new "version" of the key in vault.
 
+        pkievents.plan('key_create', 'key_export', 'file_write')
+
         # create a transit keypair
         print('Creating new JWS keypair...')
-        result = self.vaultClient.secrets.transit.create_key(key_name, exportable=True, key_type=self.jws_key_type)
+        with pkievents.phase('key_create', key_name=key_name):
+            result = self.vaultClient.secrets.transit.create_key(key_name, exportable=True,
+                                                                 key_type=self.jws_key_type)
         public_key = result['data']['keys']['1']['public_key']
 
         # we only get the public key returned so we need to export to get the private key
-        result = self.vaultClient.secrets.transit.export_key(key_name, 'signing-key')
+        with pkievents.phase('key_export', key_name=key_name):
+            result = self.vaultClient.secrets.transit.export_key(key_name, 'signing-key')
         private_key = result['data']['keys']['1']
 
         # write the keys to disk
         print('Writing keys to disk...')
 
-        with open(public_key_path, 'w') as file:
-            file.write(public_key)
+        with pkievents.phase('file_write'):
+            with open(public_key_path, 'w') as file:
+                file.write(public_key)
 
-        with open(private_key_path, 'w') as file:
-            file.write(private_key)
+            with open(private_key_path, 'w') as file:
+                file.write(private_key)
 
         print('New JWS keypair successfully generated and written to disk.')
 
+    def issue_server_cert(self, common_name, alt_names, server_cert_path, server_cert_key_path, mount_point='pki'):
+        """
+        Issues a server certificate from the existing root CA on mount_point and writes it and its key to disk
+        """
+        pkievents.plan('role', 'cert_issue', 'file_write')
+        self.create_cert_role_if_not_exists(mount_point)
+        server_cert_data = self.generate_server_cert(common_name, alt_names=alt_names, mount_point=mount_point)
+
+        with pkievents.phase('file_write'):
+            with open(server_cert_path, 'w') as file:
+                file.write(server_cert_data['data']['certificate'])
+
+            with open(server_cert_key_path, 'w') as file:
+                file.write(server_cert_data['data']['private_key'])
+
+        print('Server certificate for {} written to disk.'.format(common_name))
+
 
 # this script can be called as a process with command line args
 if __name__ == "__main__":
-    with PkiTools() as pkiTools:
+    # phase timing events go to $ITK_PKI_EVENTS_FILE, if it is set, for whoever started us
+    pkievents.install_events_file_from_environment()
+
+    if sys.argv[1] == '--daemon':
+        # run the command through a warm PKI daemon rather than starting and stopping vault ourselves
+        from itkconfigurator.pkidaemon import run_client_command
+        sys.exit(run_client_command(sys.argv[2:]))
+
+    with create_pki_backend() as pkiTools:
 
         match sys.argv[1]:
             case 'generate_client_side_mtls':
@@ -313,4 +439,7 @@ if __name__ == "__main__":
             case 'generate_jws_keypair':
                 pkiTools.create_jws_keypair(sys.argv[2], sys.argv[3], sys.argv[4])
 
+            case 'issue_batch':
+                pkiTools.issue_batch_from_file(sys.argv[2])
+
 
@@ -0,0 +1,185 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import hashlib
+import marshal
+import os
+import stat
+import sys
+import tempfile
+
+# Parsing the YAML schema is most of the cost of loading an ITKConfigurationScheme, and headless runs load the same
+# schema over and over. We keep each parsed and checked schema in a cache file, serialized with marshal (the schema is
+# only dicts, lists, strings, numbers, bools and None), and reuse it for as long as the schema file's mtime, size and
+# sha256 are unchanged. A cache file that is missing, stale or unreadable just means the YAML is parsed again.
+#
+# A cached schema is trusted as if it were the schema file, including the env file paths it names, so the cache is
+# only used in a directory that belongs to the current user and that nobody else can use (mode 0700).
+
+SCHEMA_CACHE_ENV_VAR = 'ITK_SCHEMA_CACHE'
+SCHEMA_CACHE_DIR_ENV_VAR = 'ITK_SCHEMA_CACHE_DIR'
+
+# bump when the cache record layout changes; marshal data is also only readable by the python version that wrote it
+SCHEMA_CACHE_FORMAT = (1, sys.version_info[:2])
+
+
+class SchemaError(Exception):
+    pass
+
+
+def get_schema_cache_dir():
+    """
+    Returns the directory schema cache files are kept in, or None if the cache is turned off
+    """
+    if os.environ.get(SCHEMA_CACHE_ENV_VAR, '').lower() in ('off', '0', 'false', 'no'):
+        return None
+
+    if os.environ.get(SCHEMA_CACHE_DIR_ENV_VAR):
+        return os.environ[SCHEMA_CACHE_DIR_ENV_VAR]
+
+    # the user's own cache directory, never a shared one such as /tmp
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'itk-configurator', 'schema')
+
+
+def is_private_dir(directory):
+    """
+    Returns True if directory is a directory (not a symlink) owned by the current user with mode 0700
+    """
+    try:
+        st = os.lstat(directory)
+    except OSError:
+        return False
+
+    return stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and stat.S_IMODE(st.st_mode) == 0o700
+
+
+def get_yaml_loader():
+    """
+    Returns the LibYAML safe loader, which is many times faster than the pure python one, or the pure python loader if
+    PyYAML was built without LibYAML
+    """
+    # yaml is only imported when there is something to parse, so a warm cache never loads it
+    import yaml
+    return getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def parse_schema(data):
+    """
+    Parses and checks YAML schema text (str or bytes)
+    """
+    import yaml
+
+    try:
+        schema = yaml.load(data, Loader=get_yaml_loader())
+    except yaml.YAMLError as e:
+        raise SchemaError('Schema is not valid YAML: {}'.format(e))
+
+    check_schema(schema)
+    return schema
+
+
+def check_schema(schema):
+    """
+    Raises SchemaError if the schema is missing the parts the configurator relies on
+    """
+    try:
+        configuration = schema['itkconfigschema']['configuration']
+        envfiles = configuration['envfiles']
+        groups = configuration['groups']
+    except (KeyError, TypeError):
+        raise SchemaError('Schema must have itkconfigschema.configuration.envfiles and .groups')
+
+    if not all('name' in envfile for envfile in envfiles):
+        raise SchemaError('Every schema envfile needs a name')
+
+    for group in groups:
+        if 'id' not in group or 'name' not in group:
+            raise SchemaError('Every schema group needs an id and a name')
+
+        for item in group.get('items') or []:
+            if 'name' not in item or 'type' not in item or 'env_var' not in item:
+                raise SchemaError("Item {} in schema group '{}' needs a name, type and env_var"
+                                  .format(item.get('name'), group['id']))
+
+
+def get_cache_filename(cache_dir, schema_path):
+    return os.path.join(cache_dir, hashlib.sha256(schema_path.encode('utf-8')).hexdigest()[:32] + '.marshal')
+
+
+def load_schema(filename, cache_dir=None):
+    """
+    Returns the parsed schema in filename, from the schema cache if the file has not changed since it was cached.
+    cache_dir defaults to get_schema_cache_dir().
+    """
+    schema_path = os.path.realpath(filename)
+
+    with open(schema_path, 'rb') as file:
+        stat = os.fstat(file.fileno())
+        data = file.read()
+
+    if cache_dir is None:
+        cache_dir = get_schema_cache_dir()
+
+    if cache_dir is None:
+        return parse_schema(data)
+
+    key = (SCHEMA_CACHE_FORMAT, schema_path, stat.st_mtime_ns, stat.st_size, hashlib.sha256(data).hexdigest())
+    cache_filename = get_cache_filename(cache_dir, schema_path)
+    schema = read_cache_file(cache_filename, key) if is_private_dir(cache_dir) else None
+
+    if schema is None:
+        schema = parse_schema(data)
+        write_cache_file(cache_dir, cache_filename, key, schema)
+
+    return schema
+
+
+def read_cache_file(cache_filename, key):
+    """
+    Returns the schema cached in cache_filename if it was cached under key, otherwise None
+    """
+    try:
+        with open(cache_filename, 'rb') as file:
+            cached_key, schema = marshal.load(file)
+
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+    return schema if cached_key == key else None
+
+
+def write_cache_file(cache_dir, cache_filename, key, schema):
+    # the cache is only an optimisation; carry on without it if we cannot write it
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+
+        # someone else's directory, or one others can write to; it may hold planted cache files so leave it alone
+        if not is_private_dir(cache_dir):
+            return
+
+        # write then rename so concurrent runs never read a partly written cache file
+        fd, tmp_filename = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                marshal.dump((key, schema), file)
+
+            os.replace(tmp_filename, cache_filename)
+
+        except BaseException:
+            os.unlink(tmp_filename)
+            raise
+
+    except (OSError, ValueError):
+        pass
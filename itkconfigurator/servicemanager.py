@@ -11,10 +11,17 @@
 #       James Bush - jbush@mojaloop.io                                   #
 ##########################################################################
 
+import contextvars
+import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import docker
-from docker.errors import NotFound
+if __name__ == "__main__" and not __package__:
+    # run as a script from a source checkout (python3 servicemanager.py ...), so make the package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from itkconfigurator.vaultreadiness import backoff_delays, wait_for_port_open
 
 
 class ServiceManager:
@@ -24,7 +31,18 @@ class ServiceManager:
         'itk-redis',
     ]
 
+    # services that must be restarted and ready before each service is restarted, if they exist
+    service_dependencies = {
+        'itk-mojaloop-connector': ['itk-redis'],
+        'itk-core-connector': ['itk-redis'],
+        'itk-redis': [],
+    }
+
+    ready_timeout_secs = 120
+
     def __init__(self):
+        # the docker client is slow to import; only load it when we actually manage services
+        import docker
         self.dockerClient = docker.from_env()
 
     def __enter__(self):
@@ -33,28 +51,177 @@ class ServiceManager:
     def __exit__(self, exc_type, exc_val, exc_tb):
         pass
 
+    def discover_containers(self, container_names):
+        """
+        Finds the named containers with a single docker call. Returns {container name: container} for the ones that
+        exist.
+        """
+        # the name filter matches substrings so check for exact names ourselves
+        containers = self.dockerClient.containers.list(all=True, filters={'name': list(container_names)})
+        return {c.name: c for c in containers if c.name in container_names}
+
+    def restart_services(self, container_names=None, result_callback=None):
+        """
+        Restarts the named services (by default all of them), each as soon as the services it depends on are back
+        up, so independent services restart in parallel. Waits for each service to be healthy, or for its published
+        ports to accept connections, before counting it as restarted.
+
+        result_callback(result) is called as each service finishes. Returns a result per service in the order given:
+        {service, ok, error, restart_secs, ready_secs, total_secs}.
+        """
+        container_names = list(container_names or self.container_names)
+        containers = self.discover_containers(container_names)
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=max(len(container_names), 1)) as executor:
+            futures = {}
+
+            # submit in dependency order so every service's dependencies have futures to wait on
+            for name in self.restart_order(container_names):
+                # only wait for dependencies that exist; a host without redis still restarts its connectors
+                dependencies = [futures[d] for d in self.service_dependencies.get(name, [])
+                                if d in futures and d in containers]
+
+                # in a copy of the caller's context so progress goes wherever the caller's output goes (see
+                # ThreadOutputRouter in taskrunner.py)
+                futures[name] = executor.submit(contextvars.copy_context().run, self.restart_service, name,
+                                                containers.get(name), dependencies, start)
+
+            if result_callback is not None:
+                for future in as_completed(futures.values()):
+                    result_callback(future.result())
+
+        return [futures[name].result() for name in container_names]
+
+    def restart_order(self, container_names):
+        """
+        Orders services so each comes after the services it depends on
+        """
+        ordered = []
+
+        def visit(name, path):
+            if name in ordered:
+                return
+
+            if name in path:
+                raise ValueError('Service dependency cycle: {}'.format(' -> '.join(path + [name])))
+
+            for dependency in self.service_dependencies.get(name, []):
+                if dependency in container_names:
+                    visit(dependency, path + [name])
+
+            ordered.append(name)
+
+        for container_name in container_names:
+            visit(container_name, [])
+
+        return ordered
+
+    def restart_service(self, container_name, container, dependencies, start):
+        result = {'service': container_name, 'ok': False, 'error': None, 'restart_secs': None, 'ready_secs': None}
+
+        try:
+            failed_dependencies = [d.result()['service'] for d in dependencies if not d.result()['ok']]
+
+            if container is None:
+                raise Exception('Container {} not found. Not restarting'.format(container_name))
+
+            if failed_dependencies:
+                # restart anyway, as we would have without the dependency ordering; it may recover on its own
+                print('Restarting container {} although {} did not restart'.format(container_name,
+                                                                                    ', '.join(failed_dependencies)))
+            else:
+                print('Restarting container {}'.format(container_name))
+
+            restart_start = time.perf_counter()
+            container.restart()
+            result['restart_secs'] = round(time.perf_counter() - restart_start, 3)
+
+            ready_start = time.perf_counter()
+            self.wait_for_ready(container)
+            result['ready_secs'] = round(time.perf_counter() - ready_start, 3)
+            result['ok'] = True
+            print('Container {} restarted in {}s.'.format(container_name, result['restart_secs'] + result['ready_secs']))
+
+        except Exception as e:
+            result['error'] = str(e)
+            print('Error restarting container {}: {}'.format(container_name, e))
+
+        result['total_secs'] = round(time.perf_counter() - start, 3)
+        return result
+
+    def wait_for_ready(self, container):
+        """
+        Waits for a restarted container to report healthy if it has a health check, otherwise for its published ports
+        to accept connections, otherwise just for it to be running
+        """
+        deadline = time.time() + self.ready_timeout_secs
+
+        for delay in backoff_delays(maximum=0.25):
+            container.reload()
+            state = container.attrs.get('State', {})
+            health = state.get('Health', {}).get('Status')
+
+            if state.get('Status') in ('exited', 'dead'):
+                raise Exception('Container {} stopped after restart'.format(container.name))
+
+            if health == 'healthy' or (health is None and state.get('Status') == 'running'):
+                break
+
+            if time.time() + delay >= deadline:
+                raise TimeoutError('Container {} not ready within {} seconds'.format(container.name,
+                                                                                    self.ready_timeout_secs))
+            time.sleep(delay)
+
+        if health is None:
+            for port in self.published_ports(container):
+                if not wait_for_port_open('localhost', port, deadline):
+                    raise TimeoutError('Container {} port {} not open within {} seconds'
+                                       .format(container.name, port, self.ready_timeout_secs))
+
+    def published_ports(self, container):
+        """
+        Returns the host ports a container's TCP ports are published on
+        """
+        ports = container.attrs.get('NetworkSettings', {}).get('Ports') or {}
+        return sorted({int(binding['HostPort']) for port, bindings in ports.items() if port.endswith('/tcp')
+                       for binding in bindings or [] if binding.get('HostPort')})
+
     def restart_all(self):
         print('Restarting all services...')
+        return self.restart(self.container_names)
 
-        for container_name in self.container_names:
-            try:
-                container = self.dockerClient.containers.get(container_name)
-                print('Restarting container {}'.format(container_name))
-                container.restart()
-                print('Container {} restarted.'.format(container_name))
+    def restart(self, container_names):
+        """
+        Restarts the named services, printing the latency of each. Returns the results from restart_services.
+        """
+        if container_names != self.container_names:
+            print('Restarting services {}...'.format(', '.join(container_names)))
 
-            except NotFound:
-                print('Container {} not found. Not restarting'.format(container_name))
+        start = time.perf_counter()
+        results = self.restart_services(container_names)
 
-            except Exception as e:
-                print('Error restarting container: {}'.format(e))
+        for result in results:
+            if result['ok']:
+                print('  {:<24} restart {:>7.3f}s  ready {:>7.3f}s  done at {:>7.3f}s'.format(
+                    result['service'], result['restart_secs'], result['ready_secs'], result['total_secs']))
+            else:
+                print('  {:<24} {}'.format(result['service'], result['error']))
 
-        print('Restart complete.')
+        print('Restart complete in {:.3f}s.'.format(time.perf_counter() - start))
+        return results
 
 
 if __name__ == "__main__":
+    results = []
+
     with ServiceManager() as serviceManager:
 
         match sys.argv[1]:
             case 'restart_all':
-                serviceManager.restart_all()
\ No newline at end of file
+                results = serviceManager.restart_all()
+
+            case 'restart':
+                results = serviceManager.restart(sys.argv[2:])
+
+    sys.exit(0 if all(r['ok'] for r in results) else 1)
@@ -0,0 +1,287 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import contextvars
+import io
+import queue
+import sys
+import threading
+import time
+
+from itkconfigurator import pkievents
+
+# Runs PKI and service management operations on worker threads in this process, reusing one PKI backend (so vault
+# stays started and unsealed between operations) and one docker client, rather than starting a new python process for
+# each operation. Anything a task prints is sent, line by line, to that task's output queue so the UI can show it, and
+# the phase timing events it emits (see pkievents.py) to its events queue.
+#
+# e.g.
+#   runner = TaskRunner()
+#   task = runner.run_pki('create_jws_keypair', key_name, private_key_path, public_key_path)
+#   for line in task.iter_output():
+#       show(line)
+#   runner.close()
+
+DEFAULT_PKI_IDLE_TIMEOUT_SECS = 600
+
+
+class ThreadOutputRouter(io.TextIOBase):
+    """
+    Replacement for sys.stdout that sends output written by a thread to that thread's sink, if it has one, so
+    progress printed while running a job goes to whoever asked for the job.
+
+    The sink is held in a context variable, so work a job hands to other threads with
+    executor.submit(contextvars.copy_context().run, func, ...) prints to the job's sink too.
+    """
+
+    def __init__(self, default):
+        self.default = default
+        self.sink = contextvars.ContextVar('itk_output_sink', default=None)
+
+    def set_sink(self, sink):
+        self.sink.set(sink)
+
+    def write(self, text):
+        sink = self.sink.get()
+
+        if sink is None:
+            return self.default.write(text)
+
+        sink(text)
+        return len(text)
+
+    def flush(self):
+        self.default.flush()
+
+
+def install_output_router():
+    """
+    Routes sys.stdout through a ThreadOutputRouter, if it is not already, and returns the router
+    """
+    if not isinstance(sys.stdout, ThreadOutputRouter):
+        sys.stdout = ThreadOutputRouter(sys.stdout)
+
+    return sys.stdout
+
+
+class LineSink:
+    """
+    Collects text written in arbitrary pieces and calls line_callback(line) for each complete line
+    """
+
+    def __init__(self, line_callback):
+        self.line_callback = line_callback
+        self.pending = []
+
+    def __call__(self, text):
+        if not text:
+            return
+
+        self.pending.append(text)
+
+        if '\n' in text:
+            *lines, rest = ''.join(self.pending).split('\n')
+            self.pending = [rest] if rest else []
+
+            for line in lines:
+                self.line_callback(line)
+
+    def flush(self):
+        if self.pending:
+            self.line_callback(''.join(self.pending))
+            self.pending = []
+
+
+class Task:
+    """
+    A submitted operation. Output lines arrive on the output queue and phase timing events on the events queue while
+    it runs; once done, ok, error, result and elapsed_secs are set.
+    """
+    DONE = object()
+
+    def __init__(self, name):
+        self.name = name
+        self.output = queue.Queue()
+        self.events = queue.Queue()
+        self.done = threading.Event()
+        self.ok = None
+        self.error = None
+        self.result = None
+        self.elapsed_secs = None
+
+    def iter_output(self, timeout=None):
+        """
+        Yields output lines as they are produced until the task finishes
+        """
+        while True:
+            line = self.output.get(timeout=timeout)
+
+            if line is Task.DONE:
+                return
+
+            yield line
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        return self.ok
+
+
+class TaskRunner:
+    """
+    Runs PKI and service operations on worker threads with shared, reused clients. PKI operations run one at a time,
+    as do service operations, but the two can run alongside each other.
+
+    The PKI backend is created by the first PKI operation and closed (sealing and stopping vault) after
+    pki_idle_timeout_secs without PKI operations, or on close().
+    """
+
+    def __init__(self, pki_factory=None, service_manager_factory=None,
+                 pki_idle_timeout_secs=DEFAULT_PKI_IDLE_TIMEOUT_SECS):
+        self.pki_factory = pki_factory
+        self.service_manager_factory = service_manager_factory
+        self.pki_idle_timeout_secs = pki_idle_timeout_secs
+
+        self.pki = None
+        self.service_manager = None
+        self.pki_idle_timer = None
+        self.last_pki_activity = time.monotonic()
+
+        # the UI imports this module at startup for Task and LineSink; only load the executors when a runner is made
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.pki_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='itk-pki')
+        self.services_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='itk-services')
+        self.output_router = install_output_router()
+
+    def submit(self, name, func, *args, executor=None):
+        """
+        Runs func(*args) on a worker thread. Returns a Task.
+        """
+        task = Task(name)
+        (executor or self.services_executor).submit(self.run_task, task, func, args)
+        return task
+
+    def run_task(self, task, func, args):
+        sink = LineSink(task.output.put)
+        self.output_router.set_sink(sink)
+        pkievents.set_listener(task.events.put)
+        start = time.perf_counter()
+
+        try:
+            task.result = func(*args)
+            task.ok = True
+
+        except Exception as e:
+            task.ok = False
+            task.error = '{}: {}'.format(type(e).__name__, e)
+            print(task.error)
+
+        finally:
+            sink.flush()
+            self.output_router.set_sink(None)
+            pkievents.set_listener(None)
+            task.elapsed_secs = time.perf_counter() - start
+            task.done.set()
+            task.output.put(Task.DONE)
+
+    def run_pki(self, method_name, *args):
+        """
+        Calls a PKI backend method e.g. run_pki('create_jws_keypair', key_name, private_key_path, public_key_path)
+        """
+        def run_pki_method():
+            try:
+                return getattr(self.get_pki(), method_name)(*args)
+            finally:
+                self.pki_activity()
+
+        return self.submit(method_name, run_pki_method, executor=self.pki_executor)
+
+    def run_services(self, method_name, *args):
+        """
+        Calls a ServiceManager method e.g. run_services('restart', ['itk-redis'])
+        """
+        def run_service_manager_method():
+            return getattr(self.get_service_manager(), method_name)(*args)
+
+        return self.submit(method_name, run_service_manager_method, executor=self.services_executor)
+
+    def get_pki(self):
+        # only called on the PKI worker thread
+        if self.pki is None:
+            if self.pki_factory is None:
+                from itkconfigurator.pkibackend import create_pki_backend
+                self.pki_factory = create_pki_backend
+
+            self.pki = self.pki_factory()
+
+        return self.pki
+
+    def get_service_manager(self):
+        # only called on the services worker thread
+        if self.service_manager is None:
+            if self.service_manager_factory is None:
+                from itkconfigurator.servicemanager import ServiceManager
+                self.service_manager_factory = ServiceManager
+
+            self.service_manager = self.service_manager_factory()
+
+        return self.service_manager
+
+    def pki_activity(self):
+        self.last_pki_activity = time.monotonic()
+
+        if self.pki_idle_timer is None and self.pki_idle_timeout_secs is not None:
+            self.pki_idle_timer = threading.Timer(self.pki_idle_timeout_secs, self.pki_idle_check)
+            self.pki_idle_timer.daemon = True
+            self.pki_idle_timer.start()
+
+    def pki_idle_check(self):
+        # close the backend on the PKI worker thread so it cannot happen in the middle of an operation
+        self.pki_idle_timer = None
+
+        try:
+            self.pki_executor.submit(self.close_pki_if_idle)
+        except RuntimeError:
+            # the runner has been closed
+            pass
+
+    def close_pki_if_idle(self):
+        idle_secs = time.monotonic() - self.last_pki_activity
+
+        if idle_secs >= self.pki_idle_timeout_secs:
+            self.run_task(Task('close_pki'), self.close_pki, ())
+        else:
+            self.pki_idle_timer = threading.Timer(self.pki_idle_timeout_secs - idle_secs, self.pki_idle_check)
+            self.pki_idle_timer.daemon = True
+            self.pki_idle_timer.start()
+
+    def close_pki(self):
+        if self.pki is not None:
+            pki, self.pki = self.pki, None
+            pki.__exit__(None, None, None)
+
+    def close(self):
+        """
+        Waits for running operations to finish then releases the PKI backend and docker client
+        """
+        if self.pki_idle_timer is not None:
+            self.pki_idle_timer.cancel()
+
+        # as a task so anything closing the backend prints is not written over the UI
+        self.submit('close_pki', self.close_pki, executor=self.pki_executor)
+        self.pki_executor.shutdown(wait=True)
+        self.services_executor.shutdown(wait=True)
+
+        if self.service_manager is not None:
+            self.service_manager.__exit__(None, None, None)
+            self.service_manager = None
@@ -0,0 +1,179 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import json
+import socket
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlparse
+
+# Works out when the vault container is ready as soon as it is, rather than polling on a fixed interval:
+#   1. wait for docker to report the container started (docker events, so we wake up on the event)
+#   2. wait for vault's port to accept TCP connections (cheap connect probe with short backoff)
+#   3. wait for the vault health endpoint to answer
+#
+# Each phase is recorded in a StartupTimings so callers can see where startup time goes.
+
+PROBE_INITIAL_BACKOFF_SECS = 0.005
+PROBE_MAX_BACKOFF_SECS = 0.08
+
+# ask the health endpoint to answer 200 whatever state vault is in; we only want to know it is serving requests
+VAULT_HEALTH_PATH = '/v1/sys/health?standbyok=true&sealedcode=200&uninitcode=200'
+
+
+class StartupTimings:
+    """
+    Records when each phase of a startup sequence completed, relative to when the sequence began
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.phases = []
+
+    def mark(self, phase):
+        self.phases.append((phase, time.perf_counter() - self.start))
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def as_dict(self):
+        """
+        Returns {'total_secs': ..., 'phases': [{'phase', 'at_secs', 'duration_secs'}, ...]}
+        """
+        phases = []
+        previous = 0.0
+
+        for phase, at in self.phases:
+            phases.append({'phase': phase, 'at_secs': round(at, 3), 'duration_secs': round(at - previous, 3)})
+            previous = at
+
+        return {'total_secs': round(previous, 3), 'phases': phases}
+
+    def __str__(self):
+        return ', '.join('{} {:.3f}s'.format(p['phase'], p['duration_secs']) for p in self.as_dict()['phases'])
+
+
+def backoff_delays(initial=PROBE_INITIAL_BACKOFF_SECS, maximum=PROBE_MAX_BACKOFF_SECS):
+    delay = initial
+
+    while True:
+        yield delay
+        delay = min(delay * 2, maximum)
+
+
+def wait_for_container_running(docker_client, container_name, deadline, since=None):
+    """
+    Waits until docker reports the named container running, waking on the container's start event. Returns True if
+    it is running before deadline (a time.time() value).
+    """
+    try:
+        # subscribe before checking the status so we cannot miss a start between the two
+        events = docker_client.events(decode=True, since=int(since or time.time()) - 1, until=int(deadline) + 1,
+                                      filters={'type': 'container', 'container': container_name, 'event': 'start'})
+    except Exception:
+        # no event stream available; fall back to polling the container status
+        events = None
+
+    try:
+        container = docker_client.containers.get(container_name)
+
+        if container.status == 'running':
+            return True
+
+        if events is not None:
+            for _event in events:
+                return True
+
+            return False
+
+        for delay in backoff_delays():
+            if time.time() >= deadline:
+                return False
+
+            time.sleep(delay)
+            container.reload()
+
+            if container.status == 'running':
+                return True
+
+    finally:
+        if events is not None:
+            events.close()
+
+
+def wait_for_port_open(host, port, deadline):
+    """
+    Waits until a TCP connection to host:port succeeds. Returns True if it does before deadline.
+    """
+    for delay in backoff_delays():
+        try:
+            with socket.create_connection((host, port), timeout=max(min(deadline - time.time(), 1.0), 0.01)):
+                return True
+        except OSError:
+            pass
+
+        if time.time() + delay >= deadline:
+            return False
+
+        time.sleep(delay)
+
+
+def read_vault_health(vault_url, timeout=1.0):
+    """
+    Returns the vault health endpoint response (initialized, sealed, version etc.) as a dictionary
+    """
+    with urllib.request.urlopen(vault_url.rstrip('/') + VAULT_HEALTH_PATH, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def wait_for_vault_api(vault_url, deadline):
+    """
+    Waits until the vault health endpoint answers. Returns the health response, or None on timeout.
+    """
+    for delay in backoff_delays():
+        try:
+            return read_vault_health(vault_url, timeout=max(min(deadline - time.time(), 1.0), 0.01))
+        except (OSError, urllib.error.URLError, ValueError):
+            pass
+
+        if time.time() + delay >= deadline:
+            return None
+
+        time.sleep(delay)
+
+
+def wait_for_vault_ready(docker_client, container_name, vault_url, timeout_secs, timings):
+    """
+    Waits for the vault container to run and the vault API to answer, marking the 'container_running',
+    'port_open' and 'api_ready' phases on timings. Returns the vault health response, or None if vault was not ready
+    within timeout_secs.
+    """
+    deadline = time.time() + timeout_secs
+    url = urlparse(vault_url)
+
+    if not wait_for_container_running(docker_client, container_name, deadline, since=timings.started_at):
+        return None
+    timings.mark('container_running')
+
+    if not wait_for_port_open(url.hostname, url.port or 80, deadline):
+        return None
+    timings.mark('port_open')
+
+    health = wait_for_vault_api(vault_url, deadline)
+    if health is None:
+        return None
+    timings.mark('api_ready')
+
+    return health
@@ -0,0 +1,520 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import json
+import re
+import secrets
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from itkconfigurator.localpki import LocalPkiBackend
+
+# An in-process stand-in for the vault container, so the vault PKI backend (PkiTools) can be tested and benchmarked
+# without docker or the hashicorp/vault image:
+#   FakeVault          serves the parts of the vault HTTP API PkiTools uses over real HTTP, so hvac and the readiness
+#                      probes in vaultreadiness.py run unchanged. Certificates and keys are real, made with the
+#                      cryptography package as the local backend makes them.
+#   FakeDockerClient   stands in for docker.from_env(); the one container it can run is the FakeVault, which serves
+#                      requests while the container is running
+#
+# Every request can be delayed by latency_secs to model the round trip to a real vault. e.g.
+#
+#   with FakeVault(latency_secs=0.002) as vault:
+#       with vault.create_pki_tools('/tmp/vaultinit.json') as pkiTools:
+#           pkiTools.create_jws_keypair(...)
+
+VAULT_VERSION = '1.15.0-fake'
+
+DEFAULT_POLICY = '''
+path "auth/token/lookup-self" {
+    capabilities = ["read"]
+}
+'''
+
+# how often the server checks whether it has been stopped, kept short so stopping the container does not add to the
+# times being measured
+SHUTDOWN_POLL_SECS = 0.005
+
+# endpoints that answer without a token and while vault is sealed
+UNAUTHENTICATED_PATHS = ['sys/health', 'sys/init', 'sys/seal-status', 'sys/unseal']
+
+
+class FakeVaultError(Exception):
+    """
+    An error response from the fake vault, returned as vault returns them: {"errors": [message]}
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class FakeVaultRequestHandler(BaseHTTPRequestHandler):
+    # keep connections open between requests as vault does, so hvac's session reuses them
+    protocol_version = 'HTTP/1.1'
+
+    def handle_request(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+        method = self.command
+
+        # hvac lists with the LIST method; other clients GET with ?list=true
+        if method == 'GET' and parse_qs(url.query).get('list') == ['true']:
+            method = 'LIST'
+
+        status, response = self.server.vault.handle(method, url.path, body, self.headers.get('X-Vault-Token'))
+        data = b'' if response is None else json.dumps(response).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = handle_request
+    do_PUT = handle_request
+    do_POST = handle_request
+    do_DELETE = handle_request
+    do_LIST = handle_request
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeVault:
+    """
+    Serves the vault API endpoints PkiTools uses from in-memory state: sys init, unseal, seal and health, policies,
+    mounts, PKI root generation, roles, issue and issuers, and transit keys and export.
+
+    Keys are generated at ca_key_bits (root CAs) and key_bits (everything else) whatever size a request asks for, so
+    tests can use small, fast keys. A key_pool (see keypool.py) is used as the local backend uses it.
+
+    Requests are delayed by latency_secs, which can be changed while the vault is running. Like vault, the state
+    survives the container stopping and starting, and vault comes back sealed.
+    """
+
+    def __init__(self, latency_secs=0.0, host='127.0.0.1', port=0, ca_key_bits=LocalPkiBackend.ca_key_bits,
+                 key_bits=LocalPkiBackend.key_bits, key_pool=None):
+        self.latency_secs = latency_secs
+
+        # the local backend does the certificate and key work
+        self.pki = LocalPkiBackend(key_pool=key_pool)
+        self.pki.ca_key_bits = ca_key_bits
+        self.pki.key_bits = key_bits
+
+        self.lock = threading.Lock()
+        self.initialized = False
+        self.sealed = True
+        self.unseal_key = None
+        self.root_token = None
+        self.policies = {'default': DEFAULT_POLICY}
+        self.mounts = {
+            'secret/': {'type': 'kv', 'config': {}},
+            'sys/': {'type': 'system', 'config': {}},
+        }
+
+        # mount point: {'issuers': {issuer id: (name, certificate, key)}, 'default_issuer': id, 'roles': {name: params}}
+        self.pki_mounts = {}
+
+        # key name: {version: private key}
+        self.transit_keys = {}
+
+        # (method, path) of every request served
+        self.requests = []
+
+        self.routes = [
+            ('GET', r'sys/health', self.read_health),
+            ('PUT', r'sys/init', self.initialize),
+            ('GET', r'sys/seal-status', self.read_seal_status),
+            ('PUT', r'sys/unseal', self.unseal),
+            ('PUT', r'sys/seal', self.seal),
+            ('GET', r'sys/policy/(?P<name>[^/]+)', self.read_policy),
+            ('PUT', r'sys/policy/(?P<name>[^/]+)', self.write_policy),
+            ('GET', r'sys/mounts', self.list_mounts),
+            ('POST', r'sys/mounts/(?P<path>.+)', self.enable_mount),
+            ('LIST', r'(?P<mount>[^/]+)/issuers', self.list_issuers),
+            ('DELETE', r'(?P<mount>[^/]+)/issuer/(?P<ref>[^/]+)', self.delete_issuer),
+            ('POST', r'(?P<mount>[^/]+)/root/generate/(?P<type>[^/]+)', self.generate_root),
+            ('POST', r'(?P<mount>[^/]+)/roles/(?P<name>[^/]+)', self.write_role),
+            ('POST', r'(?P<mount>[^/]+)/issue/(?P<role>[^/]+)', self.issue),
+            ('POST', r'(?P<mount>[^/]+)/keys/(?P<name>[^/]+)', self.create_transit_key),
+            ('GET', r'(?P<mount>[^/]+)/export/(?P<key_type>[^/]+)/(?P<name>[^/]+)(/(?P<version>[^/]+))?',
+             self.export_transit_key),
+        ]
+
+        self.server = ThreadingHTTPServer((host, port), FakeVaultRequestHandler)
+        self.server.daemon_threads = True
+        self.server.vault = self
+        self.thread = None
+        self.docker_client = FakeDockerClient(self)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        """
+        Starts serving requests. The listening socket is open from construction, as docker's port mapping is, so
+        connections made before this wait until it is called.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.server.serve_forever, args=(SHUTDOWN_POLL_SECS,), daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread.join()
+            self.thread = None
+
+        # vault starts sealed
+        with self.lock:
+            self.sealed = True
+
+    def close(self):
+        self.stop()
+        self.server.server_close()
+
+    def create_pki_tools(self, vault_init_file):
+        """
+        Returns a started PkiTools using this vault and its docker stub, keeping the vault init data in
+        vault_init_file
+        """
+        from itkconfigurator.pkitools import PkiTools
+        return PkiTools(docker_client=self.docker_client, vault_url=self.url, vault_init_file=vault_init_file)
+
+    def handle(self, method, path, body, token):
+        """
+        Handles one API request. Returns (HTTP status, response body or None).
+        """
+        if self.latency_secs:
+            time.sleep(self.latency_secs)
+
+        path = path.strip('/')
+        if path.startswith('v1/'):
+            path = path[3:]
+
+        self.requests.append((method, path))
+
+        try:
+            for route_method, pattern, handler in self.routes:
+                match = re.fullmatch(pattern, path)
+
+                if match is not None and route_method == method:
+                    if path not in UNAUTHENTICATED_PATHS:
+                        self.check_access(token)
+
+                    response = handler(body, **{k: v for k, v in match.groupdict().items() if v is not None})
+                    return (204, None) if response is None else (200, response)
+
+            raise FakeVaultError(404, 'unsupported path')
+
+        except FakeVaultError as e:
+            return e.status, {'errors': [str(e)]}
+
+    def check_access(self, token):
+        if not self.initialized:
+            raise FakeVaultError(503, 'Vault is not initialized')
+
+        if self.sealed:
+            raise FakeVaultError(503, 'Vault is sealed')
+
+        if token != self.root_token:
+            raise FakeVaultError(403, 'permission denied')
+
+    def get_mount(self, mount, mount_type):
+        config = self.mounts.get('{}/'.format(mount))
+
+        if config is None or config['type'] != mount_type:
+            raise FakeVaultError(404, 'no handler for route "{}"'.format(mount))
+
+        if mount_type == 'pki':
+            return self.pki_mounts.setdefault(mount, {'issuers': {}, 'default_issuer': None, 'roles': {}})
+
+        return config
+
+    def seal_status(self):
+        return {'type': 'shamir', 'initialized': self.initialized, 'sealed': self.sealed, 't': 1, 'n': 1,
+                'progress': 0, 'version': VAULT_VERSION}
+
+    # sys
+
+    def read_health(self, body):
+        return {'initialized': self.initialized, 'sealed': self.sealed, 'standby': False, 'version': VAULT_VERSION,
+                'server_time_utc': int(time.time())}
+
+    def initialize(self, body):
+        with self.lock:
+            if self.initialized:
+                raise FakeVaultError(400, 'Vault is already initialized')
+
+            self.unseal_key = secrets.token_hex(32)
+            self.root_token = 'hvs.{}'.format(secrets.token_urlsafe(18))
+            self.initialized = True
+
+        return {'keys': [self.unseal_key], 'keys_base64': [self.unseal_key], 'root_token': self.root_token}
+
+    def read_seal_status(self, body):
+        return self.seal_status()
+
+    def unseal(self, body):
+        with self.lock:
+            if not self.initialized:
+                raise FakeVaultError(400, 'Vault is not initialized')
+
+            if body.get('key') != self.unseal_key:
+                raise FakeVaultError(400, 'invalid key')
+
+            self.sealed = False
+            return self.seal_status()
+
+    def seal(self, body):
+        with self.lock:
+            self.sealed = True
+
+    def read_policy(self, body, name):
+        if name not in self.policies:
+            raise FakeVaultError(404, 'policy "{}" not found'.format(name))
+
+        policy = {'name': name, 'rules': self.policies[name]}
+        return dict(policy, data=dict(policy))
+
+    def write_policy(self, body, name):
+        self.policies[name] = body.get('policy', '')
+
+    def list_mounts(self, body):
+        mounts = {path: dict(config) for path, config in self.mounts.items()}
+        return dict(mounts, data=mounts)
+
+    def enable_mount(self, body, path):
+        path = '{}/'.format(path.strip('/'))
+
+        with self.lock:
+            if path in self.mounts:
+                raise FakeVaultError(400, 'path is already in use at {}'.format(path))
+
+            self.mounts[path] = {'type': body.get('type'), 'config': body.get('config', {})}
+
+    # pki
+
+    def list_issuers(self, body, mount):
+        pki = self.get_mount(mount, 'pki')
+
+        if not pki['issuers']:
+            raise FakeVaultError(404, 'no issuers')
+
+        issuer_ids = list(pki['issuers'])
+        return {'data': {'keys': issuer_ids,
+                         'key_info': {i: {'issuer_name': pki['issuers'][i][0]} for i in issuer_ids}}}
+
+    def delete_issuer(self, body, mount, ref):
+        pki = self.get_mount(mount, 'pki')
+
+        with self.lock:
+            issuer_id = self.find_issuer(pki, ref)
+
+            if issuer_id is not None:
+                del pki['issuers'][issuer_id]
+
+                if pki['default_issuer'] == issuer_id:
+                    pki['default_issuer'] = None
+
+    def find_issuer(self, pki, ref):
+        if ref == 'default':
+            return pki['default_issuer']
+
+        for issuer_id, (name, _cert, _key) in pki['issuers'].items():
+            if ref in (issuer_id, name):
+                return issuer_id
+
+        return None
+
+    def generate_root(self, body, mount, type):
+        pki = self.get_mount(mount, 'pki')
+        organization = body.get('organization') or body.get('common_name', '')
+        cert, key = self.pki.create_root_ca(organization)
+        issuer_id = str(uuid.uuid4())
+
+        with self.lock:
+            pki['issuers'][issuer_id] = (body.get('issuer_name', ''), cert, key)
+
+            # as in vault, the first issuer on a mount becomes its default
+            if pki['default_issuer'] is None:
+                pki['default_issuer'] = issuer_id
+
+        certificate = self.pki.certificate_pem(cert)
+        data = {'certificate': certificate, 'issuing_ca': certificate, 'issuer_id': issuer_id,
+                'issuer_name': body.get('issuer_name', ''), 'serial_number': format_serial(cert.serial_number),
+                'expiration': int(cert.not_valid_after_utc.timestamp())}
+
+        if type == 'exported':
+            data['private_key'] = self.pki.private_key_pem(key)
+            data['private_key_type'] = 'rsa'
+
+        return {'data': data}
+
+    def write_role(self, body, mount, name):
+        self.get_mount(mount, 'pki')['roles'][name] = body
+
+    def issue(self, body, mount, role):
+        pki = self.get_mount(mount, 'pki')
+
+        if role not in pki['roles']:
+            raise FakeVaultError(400, 'unknown role: {}'.format(role))
+
+        with self.lock:
+            if pki['default_issuer'] is None:
+                raise FakeVaultError(400, 'no default issuer currently configured')
+
+            _name, ca_cert, ca_key = pki['issuers'][pki['default_issuer']]
+
+        cert, key = self.pki.create_server_cert(body.get('common_name'), body.get('alt_names'), ca_cert, ca_key)
+        ca_certificate = self.pki.certificate_pem(ca_cert)
+
+        return {'data': {
+            'certificate': self.pki.certificate_pem(cert),
+            'issuing_ca': ca_certificate,
+            'ca_chain': [ca_certificate],
+            'private_key': self.pki.private_key_pem(key),
+            'private_key_type': 'rsa',
+            'serial_number': format_serial(cert.serial_number),
+            'expiration': int(cert.not_valid_after_utc.timestamp()),
+        }}
+
+    # transit
+
+    def create_transit_key(self, body, mount, name):
+        self.get_mount(mount, 'transit')
+        key_type = body.get('type', 'aes256-gcm96')
+
+        if not key_type.startswith('rsa-'):
+            raise FakeVaultError(400, 'unsupported key type "{}"'.format(key_type))
+
+        with self.lock:
+            # as in vault, creating a key that exists leaves it as it is
+            if name not in self.transit_keys:
+                self.transit_keys[name] = {'type': key_type, 'exportable': bool(body.get('exportable')),
+                                           'versions': {'1': self.pki.generate_rsa_key(self.pki.key_bits)}}
+
+            key = self.transit_keys[name]
+
+        return {'data': {
+            'name': name,
+            'type': key['type'],
+            'exportable': key['exportable'],
+            'latest_version': len(key['versions']),
+            'keys': {version: {'name': 'rsa-{}'.format(private_key.key_size),
+                               'public_key': self.pki.public_key_pem(private_key)}
+                     for version, private_key in key['versions'].items()},
+        }}
+
+    def export_transit_key(self, body, mount, key_type, name, version=None):
+        self.get_mount(mount, 'transit')
+        key = self.transit_keys.get(name)
+
+        if key is None:
+            raise FakeVaultError(404, 'key "{}" not found'.format(name))
+
+        if not key['exportable'] or key_type not in ('signing-key', 'encryption-key'):
+            raise FakeVaultError(400, 'key is not exportable as {}'.format(key_type))
+
+        versions = key['versions']
+
+        if version is not None:
+            version = str(len(versions)) if version == 'latest' else version
+
+            if version not in versions:
+                raise FakeVaultError(400, 'version {} not found'.format(version))
+
+            versions = {version: versions[version]}
+
+        return {'data': {'name': name, 'type': key['type'],
+                         'keys': {v: self.pki.private_key_pem(k) for v, k in versions.items()}}}
+
+
+def format_serial(serial_number):
+    """
+    Returns a certificate serial number in vault's colon separated hex format
+    """
+    serial = '{:x}'.format(serial_number)
+    serial = serial.zfill(len(serial) + len(serial) % 2)
+    return ':'.join(serial[i:i + 2] for i in range(0, len(serial), 2))
+
+
+class FakeVaultContainer:
+    def __init__(self, vault, name):
+        self.vault = vault
+        self.name = name
+        self.status = 'created'
+
+    def start(self):
+        self.vault.start()
+        self.status = 'running'
+
+    def stop(self):
+        self.vault.stop()
+        self.status = 'exited'
+
+    def reload(self):
+        pass
+
+
+class FakeEventStream:
+    def __init__(self, events):
+        self.events = events
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def close(self):
+        pass
+
+
+class FakeDockerClient:
+    """
+    Stands in for the docker client PkiTools and vaultreadiness.py use: containers.get() and containers.run() for the
+    vault container, and events() for its start event
+    """
+
+    def __init__(self, vault):
+        self.vault = vault
+        self.container = None
+        self.containers = self
+
+    def get(self, name):
+        from docker.errors import NotFound
+
+        if self.container is None or self.container.name != name:
+            raise NotFound('No such container: {}'.format(name))
+
+        return self.container
+
+    def run(self, name=None, **kwargs):
+        self.container = FakeVaultContainer(self.vault, name)
+        self.container.start()
+        return self.container
+
+    def events(self, filters=None, **kwargs):
+        running = self.container is not None and self.container.status == 'running'
+        return FakeEventStream([{'status': 'start', 'id': self.container.name}] if running else [])
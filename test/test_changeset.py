@@ -0,0 +1,93 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from itkconfigurator.changeset import EnvChangeSet
+
+
+class TestEnvChangeSet(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.mc_path = Path(self.tmp_dir) / 'mc.env'
+        self.cc_path = Path(self.tmp_dir) / 'cc.env'
+        self.mc_path.write_text('# connector\nDFSP_ID=old_dfsp\nPEER_ENDPOINT=hub:4040 # the hub\n')
+        self.cc_path.write_text('BACKEND_ENDPOINT=http://backend\n')
+        self.env_files = [('mc', str(self.mc_path)), ('cc', str(self.cc_path))]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_only_changed_files_written(self):
+        cc_inode = os.stat(self.cc_path).st_ino
+
+        change_set = EnvChangeSet(self.env_files)
+        change_set.set_value('mc', 'DFSP_ID', 'new_dfsp')
+
+        self.assertEqual(len(change_set), 1)
+        self.assertEqual(change_set.apply(), [('mc', str(self.mc_path))])
+        self.assertEqual(self.mc_path.read_text(), '# connector\nDFSP_ID=new_dfsp\nPEER_ENDPOINT=hub:4040 # the hub\n')
+        self.assertEqual(os.stat(self.cc_path).st_ino, cc_inode)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ['cc.env', 'mc.env'])
+
+    def test_unchanged_value_writes_nothing(self):
+        change_set = EnvChangeSet(self.env_files)
+        change_set.set_value('mc', 'DFSP_ID', 'old_dfsp')
+        self.assertEqual(change_set.apply(), [])
+
+    def test_missing_var(self):
+        change_set = EnvChangeSet(self.env_files)
+        change_set.set_value('cc', 'NEW_VAR', 'a value')
+
+        with self.assertRaises(KeyError):
+            change_set.apply()
+
+        self.assertEqual(change_set.apply(EnvChangeSet.MISSING_IGNORE), [])
+        change_set.apply(EnvChangeSet.MISSING_APPEND)
+        self.assertEqual(self.cc_path.read_text(), 'BACKEND_ENDPOINT=http://backend\nNEW_VAR=a value\n')
+
+    def test_conflicting_edit_detected_before_any_write(self):
+        item = {'line_number': 2, 'original_line': 'DFSP_ID=something_else\n'}
+
+        change_set = EnvChangeSet(self.env_files)
+        change_set.set_value('cc', 'BACKEND_ENDPOINT', 'http://other')
+        change_set.set_value('mc', 'DFSP_ID', 'new_dfsp', item)
+
+        with self.assertRaises(ValueError):
+            change_set.apply()
+
+        self.assertEqual(self.cc_path.read_text(), 'BACKEND_ENDPOINT=http://backend\n')
+
+    def test_in_place_bound_change(self):
+        line = 'DFSP_ID=old_dfsp\n'
+        item = {'env_var': {'name': 'DFSP_ID'}, 'original_value': 'old_dfsp', 'line_number': 2, 'original_line': line,
+                'line_span': (12, 12 + len(line)), 'value_span': (20, 28)}
+
+        change_set = EnvChangeSet(self.env_files)
+        change_set.set_value('mc', 'DFSP_ID', 'a_longer_dfsp_id', item)
+        change_set.apply(in_place=True)
+
+        self.assertEqual(self.mc_path.read_text(),
+                         '# connector\nDFSP_ID=a_longer_dfsp_id\nPEER_ENDPOINT=hub:4040 # the hub\n')
+
+        # the item still describes the old line so a second apply must be refused
+        with self.assertRaises(ValueError):
+            change_set.apply(in_place=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from itkconfigurator.configscheme import ITKConfigurationScheme
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent / 'itkconfigurator'
+
+
+class TestITKConfigurationScheme(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.env_path = Path(self.tmp_dir) / 'mojaloop-connector.env'
+        shutil.copy(PACKAGE_DIR / 'mojaloop-connector.env', self.env_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def load_scheme(self):
+        return ITKConfigurationScheme(PACKAGE_DIR / 'itkschema.yaml', env_files=[('mc', str(self.env_path))])
+
+    def test_index_covers_all_items(self):
+        scheme = self.load_scheme()
+        groups = scheme.schema['itkconfigschema']['configuration']['groups']
+        self.assertEqual(len(scheme.config_item_index), sum(len(g['items']) for g in groups))
+        self.assertIn(('mc', 'DFSP_ID'), scheme.env_var_index)
+
+    def test_env_values_bound_to_items(self):
+        scheme = self.load_scheme()
+        self.assertEqual(scheme.get_config_item_value('mojaloop_connector_details', 'Inbound Listen Port'), '4000')
+        self.assertEqual(scheme.get_config_item_value('security', 'Inbound CA Certificate Path'),
+                         './secrets/cacert.pem')
+
+    def test_unknown_item_raises(self):
+        scheme = self.load_scheme()
+        with self.assertRaises(KeyError):
+            scheme.get_config_item_value('security', 'No Such Item')
+
+    def test_write_single_env_var_value(self):
+        scheme = self.load_scheme()
+        scheme.write_single_env_var_value('RESOURCE_VERSIONS', 'transfers=2.0')
+        scheme.write_single_env_var_value('ILP_SECRET', 'abc#123')
+
+        content = self.env_path.read_text()
+        self.assertIn('RESOURCE_VERSIONS="transfers=2.0"\n', content)
+        self.assertIn('ILP_SECRET=abc#123\n', content)
+
+    def test_patched_positions_match_a_fresh_read(self):
+        # values are shortened, lengthened, and quoted; the positions we keep must match re-reading the file
+        scheme = self.load_scheme()
+        scheme.write_single_env_var_value('ILP_SECRET', 'x')
+        scheme.write_single_env_var_value('DFSP_ID', 'a much longer dfsp id than before')
+
+        for group_id, item_name in [('dfsp_details', 'DFSP ID'), ('mojaloop_connector_details', 'Inbound Listen Port')]:
+            item = scheme.config_item_index[(group_id, item_name)]
+            scheme.config_value_changed(group_id, item, item['value'] + '0')
+        scheme.saveChanges()
+
+        fresh = self.load_scheme()
+        keys = ('value', 'original_value', 'line_number', 'original_line', 'line_span', 'value_span')
+
+        self.assertEqual(fresh.env_values, scheme.env_values)
+        for key, item in fresh.config_item_index.items():
+            self.assertEqual({k: item.get(k) for k in keys}, {k: scheme.config_item_index[key].get(k) for k in keys})
+
+        # and further edits still find their lines
+        scheme.write_single_env_var_value('ILP_SECRET', 'yy')
+        self.assertIn('ILP_SECRET=yy\n', self.env_path.read_text())
+
+    def test_services_to_restart(self):
+        scheme = self.load_scheme()
+        self.assertEqual([], scheme.get_services_to_restart())
+
+        # writing a value that is already in the file changes nothing
+        scheme.write_single_env_var_value('DFSP_ID', scheme.env_values[('mc', 'DFSP_ID')])
+        self.assertEqual([], scheme.get_services_to_restart())
+
+        scheme.write_single_env_var_value('ILP_SECRET', 'abc123')
+        self.assertEqual(['itk-mojaloop-connector'], scheme.get_services_to_restart())
+
+        scheme.services_restarted(['itk-core-connector'])
+        self.assertEqual(['itk-mojaloop-connector'], scheme.get_services_to_restart())
+        scheme.services_restarted(['itk-mojaloop-connector'])
+        self.assertEqual([], scheme.get_services_to_restart())
+
+        scheme.mark_restart_needed(scheme.get_group_env_file_ids('security'))
+        self.assertEqual(['itk-mojaloop-connector'], scheme.get_services_to_restart())
+
+    def test_pending_changes(self):
+        scheme = self.load_scheme()
+        item = scheme.config_item_index[('dfsp_details', 'DFSP ID')]
+        saved_value = item['value']
+        self.assertFalse(scheme.has_unsaved_changes())
+
+        scheme.config_value_changed('dfsp_details', item, 'newdfsp')
+        self.assertTrue(scheme.has_unsaved_changes())
+        self.assertEqual([{'group': 'dfsp_details', 'item': 'DFSP ID', 'env_file': 'mc', 'env_var': 'DFSP_ID',
+                           'saved_value': saved_value, 'value': 'newdfsp'}], scheme.get_pending_changes())
+
+        # editing back to the saved value is not a change
+        scheme.config_value_changed('dfsp_details', item, saved_value)
+        self.assertFalse(scheme.has_unsaved_changes())
+
+        scheme.config_value_changed('dfsp_details', item, 'newdfsp')
+        scheme.saveChanges()
+        self.assertIn('DFSP_ID=newdfsp\n', self.env_path.read_text())
+        self.assertFalse(scheme.has_unsaved_changes())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from itkconfigurator.customclasses import OutputBuffer, get_job_log_filename, run_sub_process
+
+
+def python_command(code):
+    return [sys.executable, '-u', '-c', code]
+
+
+class TestRunSubProcess(unittest.TestCase):
+    def test_output_in_arrival_order(self):
+        lines = []
+        code = ('import sys, time\n'
+                'for i in range(3):\n'
+                '    print("out", i, flush=True); time.sleep(0.05)\n'
+                '    print("err", i, file=sys.stderr, flush=True); time.sleep(0.05)\n'
+                'sys.exit(3)\n')
+
+        self.assertEqual(3, run_sub_process(python_command(code), lines.append))
+        self.assertEqual(['out 0', 'err 0', 'out 1', 'err 1', 'out 2', 'err 2'], lines)
+
+    def test_large_stderr_does_not_block(self):
+        lines = []
+        code = 'import sys\nsys.stderr.write("x" * 1000000 + "\\n")\nprint("done")\n'
+
+        self.assertEqual(0, run_sub_process(python_command(code), lines.append, timeout_secs=10))
+        self.assertEqual([1000000, 4], [len(line) for line in lines])
+
+    def test_timeout(self):
+        lines = []
+        start = time.monotonic()
+
+        self.assertLess(run_sub_process(python_command('import time; time.sleep(30)'), lines.append,
+                                        timeout_secs=0.3), 0)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(['Timed out after 0.3 seconds.'], lines)
+
+    def test_cancel(self):
+        lines = []
+        cancel_event = threading.Event()
+        threading.Timer(0.3, cancel_event.set).start()
+
+        self.assertLess(run_sub_process(python_command('print("started", flush=True)\nimport time; time.sleep(30)'),
+                                        lines.append, cancel_event=cancel_event), 0)
+        self.assertEqual(['started', 'Cancelled.'], lines)
+
+
+class TestOutputBuffer(unittest.TestCase):
+    def test_wraps_new_lines(self):
+        buffer = OutputBuffer(10)
+        buffer.add_lines(['short', 'a line that is longer than ten', ''])
+
+        self.assertEqual(['short', 'a line', 'that is', 'longer', 'than ten', ''], list(buffer.lines))
+
+    def test_drops_oldest_lines_when_full(self):
+        buffer = OutputBuffer(80, max_lines=3)
+
+        self.assertEqual(0, buffer.add_lines(['1', '2']))
+        self.assertEqual(2, buffer.add_lines(['3', '4', '5']))
+        self.assertEqual(['3', '4', '5'], list(buffer.lines))
+        self.assertEqual(2, buffer.dropped_lines)
+
+    def test_log_file_keeps_full_output(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log_filename = os.path.join(tmp, 'job.log')
+            buffer = OutputBuffer(5, max_lines=2, log_filename=log_filename)
+            buffer.add_lines(['first line', 'second', 'third'])
+            buffer.close()
+
+            self.assertEqual(['d', 'third'], list(buffer.lines))
+            with open(log_filename) as f:
+                self.assertEqual('first line\nsecond\nthird\n', f.read())
+
+    def test_job_log_filename(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log_dir = os.path.join(tmp, 'logs')
+
+            with mock.patch.dict(os.environ, {'ITK_JOB_LOG_DIR': log_dir}):
+                self.assertEqual(os.path.join(log_dir, 'restart-services.log'),
+                                 get_job_log_filename('restart-services'))
+
+            self.assertTrue(os.path.isdir(log_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
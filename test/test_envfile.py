@@ -0,0 +1,114 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import os
+import tempfile
+import unittest
+
+from itkconfigurator.envfile import tokenize_env_bytes, replace_env_line_value, encode_env_value, \
+    find_env_records, patch_file_in_place
+
+ENV_CONTENT = b'''# a comment line
+INBOUND_LISTEN_PORT=4000
+
+export PEER_ENDPOINT = mojaloop.hub.net:4040  # inline comment
+RESOURCE_VERSIONS="transfers=1.1,participants=1.1"
+CALLBACK_URL=http://example.com/path#fragment
+QUOTED_WITH_HASH='a # b' # comment
+EMPTY=
+ESCAPED="line\\none \\"two\\""\r
+'''
+
+
+class TestEnvFileTokenizer(unittest.TestCase):
+    def setUp(self):
+        self.records = {r.name: r for r in tokenize_env_bytes(ENV_CONTENT)}
+
+    def test_names_and_line_numbers(self):
+        self.assertEqual(list(self.records), ['INBOUND_LISTEN_PORT', 'PEER_ENDPOINT', 'RESOURCE_VERSIONS',
+                                              'CALLBACK_URL', 'QUOTED_WITH_HASH', 'EMPTY', 'ESCAPED'])
+        self.assertEqual(self.records['INBOUND_LISTEN_PORT'].line_number, 2)
+        self.assertEqual(self.records['ESCAPED'].line_number, 9)
+
+    def test_values(self):
+        self.assertEqual(self.records['PEER_ENDPOINT'].value, 'mojaloop.hub.net:4040')
+        self.assertEqual(self.records['RESOURCE_VERSIONS'].value, 'transfers=1.1,participants=1.1')
+        self.assertEqual(self.records['RESOURCE_VERSIONS'].quote, '"')
+        self.assertEqual(self.records['CALLBACK_URL'].value, 'http://example.com/path#fragment')
+        self.assertEqual(self.records['QUOTED_WITH_HASH'].value, 'a # b')
+        self.assertEqual(self.records['EMPTY'].value, '')
+        self.assertEqual(self.records['ESCAPED'].value, 'line\none "two"')
+
+    def test_spans(self):
+        for record in self.records.values():
+            start, end = record.value_span
+            self.assertEqual(ENV_CONTENT[start:end].decode(), record.raw_value)
+            start, end = record.line_span
+            self.assertEqual(ENV_CONTENT[start:end].decode(), record.line)
+
+    def test_find_records_by_name(self):
+        data = ENV_CONTENT + b'# EMPTY=commented out\nEMPTY_TOO=1\n'
+        found = find_env_records(data, ['EMPTY', 'PEER_ENDPOINT'])
+        self.assertEqual([r.name for r in found], ['PEER_ENDPOINT', 'EMPTY'])
+        self.assertEqual(found[1], self.records['EMPTY'])
+
+    def test_replace_keeps_line_layout(self):
+        self.assertEqual(replace_env_line_value('export PEER_ENDPOINT = old  # comment\n', 'new'),
+                         'export PEER_ENDPOINT = new  # comment\n')
+        self.assertEqual(replace_env_line_value('RESOURCE_VERSIONS="a=1"\r\n', 'b=2'), 'RESOURCE_VERSIONS="b=2"\r\n')
+        self.assertEqual(replace_env_line_value('# not an assignment\n', 'x'), '# not an assignment\n')
+
+    def test_encode_round_trip(self):
+        for value in ['plain', 'with space', ' leading', 'a #b', '#start', 'quote"s', "it's", 'multi\nline', '']:
+            line = 'VAR=' + encode_env_value(value) + '\n'
+            record = next(tokenize_env_bytes(line.encode()))
+            self.assertEqual(record.value, value)
+
+
+class TestPatchFileInPlace(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+        with open(self.path, 'wb') as file:
+            file.write(ENV_CONTENT)
+
+        self.records = {r.name: r for r in tokenize_env_bytes(ENV_CONTENT)}
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def read(self):
+        with open(self.path, 'rb') as file:
+            return file.read()
+
+    def test_same_length_patch(self):
+        span = self.records['INBOUND_LISTEN_PORT'].value_span
+        self.assertEqual(patch_file_in_place(self.path, [(span, b'5000')]), span[0])
+        self.assertEqual(self.read(), ENV_CONTENT.replace(b'=4000', b'=5000'))
+
+    def test_length_changing_patches(self):
+        port_span = self.records['INBOUND_LISTEN_PORT'].value_span
+        empty_span = self.records['EMPTY'].value_span
+        patch_file_in_place(self.path, [(empty_span, b'now_set'), (port_span, b'4')], b'APPENDED=1\n')
+
+        expected = ENV_CONTENT.replace(b'=4000', b'=4').replace(b'EMPTY=', b'EMPTY=now_set') + b'APPENDED=1\n'
+        self.assertEqual(self.read(), expected)
+
+    def test_nothing_to_patch(self):
+        self.assertIsNone(patch_file_in_place(self.path, []))
+        self.assertEqual(self.read(), ENV_CONTENT)
+
+
+if __name__ == '__main__':
+    unittest.main()
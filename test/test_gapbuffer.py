@@ -0,0 +1,73 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import random
+import unittest
+
+from itkconfigurator.gapbuffer import GapBuffer
+
+
+class TestGapBuffer(unittest.TestCase):
+    def test_edits(self):
+        buffer = GapBuffer('https://hub.example.com')
+
+        self.assertEqual(1, buffer.insert(4, 's'))
+        self.assertEqual(1, buffer.delete(4, 5))
+        buffer.insert(len(buffer), '/api')
+        buffer.insert(0, ' ')
+        buffer.delete(0, 1)
+
+        self.assertEqual('https://hub.example.com/api', str(buffer))
+        self.assertEqual(len('https://hub.example.com/api'), len(buffer))
+        self.assertEqual('hub', buffer.slice(8, 11))
+
+    def test_out_of_range_positions_are_clamped(self):
+        buffer = GapBuffer('abc')
+
+        buffer.insert(10, 'd')
+        buffer.insert(-5, '_')
+
+        self.assertEqual(0, buffer.delete(3, 1))
+        self.assertEqual('_abcd', str(buffer))
+        self.assertEqual('_abcd', buffer.slice(-1, 100))
+        self.assertEqual(5, buffer.delete(-1, 100))
+        self.assertEqual('', str(buffer))
+
+    def test_matches_str_edits(self):
+        rng = random.Random(7)
+        buffer = GapBuffer()
+        expected = ''
+
+        for _ in range(2000):
+            position = rng.randint(-2, len(expected) + 2)
+            clamped = min(max(position, 0), len(expected))
+
+            if rng.random() < 0.6:
+                # mostly single keys, sometimes a paste bigger than the gap
+                text = 'k' if rng.random() < 0.8 else ','.join(str(n) for n in range(rng.randint(1, 100)))
+                buffer.insert(position, text)
+                expected = expected[:clamped] + text + expected[clamped:]
+            else:
+                end = min(max(position + rng.randint(0, 5), 0), len(expected))
+                buffer.delete(position, position + (end - clamped))
+                expected = expected[:clamped] + expected[end:]
+
+            start = rng.randint(0, len(expected))
+            self.assertEqual(expected[start:start + 20], buffer.slice(start, start + 20))
+            self.assertEqual(len(expected), len(buffer))
+
+        self.assertEqual(expected, str(buffer))
+
+
+if __name__ == '__main__':
+    unittest.main()
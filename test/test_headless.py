@@ -0,0 +1,101 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from itkconfigurator import headless
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent / 'itkconfigurator'
+
+
+class TestHeadless(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.env_path = Path(self.tmp_dir) / 'mojaloop-connector.env'
+        shutil.copy(PACKAGE_DIR / 'mojaloop-connector.env', self.env_path)
+        self.original = self.env_path.read_text()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_headless(self, *args):
+        return headless.run(list(args), out=None)
+
+    def test_apply_assignments(self):
+        exit_code, result = self.run_headless('apply', '--env', 'mc={}'.format(self.env_path), 'DFSP_ID=newdfsp',
+                                              'mc:JWS_SIGN=true')
+        self.assertEqual(exit_code, headless.EXIT_OK)
+        self.assertEqual([(c['env_var'], c['old_value'], c['new_value']) for c in result['changes']],
+                         [('DFSP_ID', 'mojaloop-sdk', 'newdfsp'), ('JWS_SIGN', 'false', 'true')])
+        self.assertEqual(result['written'], [str(self.env_path)])
+        self.assertEqual(result['restart_services'], ['itk-mojaloop-connector'])
+        self.assertIn('\nDFSP_ID=newdfsp\n', self.env_path.read_text())
+
+    def test_apply_patch_file(self):
+        patch_path = Path(self.tmp_dir) / 'patch.yaml'
+        patch_path.write_text('mc:\n  JWS_SIGN: true\n  OUTBOUND_LISTEN_PORT: 4101\n')
+
+        exit_code, result = self.run_headless('apply', '--env', 'mc={}'.format(self.env_path), '--patch',
+                                              str(patch_path), '--dry-run')
+        self.assertEqual(exit_code, headless.EXIT_OK)
+        self.assertEqual({c['env_var']: c['new_value'] for c in result['changes']},
+                         {'JWS_SIGN': 'true', 'OUTBOUND_LISTEN_PORT': '4101'})
+        self.assertEqual(self.env_path.read_text(), self.original)
+
+    def test_invalid_values_are_not_written(self):
+        exit_code, result = self.run_headless('apply', '--env', 'mc={}'.format(self.env_path), 'JWS_SIGN=maybe')
+        self.assertEqual(exit_code, headless.EXIT_FAILED)
+        self.assertEqual(result['errors'][0]['env_var'], 'JWS_SIGN')
+        self.assertEqual(self.env_path.read_text(), self.original)
+
+    def test_missing_var(self):
+        exit_code, result = self.run_headless('apply', '--env', 'mc={}'.format(self.env_path), 'NOT_THERE=1')
+        self.assertEqual(exit_code, headless.EXIT_FAILED)
+
+        exit_code, result = self.run_headless('apply', '--env', 'mc={}'.format(self.env_path), '--missing', 'append',
+                                              'NOT_THERE=1')
+        self.assertEqual(exit_code, headless.EXIT_OK)
+        self.assertTrue(self.env_path.read_text().endswith('NOT_THERE=1\n'))
+
+    def test_unreadable_patch_and_schema_are_usage_errors(self):
+        bad_yaml = Path(self.tmp_dir) / 'bad.yaml'
+        bad_yaml.write_text('mc: [unclosed\n')
+        bad_json = Path(self.tmp_dir) / 'bad.json'
+        bad_json.write_text('{"mc": ')
+        bad_schema = Path(self.tmp_dir) / 'schema.yaml'
+        bad_schema.write_text('itkconfigschema:\n  name: broken\n')
+
+        for args in (['--patch', str(bad_yaml)], ['--patch', str(bad_json)], ['--schema', str(bad_schema)]):
+            exit_code, result = self.run_headless('apply', '--env', 'mc={}'.format(self.env_path), *args)
+            self.assertEqual(exit_code, headless.EXIT_USAGE)
+            self.assertEqual(1, len(result['errors']))
+
+        self.assertEqual(self.env_path.read_text(), self.original)
+
+    def test_validate(self):
+        exit_code, result = self.run_headless('validate', '--env', 'mc={}'.format(self.env_path))
+        self.assertEqual((exit_code, result['errors']), (headless.EXIT_OK, []))
+
+    def test_does_not_load_tui(self):
+        output = subprocess.check_output([sys.executable, '-c', 'import sys, itkconfigurator.headless; '
+                                          'print("npyscreen" in sys.modules)'], cwd=PACKAGE_DIR.parent, text=True)
+        self.assertEqual(output.strip(), 'False')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import shutil
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from itkconfigurator import pkievents
+from itkconfigurator.orchestrator import ProvisioningOrchestrator, load_manifest
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent / 'itkconfigurator'
+
+MANIFEST = '''
+workers: 2
+defaults:
+  values:
+    mc:
+      JWS_SIGN: true
+  generate_mtls: true
+  generate_jws: true
+  rotate_ilp_secret: true
+tenants:
+  - id: dfsp1
+    dir: dfsp1
+    values:
+      DFSP_ID: dfsp1
+  - id: dfsp2
+    dir: dfsp2
+    values:
+      DFSP_ID: dfsp2
+  - id: broken
+    dir: broken
+    values:
+      JWS_SIGN: perhaps
+'''
+
+
+class RecordingPki:
+    """
+    Stands in for PkiTools, writing placeholder files and recording the calls made to it
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.closed = True
+
+    def create_client_mtls_artefacts(self, dfsp_name, ca_path, cert_path, key_path, alt_names, mount_point='pki'):
+        with self.lock:
+            self.calls.append(('mtls', dfsp_name, mount_point))
+
+        for path in (ca_path, cert_path, key_path):
+            Path(path).write_text(dfsp_name)
+
+    def create_jws_keypair(self, key_name, private_key_path, public_key_path):
+        with self.lock:
+            self.calls.append(('jws', key_name))
+
+        with pkievents.phase('file_write'):
+            for path in (private_key_path, public_key_path):
+                Path(path).write_text(key_name)
+
+
+class TestProvisioningOrchestrator(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+
+        for tenant in ('dfsp1', 'dfsp2', 'broken'):
+            (self.tmp_dir / tenant).mkdir()
+            shutil.copy(PACKAGE_DIR / 'mojaloop-connector.env', self.tmp_dir / tenant / 'mojaloop-connector.env')
+
+        self.manifest_path = self.tmp_dir / 'manifest.yaml'
+        self.manifest_path.write_text(MANIFEST)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_provision(self):
+        settings, tenants = load_manifest(self.manifest_path)
+        pki = RecordingPki()
+
+        summary = ProvisioningOrchestrator(tenants, workers=settings['workers'], pki_factory=lambda: pki).run()
+
+        self.assertEqual((summary['tenants'], summary['succeeded'], summary['failed']), (3, 2, ['broken']))
+        self.assertTrue(pki.closed)
+        self.assertEqual(sorted(c for c in pki.calls if c[0] == 'mtls'),
+                         [('mtls', 'dfsp1', 'pki-dfsp1'), ('mtls', 'dfsp2', 'pki-dfsp2')])
+
+        env = (self.tmp_dir / 'dfsp1' / 'mojaloop-connector.env').read_text()
+        self.assertIn('\nDFSP_ID=dfsp1\n', env)
+        self.assertIn('\nJWS_SIGN=true\n', env)
+        self.assertNotIn('ILP_SECRET=NtPklRpwmN8N0BumM48IM94YrbEIZMuZ', env)
+        self.assertEqual((self.tmp_dir / 'dfsp1' / 'secrets' / 'cacert.pem').read_text(), 'dfsp1')
+
+        self.assertEqual([('file_write', 2, 0)], [(p['phase'], p['count'], p['failed'])
+                                                  for p in summary['pki_timings']['phases']])
+
+        broken = next(r for r in summary['results'] if r['tenant'] == 'broken')
+        self.assertEqual([(s['step'], s['ok']) for s in broken['steps']], [('config', False)])
+        self.assertEqual(broken['steps'][0]['validation_errors'][0]['env_var'], 'JWS_SIGN')
+
+    def test_clashing_tenant_ids_are_rejected(self):
+        # both default to the id dfsp1; and dfsp.1 and dfsp-1 would share the pki-dfsp-1 mount
+        for tenants in ('  - dir: a/dfsp1\n  - dir: b/dfsp1\n',
+                        '  - id: dfsp.1\n    dir: a\n  - id: dfsp-1\n    dir: b\n'):
+            self.manifest_path.write_text('tenants:\n' + tenants)
+
+            with self.assertRaises(ValueError):
+                load_manifest(self.manifest_path)
+
+    def test_pki_unavailable_fails_only_pki_steps(self):
+        _settings, tenants = load_manifest(self.manifest_path)
+
+        def failing_factory():
+            raise ConnectionError('no docker')
+
+        summary = ProvisioningOrchestrator(tenants[:1], pki_factory=failing_factory).run()
+        steps = {s['step']: s for s in summary['results'][0]['steps']}
+
+        self.assertEqual(summary['failed'], ['dfsp1'])
+        self.assertTrue(steps['config']['ok'])
+        self.assertTrue(steps['ilp_secret']['ok'])
+        self.assertIn('no docker', steps['mtls']['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from itkconfigurator import pkievents
+from itkconfigurator.pkibackend import PkiBackend
+
+
+class BatchPkiTools(PkiBackend):
+    """
+    A PKI backend that records the order jobs ran in
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def write(self, *paths):
+        for path in paths:
+            with open(path, 'w') as file:
+                file.write(path)
+
+    def create_client_mtls_artefacts(self, dfsp_name, ca_cert_path, server_cert_path, server_key_path, dns_names,
+                                     mount_point='pki'):
+        self.calls.append(('mtls', mount_point))
+        self.write(ca_cert_path, server_cert_path, server_key_path)
+
+    def issue_server_cert(self, common_name, alt_names, server_cert_path, server_cert_key_path, mount_point='pki'):
+        self.calls.append(('server_certs', mount_point))
+        self.write(server_cert_path, server_cert_key_path)
+
+    def create_jws_keypair(self, key_name, private_key_path, public_key_path):
+        if key_name == 'bad':
+            raise RuntimeError('vault said no')
+
+        self.calls.append(('jws_keypairs', key_name))
+
+        with pkievents.phase('file_write'):
+            self.write(private_key_path, public_key_path)
+
+
+class TestPkiBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.job_filename = os.path.join(self.tmp_dir, 'jobs.yaml')
+
+        with open(self.job_filename, 'w') as file:
+            file.write('''
+server_certs:
+  - common_name: api.dfsp1.example.com
+    server_cert_path: api.pem
+    server_key_path: api-key.pem
+    mount_point: pki-dfsp1
+mtls:
+  - dfsp_name: dfsp1
+    ca_cert_path: ca.pem
+    server_cert_path: server.pem
+    server_key_path: server-key.pem
+    mount_point: pki-dfsp1
+jws_keypairs:
+  - key_name: dfsp1
+    private_key_path: jws.pem
+    public_key_path: jws-pub.pem
+  - key_name: bad
+    private_key_path: bad.pem
+    public_key_path: bad-pub.pem
+''')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_load_batch_job_file(self):
+        jobs = BatchPkiTools().load_batch_job_file(self.job_filename)
+
+        self.assertEqual(['mtls', 'server_certs', 'jws_keypairs', 'jws_keypairs'], [j['type'] for j in jobs])
+        self.assertEqual(os.path.join(self.tmp_dir, 'ca.pem'), jobs[0]['ca_cert_path'])
+        self.assertEqual('pki-dfsp1', jobs[0]['mount_point'])
+
+    def test_issue_batch(self):
+        pki = BatchPkiTools()
+        jobs = pki.load_batch_job_file(self.job_filename)
+        streamed = []
+
+        results = pki.issue_batch(jobs, max_workers=4, result_callback=streamed.append)
+
+        # root CAs are created before any server certs are issued from them
+        self.assertEqual(('mtls', 'pki-dfsp1'), pki.calls[0])
+        self.assertEqual(4, len(streamed))
+        self.assertEqual([0, 1, 2, 3], [r['job'] for r in results])
+        self.assertEqual([True, True, True, False], [r['ok'] for r in results])
+        self.assertIn('vault said no', results[3]['error'])
+
+        for path in results[1]['files'] + results[2]['files']:
+            self.assertTrue(os.path.exists(path))
+
+    def test_batch_job_events_reach_caller_listener(self):
+        pki = BatchPkiTools()
+        jobs = pki.load_batch_job_file(self.job_filename)
+        events = []
+
+        previous_listener = pkievents.set_listener(events.append)
+        self.addCleanup(pkievents.set_listener, previous_listener)
+        pki.issue_batch(jobs, max_workers=4)
+
+        self.assertEqual([('phase_start', 'file_write'), ('phase_end', 'file_write')],
+                         [(e['event'], e['phase']) for e in events])
+
+    def test_issue_batch_from_file_fails_if_any_job_fails(self):
+        with self.assertRaises(Exception):
+            BatchPkiTools().issue_batch_from_file(self.job_filename)
+
+    def test_incomplete_backend_cannot_be_created(self):
+        class NoJwsPkiTools(PkiBackend):
+            def create_client_mtls_artefacts(self, *args, **kwargs):
+                pass
+
+            def issue_server_cert(self, *args, **kwargs):
+                pass
+
+        with self.assertRaises(TypeError):
+            NoJwsPkiTools()
+
+
+if __name__ == '__main__':
+    unittest.main()
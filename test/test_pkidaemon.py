@@ -0,0 +1,116 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import unittest
+
+from itkconfigurator import pkievents
+from itkconfigurator import pkidaemon
+from itkconfigurator.pkidaemon import PkiDaemon, PkiDaemonClient, PkiDaemonError, ensure_socket_dir
+
+
+class PrintingPki:
+    """
+    Stands in for PkiTools, printing progress the way it does
+    """
+
+    def __init__(self):
+        self.jobs = []
+        self.exited = False
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.exited = True
+
+    def create_jws_keypair(self, key_name, private_key_path, public_key_path):
+        print('Creating new JWS keypair...')
+        print('Writing keys to disk...')
+
+        with pkievents.phase('file_write'):
+            pass
+
+        self.jobs.append((key_name, private_key_path, public_key_path))
+
+    def create_client_mtls_artefacts(self, *args):
+        raise RuntimeError('vault said no')
+
+
+class TestPkiDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmp_dir, 'pki.sock')
+        self.pki = PrintingPki()
+        self.daemon = PkiDaemon(self.socket_path, idle_timeout_secs=0.5, pki_factory=lambda: self.pki)
+        self.thread = threading.Thread(target=self.daemon.serve, daemon=True)
+        self.thread.start()
+
+        self.client = PkiDaemonClient(self.socket_path)
+        deadline = time.monotonic() + 5
+        while not self.client.is_running() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def tearDown(self):
+        if self.client.is_running():
+            self.client.request('shutdown')
+        self.thread.join(5)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_job_output_and_result(self):
+        lines = []
+        events = []
+        ok, error = self.client.submit('generate_jws_keypair', ['key', 'private.pem', '/abs/public.pem'],
+                                       output_line_callback=lines.append, event_callback=events.append)
+
+        self.assertEqual((ok, error), (True, None))
+        self.assertEqual(lines, ['Creating new JWS keypair...', 'Writing keys to disk...'])
+        self.assertEqual([(e['event'], e['phase']) for e in events], [('phase_start', 'file_write'),
+                                                                     ('phase_end', 'file_write')])
+        self.assertEqual(self.pki.jobs, [('key', os.path.abspath('private.pem'), '/abs/public.pem')])
+
+    def test_job_error(self):
+        ok, error = self.client.submit('generate_client_side_mtls', ['dfsp', 'a', 'b', 'c', 'dfsp.com'])
+        self.assertFalse(ok)
+        self.assertIn('vault said no', error)
+
+        # the daemon keeps serving after a failed job
+        self.assertTrue(self.client.is_running())
+
+    def test_socket_is_private(self):
+        self.assertEqual(0, stat.S_IMODE(os.stat(self.socket_path).st_mode) & 0o077)
+
+    def test_shared_default_socket_dir_is_refused(self):
+        socket_dir = os.path.join(self.tmp_dir, 'run')
+        original_socket_dir = pkidaemon.DEFAULT_SOCKET_DIR
+        pkidaemon.DEFAULT_SOCKET_DIR = socket_dir
+        self.addCleanup(setattr, pkidaemon, 'DEFAULT_SOCKET_DIR', original_socket_dir)
+
+        ensure_socket_dir(os.path.join(socket_dir, 'itk-pki-daemon.sock'))
+        self.assertEqual(0o700, stat.S_IMODE(os.stat(socket_dir).st_mode))
+
+        os.chmod(socket_dir, 0o777)
+        with self.assertRaises(PkiDaemonError):
+            ensure_socket_dir(os.path.join(socket_dir, 'itk-pki-daemon.sock'))
+
+    def test_idle_shutdown(self):
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+        self.assertTrue(self.pki.exited)
+        self.assertFalse(os.path.exists(self.socket_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
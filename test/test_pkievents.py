@@ -0,0 +1,88 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from itkconfigurator import pkievents
+from itkconfigurator.pkievents import PhaseTimings
+
+
+class TestPkiEvents(unittest.TestCase):
+    def tearDown(self):
+        pkievents.set_listener(None)
+        pkievents.set_default_listener(None)
+
+    def test_phase_timings(self):
+        timings = PhaseTimings()
+        pkievents.set_listener(timings)
+
+        pkievents.plan('key_create', 'file_write', 'file_write')
+
+        with pkievents.phase('key_create', key_name='jws'):
+            self.assertEqual('key_create', timings.current_phase())
+            self.assertEqual((0, 3), timings.progress())
+
+        with pkievents.phase('file_write'):
+            pass
+
+        with self.assertRaises(OSError):
+            with pkievents.phase('file_write'):
+                raise OSError('disk full')
+
+        self.assertEqual((3, 3), timings.progress())
+        self.assertIsNone(timings.current_phase())
+        self.assertEqual('jws', timings.events[1]['key_name'])
+        self.assertEqual([('key_create', 1, 0), ('file_write', 2, 1)],
+                         [(p['phase'], p['count'], p['failed']) for p in timings.as_dict()['phases']])
+        self.assertEqual('[##########] 3/3', timings.format_bar(16))
+        self.assertIn('file_write', timings.format_durations())
+
+        # other threads have no listener, so their events go nowhere
+        event_count = len(timings.events)
+        thread = threading.Thread(target=lambda: pkievents.plan('root_ca'))
+        thread.start()
+        thread.join()
+        self.assertEqual(event_count, len(timings.events))
+
+    def test_events_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        filename = os.path.join(tmp_dir, 'events.jsonl')
+        os.environ[pkievents.PKI_EVENTS_FILE_ENV_VAR] = filename
+
+        try:
+            writer = pkievents.install_events_file_from_environment()
+
+            with pkievents.phase('unseal'):
+                pass
+
+            writer.close()
+
+            with open(filename) as file:
+                events = [json.loads(line) for line in file]
+
+            self.assertEqual([('phase_start', 'unseal'), ('phase_end', 'unseal')],
+                             [(e['event'], e['phase']) for e in events])
+            self.assertTrue(events[1]['ok'])
+
+        finally:
+            del os.environ[pkievents.PKI_EVENTS_FILE_ENV_VAR]
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,15 +11,104 @@
 #       James Bush - jbush@mojaloop.io                                   #
 ##########################################################################
 
+import importlib.util
+import os
+import shutil
+import tempfile
+import time
 import unittest
 
-from pkitools import PkiTools
+from fakevault import FakeVault
+from itkconfigurator import pkievents
+from itkconfigurator.localpki import x509
+from itkconfigurator.pkitools import PkiTools
 
 
-class TestPkiTools(unittest.Testcase):
+def docker_available():
+    try:
+        import docker
+        return docker.from_env().ping()
+    except Exception:
+        return False
+
+
+def vault_clients_installed():
+    return all(importlib.util.find_spec(name) is not None for name in ('docker', 'hvac'))
+
+
+@unittest.skipUnless(docker_available(), 'needs a docker daemon to run the vault container')
+class TestPkiTools(unittest.TestCase):
     def test_init(self):
-        pkiTools = PkiTools()
+        with PkiTools() as pkiTools:
+            self.assertTrue(pkiTools.vaultClient.sys.is_initialized())
+
+
+@unittest.skipUnless(x509 is not None and vault_clients_installed(), 'needs the cryptography, docker and hvac packages')
+class TestPkiToolsWithFakeVault(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.vault = FakeVault(ca_key_bits=1024, key_bits=1024)
+
+    def tearDown(self):
+        self.vault.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir, name)
+
+    def read_cert(self, name):
+        with open(self.path(name), 'rb') as file:
+            return x509.load_pem_x509_certificate(file.read())
+
+    def test_client_mtls_artefacts(self):
+        timings = pkievents.PhaseTimings()
+        pkievents.set_listener(timings)
+        self.addCleanup(pkievents.set_listener, None)
+
+        with self.vault.create_pki_tools(self.path('vaultinit.json')) as pkiTools:
+            pkiTools.create_client_mtls_artefacts('dfsp1', self.path('ca.pem'), self.path('server.pem'),
+                                                  self.path('server-key.pem'), 'dfsp1.example.com')
+            pkiTools.create_client_mtls_artefacts('dfsp1', self.path('ca2.pem'), self.path('server.pem'),
+                                                  self.path('server-key.pem'), None)
+            pkiTools.issue_server_cert('api.dfsp1.example.com', None, self.path('api.pem'), self.path('api-key.pem'))
+
+        # the second root CA replaced the first and issued the later certificates
+        ca_cert = self.read_cert('ca2.pem')
+        self.assertNotEqual(self.read_cert('ca.pem').serial_number, ca_cert.serial_number)
+        self.read_cert('server.pem').verify_directly_issued_by(ca_cert)
+        self.read_cert('api.pem').verify_directly_issued_by(ca_cert)
+
+        # every phase that was planned ran, and succeeded
+        done, planned = timings.progress()
+        self.assertEqual(planned, done)
+        self.assertEqual(['container_start', 'health_wait', 'init', 'unseal', 'engine_setup', 'root_ca', 'role',
+                          'file_write', 'cert_issue', 'seal', 'container_stop'], list(timings.durations()))
+        self.assertFalse(any(failed for _count, _secs, failed in timings.durations().values()))
+
+    def test_jws_keypair_and_restart(self):
+        with self.vault.create_pki_tools(self.path('vaultinit.json')) as pkiTools:
+            pkiTools.create_jws_keypair('dfsp1-jws', self.path('private.pem'), self.path('public.pem'))
+
+        self.assertTrue(self.vault.sealed)
+
+        # a second session finds vault initialized, unseals it with the saved key and gets the same key back
+        with self.vault.create_pki_tools(self.path('vaultinit.json')) as pkiTools:
+            self.assertFalse(pkiTools.vaultClient.sys.is_sealed())
+            self.assertEqual(self.vault.root_token, pkiTools.vault_root_token)
+            pkiTools.create_jws_keypair('dfsp1-jws', self.path('private2.pem'), self.path('public2.pem'))
+
+        for first, second in (('private.pem', 'private2.pem'), ('public.pem', 'public2.pem')):
+            with open(self.path(first)) as file1, open(self.path(second)) as file2:
+                self.assertEqual(file1.read(), file2.read())
+
+    def test_latency(self):
+        self.vault.latency_secs = 0.02
+
+        start = time.perf_counter()
+        with self.vault.create_pki_tools(self.path('vaultinit.json')):
+            pass
 
+        self.assertGreaterEqual(time.perf_counter() - start, 0.02 * len(self.vault.requests))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,102 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import hashlib
+import marshal
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import yaml
+
+from itkconfigurator.schemacache import (SCHEMA_CACHE_FORMAT, SchemaError, get_cache_filename,
+                                         get_schema_cache_dir, load_schema)
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent / 'itkconfigurator'
+
+
+class TestSchemaCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.schema_path = os.path.join(self.tmp_dir, 'itkschema.yaml')
+        shutil.copy(PACKAGE_DIR / 'itkschema.yaml', self.schema_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def cache_filename(self):
+        return get_cache_filename(self.cache_dir, os.path.realpath(self.schema_path))
+
+    def test_warm_load_matches_cold_load(self):
+        with open(self.schema_path) as file:
+            expected = yaml.safe_load(file)
+
+        self.assertEqual(expected, load_schema(self.schema_path, self.cache_dir))
+        self.assertTrue(os.path.exists(self.cache_filename()))
+        self.assertEqual(expected, load_schema(self.schema_path, self.cache_dir))
+
+    def test_changed_schema_invalidates_cache(self):
+        load_schema(self.schema_path, self.cache_dir)
+
+        with open(self.schema_path, 'a') as file:
+            file.write('\nextra: 1\n')
+
+        self.assertEqual(1, load_schema(self.schema_path, self.cache_dir)['extra'])
+
+    def test_corrupt_cache_is_ignored(self):
+        load_schema(self.schema_path, self.cache_dir)
+
+        with open(self.cache_filename(), 'wb') as file:
+            file.write(b'not a cache file')
+
+        self.assertIn('itkconfigschema', load_schema(self.schema_path, self.cache_dir))
+
+    def test_shared_cache_dir_is_not_trusted(self):
+        # a cache file planted in a directory others can write to must not be used as the schema
+        load_schema(self.schema_path, self.cache_dir)
+        os.chmod(self.cache_dir, 0o777)
+
+        schema_path = os.path.realpath(self.schema_path)
+        key = (SCHEMA_CACHE_FORMAT, schema_path, os.stat(schema_path).st_mtime_ns, os.stat(schema_path).st_size,
+               hashlib.sha256(Path(schema_path).read_bytes()).hexdigest())
+
+        with open(self.cache_filename(), 'wb') as file:
+            marshal.dump((key, {'planted': True}), file)
+
+        self.assertIn('itkconfigschema', load_schema(self.schema_path, self.cache_dir))
+
+        os.chmod(self.cache_dir, 0o700)
+        self.assertEqual({'planted': True}, load_schema(self.schema_path, self.cache_dir))
+
+    def test_default_cache_dir_is_per_user(self):
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmp_dir}):
+            os.environ.pop('ITK_SCHEMA_CACHE_DIR', None)
+            os.environ.pop('ITK_SCHEMA_CACHE', None)
+            self.assertEqual(os.path.join(self.tmp_dir, 'itk-configurator', 'schema'), get_schema_cache_dir())
+
+    def test_invalid_schema_raises(self):
+        with open(self.schema_path, 'w') as file:
+            file.write('itkconfigschema:\n  name: broken\n')
+
+        with self.assertRaises(SchemaError):
+            load_schema(self.schema_path, self.cache_dir)
+
+        self.assertFalse(os.path.exists(self.cache_filename()))
+
+
+if __name__ == '__main__':
+    unittest.main()
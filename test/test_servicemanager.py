@@ -0,0 +1,117 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import time
+import unittest
+
+from itkconfigurator.servicemanager import ServiceManager
+
+
+class FakeContainer:
+    def __init__(self, name, restart_secs, events, healthy=True):
+        self.name = name
+        self.restart_secs = restart_secs
+        self.events = events
+        self.attrs = {'State': {'Status': 'running', 'Health': {'Status': 'starting'}}}
+        self.healthy = healthy
+
+    def restart(self):
+        self.events.append(('start', self.name))
+        time.sleep(self.restart_secs)
+        self.events.append(('end', self.name))
+
+    def reload(self):
+        if self.healthy:
+            self.attrs['State']['Health']['Status'] = 'healthy'
+        else:
+            self.attrs['State']['Status'] = 'exited'
+
+
+class FakeDockerClient:
+    def __init__(self, containers):
+        self.containers = self
+        self.list_calls = 0
+        self.all_containers = containers
+
+    def list(self, all=False, filters=None):
+        self.list_calls += 1
+        return self.all_containers
+
+
+class TestServiceManager(unittest.TestCase):
+    def create_service_manager(self, containers):
+        service_manager = ServiceManager.__new__(ServiceManager)
+        service_manager.dockerClient = FakeDockerClient(containers)
+        return service_manager
+
+    def test_restart_order_and_parallelism(self):
+        events = []
+        service_manager = self.create_service_manager([
+            FakeContainer('itk-mojaloop-connector', 0.2, events),
+            FakeContainer('itk-core-connector', 0.2, events),
+            FakeContainer('itk-redis', 0.1, events),
+            FakeContainer('itk-redis-old', 0, events),
+        ])
+
+        start = time.perf_counter()
+        results = service_manager.restart_services()
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(1, service_manager.dockerClient.list_calls)
+        self.assertEqual(['itk-mojaloop-connector', 'itk-core-connector', 'itk-redis'],
+                         [r['service'] for r in results])
+        self.assertTrue(all(r['ok'] for r in results))
+
+        # redis is back before either connector restarts, then the connectors restart together
+        self.assertEqual([('start', 'itk-redis'), ('end', 'itk-redis')], events[:2])
+        self.assertEqual({'start'}, {e[0] for e in events[2:4]})
+        self.assertLess(elapsed, 0.45)
+
+    def test_failed_dependency(self):
+        events = []
+        service_manager = self.create_service_manager([
+            FakeContainer('itk-core-connector', 0, events),
+            FakeContainer('itk-redis', 0, events, healthy=False),
+        ])
+
+        results = {r['service']: r for r in service_manager.restart_services()}
+
+        # the connector still restarts once redis has failed
+        self.assertIn('stopped', results['itk-redis']['error'])
+        self.assertTrue(results['itk-core-connector']['ok'])
+        self.assertIn('not found', results['itk-mojaloop-connector']['error'])
+        self.assertEqual([('start', 'itk-redis'), ('end', 'itk-redis'), ('start', 'itk-core-connector')], events[:3])
+
+    def test_missing_dependency(self):
+        events = []
+        service_manager = self.create_service_manager([
+            FakeContainer('itk-mojaloop-connector', 0, events),
+            FakeContainer('itk-core-connector', 0, events),
+        ])
+
+        results = {r['service']: r for r in service_manager.restart_services()}
+
+        self.assertIn('not found', results['itk-redis']['error'])
+        self.assertTrue(results['itk-mojaloop-connector']['ok'])
+        self.assertTrue(results['itk-core-connector']['ok'])
+
+    def test_dependency_cycle(self):
+        service_manager = self.create_service_manager([])
+        service_manager.service_dependencies = {'a': ['b'], 'b': ['a']}
+
+        with self.assertRaises(ValueError):
+            service_manager.restart_order(['a', 'b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
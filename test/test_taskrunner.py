@@ -0,0 +1,123 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import sys
+import time
+import unittest
+
+from itkconfigurator.servicemanager import ServiceManager
+from itkconfigurator.taskrunner import TaskRunner, ThreadOutputRouter
+
+
+class PrintingPki:
+    """
+    Stands in for a PKI backend, printing progress the way PkiTools does
+    """
+    instances = 0
+
+    def __init__(self):
+        PrintingPki.instances += 1
+        self.exited = False
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        print('Sealing vault...')
+        self.exited = True
+
+    def create_jws_keypair(self, key_name, private_key_path, public_key_path):
+        print('Creating new JWS keypair...')
+        sys.stdout.write('Writing keys ')
+        sys.stdout.write('to disk...\nDone')
+        return key_name
+
+    def create_client_mtls_artefacts(self, *args):
+        raise RuntimeError('vault said no')
+
+
+class RunningContainer:
+    def __init__(self, name):
+        self.name = name
+        self.attrs = {'State': {'Status': 'running'}}
+
+    def restart(self):
+        pass
+
+    def reload(self):
+        pass
+
+
+class StubDockerClient:
+    def __init__(self, containers):
+        self.containers = self
+        self.all_containers = containers
+
+    def list(self, all=False, filters=None):
+        return self.all_containers
+
+
+def create_stub_service_manager():
+    service_manager = ServiceManager.__new__(ServiceManager)
+    service_manager.dockerClient = StubDockerClient([RunningContainer(name) for name in ServiceManager.container_names])
+    return service_manager
+
+
+class TestTaskRunner(unittest.TestCase):
+    def setUp(self):
+        self.original_stdout = sys.stdout
+        PrintingPki.instances = 0
+        self.runner = TaskRunner(pki_factory=PrintingPki, service_manager_factory=create_stub_service_manager,
+                                 pki_idle_timeout_secs=0.2)
+
+    def tearDown(self):
+        self.runner.close()
+        sys.stdout = self.original_stdout
+
+    def test_output_streams_to_task(self):
+        task = self.runner.run_pki('create_jws_keypair', 'key', 'private.pem', 'public.pem')
+
+        self.assertEqual(['Creating new JWS keypair...', 'Writing keys to disk...', 'Done'], list(task.iter_output()))
+        self.assertTrue(task.ok)
+        self.assertEqual('key', task.result)
+        self.assertIsInstance(sys.stdout, ThreadOutputRouter)
+
+    def test_failure_and_backend_reuse(self):
+        failed = self.runner.run_pki('create_client_mtls_artefacts', 'dfsp')
+        self.assertFalse(failed.wait())
+        self.assertEqual(['RuntimeError: vault said no'], list(failed.iter_output()))
+
+        self.assertTrue(self.runner.run_pki('create_jws_keypair', 'key', 'a', 'b').wait())
+        self.assertEqual(1, PrintingPki.instances)
+
+    def test_service_restart_output_streams_to_task(self):
+        # each service restarts on its own thread; what those threads print belongs to the task too
+        task = self.runner.run_services('restart', ['itk-redis', 'itk-core-connector'])
+        output = list(task.iter_output())
+
+        self.assertTrue(task.ok)
+        for name in ('itk-redis', 'itk-core-connector'):
+            self.assertIn('Restarting container {}'.format(name), output)
+            self.assertTrue(any(line.startswith('Container {} restarted in'.format(name)) for line in output))
+
+    def test_backend_closed_when_idle(self):
+        self.runner.run_pki('create_jws_keypair', 'key', 'a', 'b').wait()
+        pki = self.runner.pki
+
+        deadline = time.monotonic() + 5
+        while self.runner.pki is not None and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        self.assertIsNone(self.runner.pki)
+        self.assertTrue(pki.exited)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+##########################################################################
+#  (C) Copyright Mojaloop Foundation. 2024 - All rights reserved.        #
+#                                                                        #
+#  This file is made available under the terms of the license agreement  #
+#  specified in the corresponding source code repository.                #
+#                                                                        #
+#  ORIGINAL AUTHOR:                                                      #
+#       James Bush - jbush@mojaloop.io                                   #
+#                                                                        #
+#  CONTRIBUTORS:                                                         #
+#       James Bush - jbush@mojaloop.io                                   #
+##########################################################################
+
+import json
+import socket
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from itkconfigurator.vaultreadiness import StartupTimings, wait_for_container_running, wait_for_port_open, \
+    wait_for_vault_ready
+
+
+class FakeContainer:
+    def __init__(self, status):
+        self.status = status
+
+    def reload(self):
+        pass
+
+
+class FakeEventStream:
+    def __init__(self, events):
+        self.events = events
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeDockerClient:
+    def __init__(self, status, events):
+        self.container = FakeContainer(status)
+        self.stream = FakeEventStream(events)
+        self.containers = self
+
+    def get(self, name):
+        return self.container
+
+    def events(self, **kwargs):
+        return self.stream
+
+
+class HealthHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps({'initialized': True, 'sealed': True}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestVaultReadiness(unittest.TestCase):
+    def test_container_start_event(self):
+        docker_client = FakeDockerClient('created', [{'status': 'start'}])
+
+        self.assertTrue(wait_for_container_running(docker_client, 'vault', time.time() + 1))
+        self.assertTrue(docker_client.stream.closed)
+
+    def test_container_never_starts(self):
+        docker_client = FakeDockerClient('created', [])
+        self.assertFalse(wait_for_container_running(docker_client, 'vault', time.time() + 1))
+
+    def test_port_probe_times_out_quickly(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+
+        start = time.perf_counter()
+        self.assertFalse(wait_for_port_open('127.0.0.1', port, time.time() + 0.2))
+        self.assertLess(time.perf_counter() - start, 1)
+
+    def test_wait_for_vault_ready(self):
+        server = HTTPServer(('127.0.0.1', 0), HealthHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        timings = StartupTimings()
+
+        try:
+            health = wait_for_vault_ready(FakeDockerClient('running', []), 'vault',
+                                          'http://127.0.0.1:{}'.format(server.server_address[1]), 5, timings)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual({'initialized': True, 'sealed': True}, health)
+        self.assertEqual(['container_running', 'port_open', 'api_ready'],
+                         [p['phase'] for p in timings.as_dict()['phases']])
+
+
+if __name__ == '__main__':
+    unittest.main()